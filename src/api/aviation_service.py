@@ -1,19 +1,100 @@
+import contextvars
 import os
+import threading
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterator, List, Optional
+from api.cache import ResponseCache
+from api.metrics import metrics
+from api.http_client import (
+    RETRY_STATUSES, CircuitBreaker, backoff_delay, build_session, retry_after_seconds
+)
+
+_DEFAULT = object()
 
 class AviationService:
-    def __init__(self):
+    def __init__(self, cache=_DEFAULT, session: Optional[requests.Session] = None):
         # Get API key from environment variables
         self.api_key = os.getenv('AVIATION_API_KEY')
-        self.base_url = "http://api.aviationstack.com/v1"
+        self.base_url = os.getenv('AVIATION_BASE_URL', "http://api.aviationstack.com/v1")
+        # Response cache shared by all calls (pass None to disable)
+        self.cache = ResponseCache.from_env() if cache is _DEFAULT else cache
+        # Keep-alive connection pool, timeouts and retry policy
+        self.session = session or build_session(int(os.getenv('AVIATION_POOL_SIZE', '10')))
+        self.timeout = (
+            float(os.getenv('AVIATION_CONNECT_TIMEOUT', '3.05')),
+            float(os.getenv('AVIATION_READ_TIMEOUT', '10'))
+        )
+        self.max_retries = int(os.getenv('AVIATION_MAX_RETRIES', '3'))
+        self.backoff_base = float(os.getenv('AVIATION_BACKOFF_BASE', '0.5'))
+        self.backoff_max = float(os.getenv('AVIATION_BACKOFF_MAX', '30'))
+        self._local = threading.local()
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv('AVIATION_BREAKER_THRESHOLD', '5')),
+            reset_timeout=float(os.getenv('AVIATION_BREAKER_RESET', '30'))
+        )
+        # Called once per upstream response (cache hits never reach it), e.g. to count quota use
+        self.on_call: Optional[Callable[[], None]] = None
         
     def _make_request(self, endpoint: str, params: Optional[Dict] = None) -> Dict:
-        """Make a request to the Aviation Stack API"""
+        """Make a request to the Aviation Stack API, served from cache when possible"""
+        # Timed per endpoint and outcome: the HTTP status, 'cached' or 'error' (no response at all)
+        self._local.status = 'cached'
+        start = time.perf_counter()
+        try:
+            if self.cache is None:
+                return self._fetch(endpoint, params)
+            return self.cache.get_or_fetch(endpoint, params, lambda: self._fetch(endpoint, params))
+        finally:
+            metrics.record_upstream(endpoint, self._local.status, time.perf_counter() - start)
+
+    def _send(self, url: str, params: Dict) -> requests.Response:
+        """GET with jittered exponential backoff on 429/5xx and connection errors"""
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max))
+                attempt += 1
+                continue
+            except BaseException:
+                # Any other error must still settle the call, or a half-open probe would stay claimed forever
+                self.breaker.record_failure()
+                raise
+
+            retry = response.status_code in RETRY_STATUSES
+            # Rate limiting means the upstream is alive, only 5xx trips the breaker
+            if retry and response.status_code != 429:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            if self.on_call:
+                self.on_call()
+            if not retry:
+                return response
+            if attempt >= self.max_retries:
+                return response
+            delay = retry_after_seconds(response)
+            if delay is None:
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+            elif delay > self.backoff_max:
+                return response
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def _fetch(self, endpoint: str, params: Optional[Dict] = None) -> Dict:
+        """Call the Aviation Stack API directly"""
         try:
             url = f"{self.base_url}/{endpoint}"
-            params = params or {}
+            params = dict(params or {})
             
             # Make sure we have an API key
             if not self.api_key:
@@ -22,7 +103,9 @@ class AviationService:
             params['access_key'] = self.api_key
             
             # Make the API call
-            response = requests.get(url, params=params)
+            self._local.status = 'error'
+            response = self._send(url, params)
+            self._local.status = response.status_code
             
             # Handle common API errors
             if response.status_code == 401:
@@ -46,6 +129,62 @@ class AviationService:
         except Exception as e:
             raise ValueError(f"Unexpected error: {str(e)}")
     
+    def iter_pages(self, endpoint: str, params: Optional[Dict] = None,
+                   page_size: int = 100, max_records: Optional[int] = None,
+                   max_pages: Optional[int] = None, prefetch: bool = False,
+                   wants_more: Optional[Callable[[Dict], bool]] = None) -> Iterator[Dict]:
+        """Lazily walk offset/limit pages of an endpoint, optionally fetching the next page ahead.
+
+        Stops after `max_pages` pages or at the first page for which `wants_more` (called with
+        every page before it is yielded) returns False, so no call is spent on a page nobody reads.
+        """
+        params = dict(params or {})
+        offset = int(params.pop('offset', 0))
+        fetched = 0
+
+        def fetch(offset):
+            size = page_size if max_records is None else min(page_size, max_records - fetched)
+            return self._make_request(endpoint, {**params, 'limit': size, 'offset': offset})
+
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        pending = None
+        try:
+            page = fetch(offset)
+            pages = 1
+            while True:
+                data = page.get('data') or []
+                fetched += len(data)
+                pagination = page.get('pagination') or {}
+                total = pagination.get('total')
+                offset += len(data)
+                more = bool(data) and (total is None or offset < total) \
+                    and (max_records is None or fetched < max_records) \
+                    and (max_pages is None or pages < max_pages)
+                if wants_more is not None:
+                    more = wants_more(page) and more
+                # Start the next request before handing this page to the caller
+                if more and executor:
+                    # Copy the context so the prefetch counts towards the current request's profile
+                    pending = executor.submit(contextvars.copy_context().run, fetch, offset)
+                yield page
+                if not more:
+                    return
+                page = pending.result() if pending else fetch(offset)
+                pending = None
+                pages += 1
+        finally:
+            # The caller stopped early (closed the generator): drop the prefetch unless already sent
+            if pending:
+                pending.cancel()
+            if executor:
+                executor.shutdown(wait=False)
+
+    def iter_flights(self, params: Optional[Dict] = None, max_records: Optional[int] = None,
+                     prefetch: bool = True) -> Iterator[Dict]:
+        """Yield flight records one at a time across as many pages as needed"""
+        for page in self.iter_pages('flights', params, max_records=max_records, prefetch=prefetch):
+            yield from page.get('data') or []
+
     def get_live_flights(self, limit: int = 100) -> List[Dict]:
         """Get live flight data"""
         return self._make_request('flights', {'limit': limit})
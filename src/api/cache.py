@@ -0,0 +1,240 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds a response is fresh, per Aviation Stack endpoint
+DEFAULT_TTLS = {
+    'flights': 30,
+    'schedules': 60,
+    'routes': 6 * 3600
+}
+
+
+class MemoryCacheBackend:
+    """Per-process LRU store bounded by entry count and total bytes"""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, Tuple[bytes, float]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: bytes, stored_at: float) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0])
+            self._entries[key] = (value, stored_at)
+            self._bytes += len(value)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+class SQLiteCacheBackend:
+    """LRU store in a local SQLite file so every gunicorn worker on the host shares hits"""
+
+    def __init__(self, path: str, max_entries: int = 4096, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._conn().execute(
+            'CREATE TABLE IF NOT EXISTS response_cache ('
+            ' key TEXT PRIMARY KEY, value BLOB NOT NULL, stored_at REAL NOT NULL,'
+            ' accessed_at REAL NOT NULL, size INTEGER NOT NULL)'
+        )
+        self._conn().execute(
+            'CREATE INDEX IF NOT EXISTS idx_response_cache_lru ON response_cache(accessed_at)'
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        conn = self._conn()
+        row = conn.execute(
+            'SELECT value, stored_at FROM response_cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE response_cache SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        return bytes(row[0]), row[1]
+
+    def set(self, key: str, value: bytes, stored_at: float) -> None:
+        if len(value) > self.max_bytes:
+            return
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO response_cache (key, value, stored_at, accessed_at, size)'
+            ' VALUES (?, ?, ?, ?, ?)',
+            (key, sqlite3.Binary(value), stored_at, time.time(), len(value))
+        )
+        count, total = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM response_cache'
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # Evict least recently used entries until both limits hold
+        rows = conn.execute('SELECT key, size FROM response_cache ORDER BY accessed_at').fetchall()
+        evict = []
+        for old_key, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            evict.append((old_key,))
+            count -= 1
+            total -= size
+        conn.executemany('DELETE FROM response_cache WHERE key = ?', evict)
+
+    def clear(self) -> None:
+        self._conn().execute('DELETE FROM response_cache')
+
+
+class _InflightCall:
+    """Upstream call shared by every concurrent miss on the same key"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Optional[bytes] = None
+        self.error: Optional[Exception] = None
+
+
+class ResponseCache:
+    """TTL cache with stale-while-revalidate and request coalescing over a pluggable backend"""
+
+    def __init__(self, backend, ttls: Optional[Dict[str, float]] = None,
+                 default_ttl: float = 60, stale_ttl: float = 300):
+        self.backend = backend
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl
+        self._inflight: Dict[str, '_InflightCall'] = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'coalesced': 0, 'refreshes': 0}
+
+    @classmethod
+    def from_env(cls):
+        """Build a cache from AVIATION_CACHE* environment variables (None when disabled)"""
+        kind = os.getenv('AVIATION_CACHE', 'memory').lower()
+        if kind in ('', 'off', 'none', '0'):
+            return None
+        if kind == 'sqlite':
+            backend = SQLiteCacheBackend(os.getenv('AVIATION_CACHE_PATH', '/tmp/aviation_cache.sqlite3'))
+        else:
+            backend = MemoryCacheBackend()
+        return cls(backend, stale_ttl=float(os.getenv('AVIATION_CACHE_STALE_TTL', '300')))
+
+    @staticmethod
+    def make_key(endpoint: str, params: Optional[Dict]) -> str:
+        """Endpoint plus sorted params, never including the API key"""
+        items = sorted(
+            (k, str(v)) for k, v in (params or {}).items()
+            if k != 'access_key' and v is not None
+        )
+        return endpoint + '?' + '&'.join(f"{k}={v}" for k, v in items)
+
+    def ttl_for(self, endpoint: str) -> float:
+        return self.ttls.get(endpoint, self.default_ttl)
+
+    def get_or_fetch(self, endpoint: str, params: Optional[Dict], fetch: Callable[[], Dict]) -> Dict:
+        key = self.make_key(endpoint, params)
+        entry = self.backend.get(key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.time() - stored_at
+            ttl = self.ttl_for(endpoint)
+            if age < ttl:
+                self._count('hits')
+                return json.loads(value)
+            if age < ttl + self.stale_ttl:
+                self._count('stale_hits')
+                self._refresh_in_background(key, fetch)
+                return json.loads(value)
+        self._count('misses')
+        return self._fetch_coalesced(key, fetch)
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _fetch_coalesced(self, key: str, fetch: Callable[[], Dict]) -> Dict:
+        """Only one caller per key goes upstream, the rest wait for its result"""
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _InflightCall()
+            else:
+                self.stats['coalesced'] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return json.loads(call.value)
+        return self._lead(key, call, fetch)
+
+    def _lead(self, key: str, call: '_InflightCall', fetch: Callable[[], Dict]) -> Dict:
+        """Make the upstream call registered as `call` and hand its result to any waiters"""
+        try:
+            data = fetch()
+            call.value = json.dumps(data, separators=(',', ':')).encode()
+            self.backend.set(key, call.value, time.time())
+            return data
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
+
+    def _refresh_in_background(self, key: str, fetch: Callable[[], Dict]) -> None:
+        # Check and register in one critical section, so concurrent stale hits start one refresh
+        with self._lock:
+            if key in self._inflight:
+                return
+            call = self._inflight[key] = _InflightCall()
+            self.stats['refreshes'] += 1
+
+        def refresh():
+            try:
+                self._lead(key, call, fetch)
+            except Exception as e:
+                logger.warning("Background refresh of %s failed: %s", key, e)
+
+        try:
+            threading.Thread(target=refresh, name='cache-refresh', daemon=True).start()
+        except RuntimeError as e:  # no thread to spare: release the key so a later hit can refresh
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
+            logger.warning("Background refresh of %s not started: %s", key, e)
@@ -0,0 +1,78 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+from api.aviation_service import AviationService
+
+
+class RateLimiter:
+    """Token bucket shared by every caller in the process"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return how long the caller must wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self) -> None:
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class FanOutAviationService:
+    """Batch lookups that fan out over a thread pool of blocking AviationService calls.
+
+    Not an async client: the caller blocks until every key is answered, while at most
+    `concurrency` calls (per process) are in flight. The calls go through the sync client,
+    so they share its response cache, keep-alive pool, retries and circuit breaker.
+    """
+
+    def __init__(self, service: Optional[AviationService] = None,
+                 concurrency: Optional[int] = None, rate: Optional[float] = None):
+        self.service = service or AviationService()
+        self.concurrency = concurrency or int(os.getenv('AVIATION_CONCURRENCY', '8'))
+        # Requests per second allowed by the API plan
+        rate = rate or float(os.getenv('AVIATION_RATE_LIMIT', '5'))
+        self.limiter = RateLimiter(rate, burst=self.concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency,
+                                            thread_name_prefix='aviation-fan-out')
+
+    def _make_request(self, endpoint: str, params: Optional[Dict] = None) -> Dict:
+        """Rate-limited request (runs on a pool thread); errors are returned in the result"""
+        self.limiter.acquire()
+        try:
+            return self.service._make_request(endpoint, params)
+        except ValueError as e:
+            return {'error': str(e)}
+
+    def _fan_out(self, endpoint: str, param: str, keys: Iterable[str]) -> Dict[str, Dict]:
+        """One request per distinct key, keyed by it"""
+        keys = list(dict.fromkeys(keys))
+        # Pool threads do not inherit contextvars; copy them for the request profile
+        futures = [self._executor.submit(contextvars.copy_context().run, self._make_request, endpoint, {param: key})
+                   for key in keys]
+        return {key: future.result() for key, future in zip(keys, futures)}
+
+    def get_airport_schedules_many(self, iata_codes: Iterable[str]) -> Dict[str, Dict]:
+        """Schedules for several airports, keyed by IATA code"""
+        return self._fan_out('schedules', 'dep_iata', iata_codes)
+
+    def get_airline_routes_many(self, airline_codes: Iterable[str]) -> Dict[str, Dict]:
+        """Routes for several airlines, keyed by airline code"""
+        return self._fan_out('routes', 'airline_code', airline_codes)
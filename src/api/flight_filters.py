@@ -0,0 +1,122 @@
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Query arg -> Aviation Stack /flights parameter, applied upstream
+PUSHDOWN_PARAMS = {
+    'airline': 'airline_iata',
+    'departure': 'dep_iata',
+    'arrival': 'arr_iata',
+    'status': 'flight_status',
+    'min_delay': 'min_delay_dep'
+}
+
+
+class FlightFilter:
+    """Live flight filter split into upstream params and a residual per-record check"""
+
+    def __init__(self, airline: Optional[str] = None, departure: Optional[str] = None,
+                 arrival: Optional[str] = None, status: Optional[str] = None,
+                 country: Optional[str] = None, min_delay: Optional[int] = None,
+                 airport_data: Optional[Dict] = None):
+        self.airline = airline
+        self.departure = departure
+        self.arrival = arrival
+        self.status = status.lower() if status else None
+        self.country = country
+        self.min_delay = min_delay
+        self.airport_data = airport_data or {}
+
+    @classmethod
+    def from_args(cls, args, airport_data: Optional[Dict] = None):
+        """Build a filter from request query args"""
+        return cls(
+            airline=args.get('airline'),
+            departure=args.get('departure') or args.get('dep_iata'),
+            arrival=args.get('arrival') or args.get('arr_iata'),
+            status=args.get('status'),
+            country=args.get('country'),
+            min_delay=args.get('min_delay', type=int),
+            airport_data=airport_data
+        )
+
+    def api_params(self) -> Dict:
+        """Filters Aviation Stack can apply itself"""
+        values = {
+            'airline': self.airline,
+            'departure': self.departure,
+            'arrival': self.arrival,
+            'status': self.status,
+            'min_delay': self.min_delay
+        }
+        return {PUSHDOWN_PARAMS[k]: v for k, v in values.items() if v is not None}
+
+    @property
+    def has_residual(self) -> bool:
+        """True when some records returned upstream may still have to be dropped"""
+        return self.country is not None
+
+    def matches(self, record: Dict) -> bool:
+        """Re-check every filter locally (cheap, and guards against upstream ignoring a param)"""
+        dep = record.get('departure') or {}
+        arr = record.get('arrival') or {}
+        if self.airline and (record.get('airline') or {}).get('iata') != self.airline:
+            return False
+        if self.departure and dep.get('iata') != self.departure:
+            return False
+        if self.arrival and arr.get('iata') != self.arrival:
+            return False
+        if self.status and (record.get('flight_status') or '').lower() != self.status:
+            return False
+        if self.min_delay is not None and (dep.get('delay') or 0) < self.min_delay:
+            return False
+        if self.country:
+            countries = {
+                self.airport_data.get(info.get('iata'), {}).get('country')
+                for info in (dep, arr)
+            }
+            if self.country not in countries:
+                return False
+        return True
+
+    def apply(self, records: Iterable[Dict], limit: Optional[int] = None) -> Iterator[Dict]:
+        """Yield matching records, stopping as soon as `limit` have been found"""
+        found = 0
+        for record in records:
+            if limit is not None and found >= limit:
+                return
+            if self.matches(record):
+                found += 1
+                yield record
+
+
+def parse_fields(value: Optional[str]) -> Optional[List[List[str]]]:
+    """Parse `fields=flight.number,departure.iata` into key paths"""
+    if not value:
+        return None
+    return [f.strip().split('.') for f in value.split(',') if f.strip()]
+
+
+def project(record: Dict, fields: Optional[List[List[str]]]) -> Dict:
+    """Keep only the requested (possibly nested) keys of a record"""
+    if not fields:
+        return record
+    result: Dict = {}
+    for path in fields:
+        value = record
+        for key in path:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            target = result
+            for key in path[:-1]:
+                target = target.setdefault(key, {})
+            target[path[-1]] = value
+    return result
+
+
+def parse_codes(value: Optional[str], max_codes: int = 50) -> List[str]:
+    """Split a comma separated code list from a query string"""
+    codes = [c.strip().upper() for c in (value or '').split(',') if c.strip()]
+    if len(codes) > max_codes:
+        raise ValueError(f"At most {max_codes} codes per request")
+    return codes
@@ -0,0 +1,32 @@
+import threading
+from typing import Callable
+
+
+class Lazy:
+    """Proxy that builds its target with `factory` on first attribute access.
+
+    Lets create_app wire up services whose modules are slow to import (requests,
+    numpy) without paying for them on a cold start that never uses them.
+    """
+
+    def __init__(self, factory: Callable[[], object]):
+        self._factory = factory
+        self._target = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        """The target, built on the first call (a factory may return None, e.g. an optional subsystem)"""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._target = self._factory()
+                    self._loaded = True
+        return self._target
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
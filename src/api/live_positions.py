@@ -0,0 +1,106 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from database.geo_index import GeoGrid
+
+logger = logging.getLogger(__name__)
+
+
+def _position(record: Dict) -> Optional[Tuple[float, float]]:
+    live = record.get('live') or {}
+    lat, lon = live.get('latitude'), live.get('longitude')
+    if lat is None or lon is None:
+        return None
+    return float(lat), float(lon)
+
+
+def _key(record: Dict) -> Optional[str]:
+    flight = record.get('flight') or {}
+    return flight.get('iata') or flight.get('icao') or flight.get('number')
+
+
+class LivePositionIndex:
+    """Spatial index of the latest position of every airborne flight seen upstream.
+
+    Fed with every live page the API fetches; entries older than `ttl` seconds
+    are ignored and purged. Only a complete, unfiltered sweep of upstream makes the
+    index fresh again; `refill` runs one in the background when it is stale, so
+    readers never wait on upstream.
+    """
+
+    def __init__(self, ttl: float = 120.0, cell_degrees: float = 1.0):
+        self.ttl = ttl
+        self.grid = GeoGrid(cell_degrees)
+        self.refreshed_at = 0.0
+        self._refill_started = -float('inf')
+        self._refilling = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(ttl=float(os.getenv('LIVE_POSITION_TTL', '120')))
+
+    @property
+    def stale(self) -> bool:
+        return time.monotonic() - self.refreshed_at > self.ttl
+
+    def update(self, records: Iterable[Dict]) -> int:
+        """Index records carrying a live position"""
+        now = time.monotonic()
+        indexed = 0
+        with self._lock:
+            for record in records:
+                key, position = _key(record), _position(record)
+                if key and position:
+                    self.grid.insert(key, position[0], position[1], (now, record))
+                    indexed += 1
+        return indexed
+
+    def refreshed(self) -> None:
+        """Mark a complete, unfiltered sweep of upstream as done and drop positions older than `ttl`"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for cell in self.grid.cells.values()
+                       for key, (_, _, (seen, _)) in cell.items() if now - seen > self.ttl]
+            for key in expired:
+                self.grid.remove(key)
+            self.refreshed_at = now
+
+    def refill(self, sweep: Callable[[], bool]) -> bool:
+        """Start `sweep` in a background thread when the index is stale, at most once per `ttl`.
+
+        `sweep` feeds pages through `update` and returns whether it covered every live
+        flight; only then is the index marked fresh. Returns whether a refill started.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._refilling or now - self.refreshed_at <= self.ttl or now - self._refill_started <= self.ttl:
+                return False
+            self._refilling = True
+            self._refill_started = now
+
+        def run():
+            try:
+                if sweep():
+                    self.refreshed()
+            except Exception as e:
+                logger.warning("Refilling live positions failed: %s", e)
+            finally:
+                with self._lock:
+                    self._refilling = False
+
+        threading.Thread(target=run, name='live-positions-refill', daemon=True).start()
+        return True
+
+    def in_bbox(self, bbox: Tuple[float, float, float, float]) -> List[Dict]:
+        """Live flight records inside the box, skipping positions older than `ttl`"""
+        now = time.monotonic()
+        with self._lock:
+            hits = self.grid.in_bbox(*bbox)
+        return [record for _, _, _, (seen, record) in hits if now - seen <= self.ttl]
+
+    def __len__(self):
+        return len(self.grid)
@@ -0,0 +1,197 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format(value: float) -> str:
+    return '+Inf' if value == float('inf') else repr(float(value))
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, rendered in the Prometheus text format"""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._series: Dict[Tuple, List[float]] = {}  # label values -> bucket counts + [sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for label_values, counts in series:
+            labels = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            prefix = f"{labels}," if labels else ''
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{_format(bound)}"}} {count}')
+            suffix = f"{{{labels}}}" if labels else ''
+            lines.append(f"{self.name}_sum{suffix} {counts[-1]!r}")
+            lines.append(f"{self.name}_count{suffix} {counts[len(self.buckets) - 1]}")
+        return lines
+
+
+class RequestProfile:
+    """Where one request spent its time; shared with the threads it fans out to"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_seconds = 0.0
+        self.upstream_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.query_count = 0
+        self.upstream_calls = 0
+        self._lock = threading.Lock()
+
+    def add_query(self, seconds: float) -> None:
+        with self._lock:
+            self.db_seconds += seconds
+            self.query_count += 1
+
+    def add_upstream(self, seconds: float) -> None:
+        with self._lock:
+            self.upstream_seconds += seconds
+            self.upstream_calls += 1
+
+    def add_serialize(self, seconds: float) -> None:
+        with self._lock:
+            self.serialize_seconds += seconds
+
+    def breakdown(self) -> Dict:
+        """Milliseconds per component; upstream_ms sums parallel calls, so it can exceed total_ms"""
+        return {
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'db_ms': round(self.db_seconds * 1000, 2),
+            'upstream_ms': round(self.upstream_seconds * 1000, 2),
+            'serialize_ms': round(self.serialize_seconds * 1000, 2),
+            'query_count': self.query_count,
+            'upstream_calls': self.upstream_calls
+        }
+
+
+# Profile of the request being served; executors that fan out copy the context so their work is counted too
+current_profile: contextvars.ContextVar = contextvars.ContextVar('current_profile', default=None)
+
+
+class Metrics:
+    """Process-wide request, SQL, upstream and serialization metrics for /metrics and X-Profile"""
+
+    def __init__(self):
+        self.requests = Histogram('http_request_duration_seconds', 'Latency of handled requests',
+                                  ('route', 'method', 'status'))
+        self.request_statements = Histogram('http_request_sql_statements', 'SQL statements issued per request',
+                                            ('route',), STATEMENT_BUCKETS)
+        self.statements = Histogram('sql_statement_duration_seconds', 'Latency of SQL statements')
+        self.upstream = Histogram('upstream_request_duration_seconds', 'Aviation Stack calls by endpoint and status',
+                                  ('endpoint', 'status'))
+        self.serialize = Histogram('json_serialize_duration_seconds', 'Time spent encoding JSON responses')
+        self._instrumented = False
+
+    def instrument_sqlalchemy(self) -> None:
+        """Time every statement of every engine (idempotent)"""
+        if self._instrumented:
+            return
+        self._instrumented = True
+
+        @event.listens_for(Engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+        @event.listens_for(Engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            self.record_statement(time.perf_counter() - conn.info['metrics_query_start'].pop())
+
+        @event.listens_for(Engine, 'handle_error')
+        def handle_error(context):
+            starts = context.connection.info.get('metrics_query_start') if context.connection else None
+            if starts:
+                self.record_statement(time.perf_counter() - starts.pop())
+
+    def record_statement(self, seconds: float) -> None:
+        self.statements.observe(seconds)
+        profile = current_profile.get()
+        if profile is not None:
+            profile.add_query(seconds)
+
+    def record_upstream(self, endpoint: str, status, seconds: float) -> None:
+        self.upstream.observe(seconds, endpoint, str(status))
+        profile = current_profile.get()
+        if profile is not None:
+            profile.add_upstream(seconds)
+
+    @contextmanager
+    def serializing(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.serialize.observe(elapsed)
+            profile = current_profile.get()
+            if profile is not None:
+                profile.add_serialize(elapsed)
+
+    def record_request(self, profile: RequestProfile, route: str, method: str, status: int) -> None:
+        self.requests.observe(time.perf_counter() - profile.started, route, method, str(status))
+        self.request_statements.observe(profile.query_count, route)
+
+    def render(self) -> str:
+        lines = []
+        for histogram in (self.requests, self.request_statements, self.statements, self.upstream, self.serialize):
+            lines += histogram.render()
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def instrument_json(app) -> None:
+    """Count the time jsonify spends encoding towards serialize_ms"""
+    try:
+        from flask.json.provider import DefaultJSONProvider
+    except ImportError:  # Flask < 2.2: jsonify encodes through app.json_encoder
+        from flask.json import JSONEncoder
+
+        class TimedJSONEncoder(app.json_encoder or JSONEncoder):
+            def encode(self, o):
+                with metrics.serializing():
+                    return super().encode(o)
+
+        app.json_encoder = TimedJSONEncoder
+        return
+
+    class TimedJSONProvider(type(app.json) if isinstance(app.json, DefaultJSONProvider) else DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            with metrics.serializing():
+                return super().dumps(obj, **kwargs)
+
+    provider = TimedJSONProvider(app)
+    for option in ('sort_keys', 'compact', 'ensure_ascii', 'mimetype'):
+        if hasattr(app.json, option):
+            setattr(provider, option, getattr(app.json, option))
+    app.json = provider
@@ -0,0 +1,113 @@
+import gzip
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {'gzip': lambda body: gzip.compress(body, 6)}
+if brotli is not None:
+    COMPRESSORS['br'] = lambda body: brotli.compress(body, quality=5)
+
+
+class PayloadCache:
+    """Per-process LRU of serialized read responses keyed by ETag, with each compressed variant built once.
+
+    The ETag encodes the data version the body was built from, so an entry never
+    needs invalidating: new data means a new ETag, and old entries age out.
+    """
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 32 * 1024 * 1024, min_size: int = 1024,
+                 max_age: int = 5, static_max_age: int = 300, stale_while_revalidate: int = 30):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.min_size = min_size
+        self.max_age = max_age
+        self.static_max_age = static_max_age
+        self.stale_while_revalidate = stale_while_revalidate
+        self._entries: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.getenv('RESPONSE_CACHE_ENTRIES', '512')),
+            max_age=int(os.getenv('RESPONSE_MAX_AGE', '5')),
+            static_max_age=int(os.getenv('RESPONSE_STATIC_MAX_AGE', '300')),
+            stale_while_revalidate=int(os.getenv('RESPONSE_STALE_WHILE_REVALIDATE', '30'))
+        )
+
+    def encoding(self, accept_encodings) -> Optional[str]:
+        """Best compression the client accepts (werkzeug `request.accept_encodings`), None for identity"""
+        return accept_encodings.best_match(list(COMPRESSORS)) if accept_encodings else None
+
+    @staticmethod
+    def variant_etag(etag: str, encoding: Optional[str]) -> str:
+        """Strong ETag of one encoding of the body: byte-different variants must not share a tag"""
+        return f"{etag}-{encoding}" if encoding else etag
+
+    def variant_etags(self, etag: str) -> List[str]:
+        """Tags of every encoding of the body a client may already hold"""
+        return [etag, *(self.variant_etag(etag, encoding) for encoding in COMPRESSORS)]
+
+    def cache_control(self, max_age: int) -> str:
+        # s-maxage lets a CDN (Vercel's edge) absorb polling; revalidation is a cheap 304
+        return (f"public, max-age={max_age}, s-maxage={max_age}, "
+                f"stale-while-revalidate={self.stale_while_revalidate}")
+
+    def fetch(self, etag: str, encoding: Optional[str],
+              load: Callable[[], Tuple[bytes, Optional[str]]]) -> Tuple[bytes, Optional[str], Optional[str]]:
+        """(body, applied encoding, next cursor) for `etag`, calling `load` for (body, next cursor) on a miss"""
+        with self._lock:
+            entry = self._entries.get(etag)
+            if entry is not None:
+                self._entries.move_to_end(etag)
+                self.stats['hits'] += 1
+            else:
+                self.stats['misses'] += 1
+        if entry is None:
+            body, cursor = load()
+            entry = {'identity': body, 'cursor': cursor}
+            self._store(etag, entry, len(body))
+        identity = entry['identity']
+        if encoding is None or len(identity) < self.min_size:
+            return identity, None, entry['cursor']
+        compressed = entry.get(encoding)
+        if compressed is None:
+            compressed = COMPRESSORS[encoding](identity)
+            with self._lock:
+                if self._entries.get(etag) is entry and encoding not in entry:
+                    entry[encoding] = compressed
+                    self._bytes += len(compressed)
+                    self._evict()
+        return compressed, encoding, entry['cursor']
+
+    def _store(self, etag: str, entry: Dict, size: int) -> None:
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(etag, None)
+            if old is not None:
+                self._bytes -= self._size(old)
+            self._entries[etag] = entry
+            self._bytes += size
+            self._evict()
+
+    @staticmethod
+    def _size(entry: Dict) -> int:
+        return sum(len(v) for k, v in entry.items() if k != 'cursor')
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= self._size(evicted)
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, **self.stats}
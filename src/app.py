@@ -1,134 +1,123 @@
-from flask import Flask, jsonify, request, render_template
+from flask import Flask, Response, g, jsonify, request, render_template, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
-from database.models import db, Airport, Airline, Flight, FlightStatus, FlightStatusUpdate
-from api.aviation_service import AviationService
+from database.models import db, Airport, Airline, Flight, FlightHistorySummary, FlightStatus, FlightStatusUpdate
+from database.ingest import fingerprint_cache, store_flight_batch
+from database.write_queue import WriteBehindQueue
+from database.pagination import MAX_PAGE_SIZE, InvalidCursor, decode_cursor, encode_cursor, keyset_page, page_size
+from database.rollups import airline_names, query_delay_stats, rebuild_delay_rollups
+from database.sketches import describe, parse_percentiles, query_delay_sketches, rebuild_delay_sketches
+from database.columnar import ColumnarSnapshot
+from database.airport_registry import EUROPEAN_COUNTRIES, LIST_FIELDS, airport_registry
+from database.airline_registry import airline_registry
+from database.change_feed import Subscription, change_feed
+from database.poller import PollScheduler, UsageCounter
+from database.retention import (ARCHIVE_FORMATS, archive_flights, compact_status_history,
+                                ensure_partitions, partition_tables, subtract_months)
+from api.flight_filters import FlightFilter, parse_codes, parse_fields, project
+from api.lazy import Lazy
+from api.metrics import RequestProfile, current_profile, instrument_json, metrics
+from api.live_positions import LivePositionIndex
+from api.response_cache import PayloadCache
+from database.geo_index import parse_bbox
+from sqlalchemy.orm import aliased
 from datetime import datetime, timedelta
+from contextlib import closing
+from functools import lru_cache
+import click
 import os
 import json
+import hashlib
+import queue
+import time
+from urllib.parse import urlencode
 
 # Load environment variables from .env file
 load_dotenv()
 
-def create_app():
-    app = Flask(__name__)
-    CORS(app)
-
-    # Load airport data from JSON file
-    with open(os.path.join(os.path.dirname(__file__), 'data/airports.json')) as f:
-        AIRPORT_DATA = json.load(f)
-
-    # Configure MySQL database connection with PyMySQL
-    app.config['SQLALCHEMY_DATABASE_URI'] = (
-        f"mysql+pymysql://{os.getenv('MYSQL_USER')}:{os.getenv('MYSQL_PASSWORD')}@"
-        f"{os.getenv('MYSQL_HOST')}/{os.getenv('MYSQL_DATABASE')}"
-    )
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    
-    # Initialize Flask extensions
-    db.init_app(app)
-    aviation_service = AviationService()
-
-    def init_flight_statuses():
-        """Initialize flight status values if they don't exist"""
-        statuses = ['SCHEDULED', 'ACTIVE', 'LANDED', 'CANCELLED', 'DIVERTED', 'DELAYED']
-        for status in statuses:
-            if not FlightStatus.query.get(status):
-                db.session.add(FlightStatus(status=status))
-        db.session.commit()
-
-    @app.route('/', methods=['GET'])
-    def read_root():
-        """Read Root - API Documentation"""
-        return render_template('docs.html'), 200, {'Content-Type': 'text/html'}
-
-    @app.route('/openapi.json', methods=['GET'])
-    def openapi_json():
-        """OpenAPI Specification"""
-        return jsonify({
-            "openapi": "3.1",
-            "paths": {
-                "/": {
-                    "get": {
-                        "summary": "Read Root",
-                        "description": "Read Root",
-                        "tags": ["default"],
-                        "parameters": [],
-                        "responses": {
-                            "200": {
-                                "description": "Successful Response",
-                                "content": {
-                                    "application/json": {
-                                        "schema": {"type": "string"}
-                                    }
-                                }
+# Served by /openapi.json; built once at import instead of on every request
+OPENAPI_SPEC = {
+    "openapi": "3.1",
+    "paths": {
+        "/": {
+            "get": {
+                "summary": "Read Root",
+                "description": "Read Root",
+                "tags": ["default"],
+                "parameters": [],
+                "responses": {
+                    "200": {
+                        "description": "Successful Response",
+                        "content": {
+                            "application/json": {
+                                "schema": {"type": "string"}
                             }
                         }
                     }
-                },
-                "/airports": {
-                    "get": {
-                        "summary": "Get Airports",
-                        "description": "Get list of all airports",
-                        "tags": ["default"],
-                        "parameters": [],
-                        "responses": {
-                            "200": {
-                                "description": "Successful Response",
-                                "content": {
-                                    "application/json": {
-                                        "schema": {"type": "string"}
-                                    }
-                                }
+                }
+            }
+        },
+        "/airports": {
+            "get": {
+                "summary": "Get Airports",
+                "description": "Get list of all airports",
+                "tags": ["default"],
+                "parameters": [],
+                "responses": {
+                    "200": {
+                        "description": "Successful Response",
+                        "content": {
+                            "application/json": {
+                                "schema": {"type": "string"}
                             }
                         }
                     }
-                },
-                "/airports/{airport_code}/flights": {
-                    "get": {
-                        "summary": "Get Airport Flights",
-                        "description": "Get all flights from a specific airport",
-                        "tags": ["default"],
-                        "parameters": [
-                            {
-                                "name": "airport_code",
-                                "in": "path",
-                                "required": true,
-                                "schema": {
-                                    "type": "string"
-                                },
-                                "description": "airport_code"
+                }
+            }
+        },
+        "/airports/{airport_code}/flights": {
+            "get": {
+                "summary": "Get Airport Flights",
+                "description": "Get all flights from a specific airport",
+                "tags": ["default"],
+                "parameters": [
+                    {
+                        "name": "airport_code",
+                        "in": "path",
+                        "required": True,
+                        "schema": {
+                            "type": "string"
+                        },
+                        "description": "airport_code"
+                    }
+                ],
+                "responses": {
+                    "200": {
+                        "description": "Successful Response",
+                        "content": {
+                            "application/json": {
+                                "schema": {"type": "string"}
                             }
-                        ],
-                        "responses": {
-                            "200": {
-                                "description": "Successful Response",
-                                "content": {
-                                    "application/json": {
-                                        "schema": {"type": "string"}
-                                    }
-                                }
-                            },
-                            "422": {
-                                "description": "Validation Error",
-                                "content": {
-                                    "application/json": {
-                                        "schema": {
-                                            "type": "object",
-                                            "properties": {
-                                                "detail": {
-                                                    "type": "array",
-                                                    "items": {
-                                                        "type": "object",
-                                                        "properties": {
-                                                            "loc": {
-                                                                "type": "array",
-                                                                "items": {}
-                                                            },
-                                                            "msg": {"type": "string"},
-                                                            "type": {"type": "string"}
-                                                        }
-                                                    }
+                        }
+                    },
+                    "422": {
+                        "description": "Validation Error",
+                        "content": {
+                            "application/json": {
+                                "schema": {
+                                    "type": "object",
+                                    "properties": {
+                                        "detail": {
+                                            "type": "array",
+                                            "items": {
+                                                "type": "object",
+                                                "properties": {
+                                                    "loc": {
+                                                        "type": "array",
+                                                        "items": {}
+                                                    },
+                                                    "msg": {"type": "string"},
+                                                    "type": {"type": "string"}
                                                 }
                                             }
                                         }
@@ -137,70 +126,70 @@ def create_app():
                             }
                         }
                     }
-                },
-                "/flights/delayed": {
-                    "get": {
-                        "summary": "Get Delayed Flight List",
-                        "description": "Get all flights delayed by more than 2 hours",
-                        "tags": ["default"],
-                        "parameters": [],
-                        "responses": {
-                            "200": {
-                                "description": "Successful Response",
-                                "content": {
-                                    "application/json": {
-                                        "schema": {"type": "string"}
-                                    }
-                                }
+                }
+            }
+        },
+        "/flights/delayed": {
+            "get": {
+                "summary": "Get Delayed Flight List",
+                "description": "Get all flights delayed by more than 2 hours",
+                "tags": ["default"],
+                "parameters": [],
+                "responses": {
+                    "200": {
+                        "description": "Successful Response",
+                        "content": {
+                            "application/json": {
+                                "schema": {"type": "string"}
                             }
                         }
                     }
-                },
-                "/flights/{flight_id}": {
-                    "get": {
-                        "summary": "Get Flight Details",
-                        "description": "Get details for a specific flight",
-                        "tags": ["default"],
-                        "parameters": [
-                            {
-                                "name": "flight_id",
-                                "in": "path",
-                                "required": true,
-                                "schema": {
-                                    "type": "integer"
-                                },
-                                "description": "flight_id"
+                }
+            }
+        },
+        "/flights/{flight_id}": {
+            "get": {
+                "summary": "Get Flight Details",
+                "description": "Get details for a specific flight",
+                "tags": ["default"],
+                "parameters": [
+                    {
+                        "name": "flight_id",
+                        "in": "path",
+                        "required": True,
+                        "schema": {
+                            "type": "integer"
+                        },
+                        "description": "flight_id"
+                    }
+                ],
+                "responses": {
+                    "200": {
+                        "description": "Successful Response",
+                        "content": {
+                            "application/json": {
+                                "schema": {"type": "string"}
                             }
-                        ],
-                        "responses": {
-                            "200": {
-                                "description": "Successful Response",
-                                "content": {
-                                    "application/json": {
-                                        "schema": {"type": "string"}
-                                    }
-                                }
-                            },
-                            "422": {
-                                "description": "Validation Error",
-                                "content": {
-                                    "application/json": {
-                                        "schema": {
-                                            "type": "object",
-                                            "properties": {
-                                                "detail": {
-                                                    "type": "array",
-                                                    "items": {
-                                                        "type": "object",
-                                                        "properties": {
-                                                            "loc": {
-                                                                "type": "array",
-                                                                "items": {}
-                                                            },
-                                                            "msg": {"type": "string"},
-                                                            "type": {"type": "string"}
-                                                        }
-                                                    }
+                        }
+                    },
+                    "422": {
+                        "description": "Validation Error",
+                        "content": {
+                            "application/json": {
+                                "schema": {
+                                    "type": "object",
+                                    "properties": {
+                                        "detail": {
+                                            "type": "array",
+                                            "items": {
+                                                "type": "object",
+                                                "properties": {
+                                                    "loc": {
+                                                        "type": "array",
+                                                        "items": {}
+                                                    },
+                                                    "msg": {"type": "string"},
+                                                    "type": {"type": "string"}
                                                 }
                                             }
                                         }
@@ -209,70 +198,70 @@ def create_app():
                             }
                         }
                     }
-                },
-                "/flights/active": {
-                    "get": {
-                        "summary": "Get Active Flight List",
-                        "description": "Get all currently active flights",
-                        "tags": ["default"],
-                        "parameters": [],
-                        "responses": {
-                            "200": {
-                                "description": "Successful Response",
-                                "content": {
-                                    "application/json": {
-                                        "schema": {"type": "string"}
-                                    }
-                                }
+                }
+            }
+        },
+        "/flights/active": {
+            "get": {
+                "summary": "Get Active Flight List",
+                "description": "Get all currently active flights",
+                "tags": ["default"],
+                "parameters": [],
+                "responses": {
+                    "200": {
+                        "description": "Successful Response",
+                        "content": {
+                            "application/json": {
+                                "schema": {"type": "string"}
                             }
                         }
                     }
-                },
-                "/flights/search/{flight_number}": {
-                    "get": {
-                        "summary": "Search Flight",
-                        "description": "Search for real-time flight information using Aviation Stack API",
-                        "tags": ["default"],
-                        "parameters": [
-                            {
-                                "name": "flight_number",
-                                "in": "path",
-                                "required": true,
-                                "schema": {
-                                    "type": "string"
-                                },
-                                "description": "flight_number"
+                }
+            }
+        },
+        "/flights/search/{flight_number}": {
+            "get": {
+                "summary": "Search Flight",
+                "description": "Search for real-time flight information using Aviation Stack API",
+                "tags": ["default"],
+                "parameters": [
+                    {
+                        "name": "flight_number",
+                        "in": "path",
+                        "required": True,
+                        "schema": {
+                            "type": "string"
+                        },
+                        "description": "flight_number"
+                    }
+                ],
+                "responses": {
+                    "200": {
+                        "description": "Successful Response",
+                        "content": {
+                            "application/json": {
+                                "schema": {"type": "string"}
                             }
-                        ],
-                        "responses": {
-                            "200": {
-                                "description": "Successful Response",
-                                "content": {
-                                    "application/json": {
-                                        "schema": {"type": "string"}
-                                    }
-                                }
-                            },
-                            "422": {
-                                "description": "Validation Error",
-                                "content": {
-                                    "application/json": {
-                                        "schema": {
-                                            "type": "object",
-                                            "properties": {
-                                                "detail": {
-                                                    "type": "array",
-                                                    "items": {
-                                                        "type": "object",
-                                                        "properties": {
-                                                            "loc": {
-                                                                "type": "array",
-                                                                "items": {}
-                                                            },
-                                                            "msg": {"type": "string"},
-                                                            "type": {"type": "string"}
-                                                        }
-                                                    }
+                        }
+                    },
+                    "422": {
+                        "description": "Validation Error",
+                        "content": {
+                            "application/json": {
+                                "schema": {
+                                    "type": "object",
+                                    "properties": {
+                                        "detail": {
+                                            "type": "array",
+                                            "items": {
+                                                "type": "object",
+                                                "properties": {
+                                                    "loc": {
+                                                        "type": "array",
+                                                        "items": {}
+                                                    },
+                                                    "msg": {"type": "string"},
+                                                    "type": {"type": "string"}
                                                 }
                                             }
                                         }
@@ -281,63 +270,63 @@ def create_app():
                             }
                         }
                     }
-                },
-                "/api/flights/live": {
-                    "get": {
-                        "summary": "Get Live Flights",
-                        "description": "Get live flight data with optional filtering",
-                        "tags": ["default"],
-                        "parameters": [
-                            {
-                                "name": "airline",
-                                "in": "query",
-                                "required": false,
-                                "schema": {
-                                    "type": "string"
-                                },
-                                "description": "Filter by airline IATA code"
-                            },
-                            {
-                                "name": "limit",
-                                "in": "query",
-                                "required": false,
+                }
+            }
+        },
+        "/api/flights/live": {
+            "get": {
+                "summary": "Get Live Flights",
+                "description": "Get live flight data with optional filtering",
+                "tags": ["default"],
+                "parameters": [
+                    {
+                        "name": "airline",
+                        "in": "query",
+                        "required": False,
+                        "schema": {
+                            "type": "string"
+                        },
+                        "description": "Filter by airline IATA code"
+                    },
+                    {
+                        "name": "limit",
+                        "in": "query",
+                        "required": False,
+                        "schema": {
+                            "type": "integer",
+                            "default": 100
+                        },
+                        "description": "Limit the number of results"
+                    }
+                ],
+                "responses": {
+                    "200": {
+                        "description": "Successful Response",
+                        "content": {
+                            "application/json": {
                                 "schema": {
-                                    "type": "integer",
-                                    "default": 100
-                                },
-                                "description": "Limit the number of results"
-                            }
-                        ],
-                        "responses": {
-                            "200": {
-                                "description": "Successful Response",
-                                "content": {
-                                    "application/json": {
-                                        "schema": {
-                                            "type": "object",
-                                            "properties": {
-                                                "data": {
-                                                    "type": "array",
-                                                    "items": {
-                                                        "type": "object"
-                                                    }
-                                                }
+                                    "type": "object",
+                                    "properties": {
+                                        "data": {
+                                            "type": "array",
+                                            "items": {
+                                                "type": "object"
                                             }
                                         }
                                     }
                                 }
-                            },
-                            "401": {
-                                "description": "Unauthorized - Invalid API key",
-                                "content": {
-                                    "application/json": {
-                                        "schema": {
-                                            "type": "object",
-                                            "properties": {
-                                                "error": {
-                                                    "type": "string"
-                                                }
-                                            }
+                            }
+                        }
+                    },
+                    "401": {
+                        "description": "Unauthorized - Invalid API key",
+                        "content": {
+                            "application/json": {
+                                "schema": {
+                                    "type": "object",
+                                    "properties": {
+                                        "error": {
+                                            "type": "string"
                                         }
                                     }
                                 }
@@ -345,30 +334,224 @@ def create_app():
                         }
                     }
                 }
-            },
-            "tags": [
-                {
-                    "name": "default",
-                    "description": "Default endpoints"
-                }
-            ],
-            "title": "EU Flight Monitor",
-            "version": "1.0.0"
-        })
+            }
+        }
+    },
+    "tags": [
+        {
+            "name": "default",
+            "description": "Default endpoints"
+        }
+    ],
+    "title": "EU Flight Monitor",
+    "version": "1.0.0"
+}
+
+
+@lru_cache(maxsize=None)
+def load_airport_data():
+    """Curated airport catalog from data/airports.json, parsed on first use"""
+    with open(os.path.join(os.path.dirname(__file__), 'data/airports.json')) as f:
+        return json.load(f)
+
+
+def aviation_services():
+    """Aviation Stack client and its batch fan-out (imported here: requests is slow to import)"""
+    from api.aviation_service import AviationService
+    from api.fan_out_service import FanOutAviationService
+    service = AviationService()
+    return service, FanOutAviationService(service)
+
+
+def create_app(bootstrap=None):
+    """Build the app without touching the database: schema and seed data come from `flask bootstrap`.
+
+    `bootstrap=True` (or BOOTSTRAP_ON_START=1) runs the bootstrap at startup instead,
+    for local runs against a fresh database.
+    """
+    app = Flask(__name__)
+    CORS(app)
+
+    # Airport catalog is read by the registry on its first snapshot
+    airport_registry.configure(load_airport_data)
+
+    # Configure MySQL database connection with PyMySQL (DATABASE_URL overrides, e.g. a local SQLite stand-in)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL') or (
+        f"mysql+pymysql://{os.getenv('MYSQL_USER')}:{os.getenv('MYSQL_PASSWORD')}@"
+        f"{os.getenv('MYSQL_HOST')}/{os.getenv('MYSQL_DATABASE')}"
+    )
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # Initialize Flask extensions
+    db.init_app(app)
+    # Per-request SQL/upstream/serialization timing for /metrics and X-Profile
+    metrics.instrument_sqlalchemy()
+    instrument_json(app)
+    # Upstream calls of user requests count against the quota the poller plans with; counted in
+    # memory and flushed to api_usage in the background, never written on the request path
+    usage_counter = UsageCounter.from_env(app)
+
+    def count_upstream_calls(service, fan_out_service):
+        service.on_call = usage_counter.add
+        return service, fan_out_service
+
+    # Upstream clients and the analytics snapshot are built on first use to keep cold starts short
+    services = Lazy(lambda: count_upstream_calls(*aviation_services()))
+    aviation_service = Lazy(lambda: services.get()[0])
+    fan_out_service = Lazy(lambda: services.get()[1])
+    # Persist live flights in the background when WRITE_BEHIND_WORKERS > 0 (inline by default)
+    write_queue = WriteBehindQueue.from_env(app, lambda records: store_flight_batch(records, load_airport_data()))
+    app.extensions['write_queue'] = write_queue
+    # Columnar flight snapshot for the ad-hoc reports (None when numpy is not installed)
+    analytics = Lazy(ColumnarSnapshot.from_env)
+    app.extensions['analytics'] = analytics
+    # Latest position of every flight seen upstream, for ?bbox= map queries
+    live_positions = LivePositionIndex.from_env()
+    # Serialized, compressed bodies of the hot read endpoints, keyed by data-version ETag
+    response_cache = PayloadCache.from_env()
+    app.extensions['response_cache'] = response_cache
+    # Status changes fanned out to /api/stream subscribers
+    change_feed.init_app(app)
+
+    def init_flight_statuses():
+        """Initialize flight status values if they don't exist"""
+        statuses = ['SCHEDULED', 'ACTIVE', 'LANDED', 'CANCELLED', 'DIVERTED', 'DELAYED']
+        existing = {s for s, in db.session.query(FlightStatus.status).filter(FlightStatus.status.in_(statuses))}
+        db.session.add_all(FlightStatus(status=s) for s in statuses if s not in existing)
+        db.session.commit()
+
+    def bootstrap_database():
+        """Create missing tables and seed the flight statuses (idempotent)"""
+        db.create_all()
+        init_flight_statuses()
+
+    @app.before_request
+    def start_profile():
+        g.profile = RequestProfile()
+        g.profile_token = current_profile.set(g.profile)
+
+    @app.after_request
+    def record_profile(response):
+        """Observe route latency and, when the client sends `X-Profile: 1`, return the breakdown"""
+        profile = g.get('profile')
+        if profile is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.record_request(profile, route, request.method, response.status_code)
+        if request.headers.get('X-Profile') == '1':
+            breakdown = profile.breakdown()
+            response.headers['X-Profile'] = json.dumps(breakdown, separators=(',', ':'))
+            response.headers['Server-Timing'] = ', '.join(
+                f"{name};dur={breakdown[f'{name}_ms']}" for name in ('db', 'upstream', 'serialize', 'total'))
+            # Timings describe this request only; keep shared caches from storing them
+            response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    @app.teardown_request
+    def end_profile(exc):
+        token = g.pop('profile_token', None)
+        if token is not None:
+            current_profile.reset(token)
+
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        """Prometheus metrics of this process (bearer METRICS_TOKEN when set)"""
+        token = os.getenv('METRICS_TOKEN')
+        if token and request.headers.get('Authorization') != f"Bearer {token}":
+            return jsonify({'error': 'Unauthorized'}), 401
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/', methods=['GET'])
+    def read_root():
+        """Read Root - API Documentation"""
+        return render_template('docs.html'), 200, {'Content-Type': 'text/html'}
+
+    @app.route('/openapi.json', methods=['GET'])
+    def openapi_json():
+        """OpenAPI Specification"""
+        return jsonify(OPENAPI_SPEC)
+
+    def paginated(items, next_cursor):
+        """JSON list response with the keyset cursor for the next page in headers"""
+        response = jsonify(items)
+        if next_cursor:
+            args = request.args.to_dict()
+            args['cursor'] = next_cursor
+            response.headers['X-Next-Cursor'] = next_cursor
+            response.headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+        return response
+
+    def page_args():
+        """(limit, cursor) from the query string, limit clamped to the server maximum"""
+        return page_size(request.args.get('limit', type=int)), request.args.get('cursor')
+
+    def flight_list_query():
+        """Columns served by the flight list endpoints, airline name joined in the same statement"""
+        return db.session.query(
+            Flight.flight_id,
+            Flight.flight_number,
+            Airline.name.label('airline'),
+            Flight.departure_airport,
+            Flight.arrival_airport,
+            Flight.scheduled_departure,
+            Flight.delay_minutes,
+            Flight.status
+        ).join(Airline, Flight.airline_id == Airline.airline_id)
+
+    def cached_json(etag, load, max_age=None):
+        """JSON for the data version `etag`: 304 when the client already has it, otherwise the body
+        shared by every client of this process, compressed per Accept-Encoding.
+
+        `load` returns (body bytes, next cursor) and only runs when the body is not cached yet.
+        """
+        max_age = response_cache.max_age if max_age is None else max_age
+        next_cursor = None
+        # Each encoding carries its own tag ("<version>-gzip"); any of them is still current
+        held = next((tag for tag in response_cache.variant_etags(etag) if request.if_none_match.contains(tag)), None)
+        if held:
+            response = Response(status=304)
+            response.set_etag(held)
+        else:
+            encoding = response_cache.encoding(request.accept_encodings)
+            body, encoding, next_cursor = response_cache.fetch(etag, encoding, load)
+            response = Response(body, mimetype='application/json')
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+            response.set_etag(response_cache.variant_etag(etag, encoding))
+        response.headers['Cache-Control'] = response_cache.cache_control(max_age)
+        response.vary.add('Accept-Encoding')
+        if next_cursor:
+            args = request.args.to_dict()
+            args['cursor'] = next_cursor
+            response.headers['X-Next-Cursor'] = next_cursor
+            response.headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+        return response
+
+    def flights_etag():
+        """Version of the flight lists: every status write raises max(update_id), every archive run
+        raises min(flight_id); both are primary-key lookups, and the request URL tells pages apart"""
+        max_update, min_flight = db.session.query(
+            db.session.query(db.func.max(FlightStatusUpdate.update_id)).scalar_subquery(),
+            db.session.query(db.func.min(Flight.flight_id)).scalar_subquery()
+        ).one()
+        url = hashlib.sha1(request.full_path.encode()).hexdigest()[:12]
+        return f"f{max_update or 0}.{min_flight or 0}-{url}"
+
+    def list_json(rows):
+        with metrics.serializing():
+            return json.dumps(rows, sort_keys=True, separators=(",", ":")).encode()
 
     @app.route('/airports', methods=['GET'])
     def get_airports():
         """Get list of all airports"""
         try:
-            airports = Airport.query.all()
-            return jsonify([{
-                'iata_code': a.iata_code,
-                'name': a.name,
-                'city': a.city,
-                'country': a.country,
-                'latitude': a.latitude,
-                'longitude': a.longitude
-            } for a in airports])
+            limit, cursor = page_args()
+            after = decode_cursor(cursor, [Airport.iata_code])[0] if cursor else None
+            body, etag, last = airport_registry.snapshot().page(after, limit)
+            return cached_json(etag, lambda: (body, encode_cursor([last]) if last else None),
+                               response_cache.static_max_age)
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -376,26 +559,37 @@ def create_app():
     def get_airport_flights(airport_code):
         """Get flights for a specific airport"""
         try:
-            date = request.args.get('date', datetime.now().date().isoformat())
+            try:
+                day = datetime.fromisoformat(request.args.get('date', datetime.now().date().isoformat()))
+            except ValueError:
+                return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+            start = datetime(day.year, day.month, day.day)
+            end = start + timedelta(days=1)
             
-            # Query flights departing or arriving at this airport on given date
-            flights = Flight.query.join(Airline)\
-                .filter(
-                    (Flight.departure_airport == airport_code) | 
-                    (Flight.arrival_airport == airport_code)
-                )\
-                .filter(db.func.date(Flight.scheduled_departure) == date)\
-                .all()
+            # Departures and arrivals as two index range scans on [date, date + 1 day)
+            departures = flight_list_query()\
+                .filter(Flight.departure_airport == airport_code)\
+                .filter(Flight.scheduled_departure >= start, Flight.scheduled_departure < end)
+            arrivals = flight_list_query()\
+                .filter(Flight.arrival_airport == airport_code)\
+                .filter(Flight.departure_airport != airport_code)\
+                .filter(Flight.scheduled_departure >= start, Flight.scheduled_departure < end)
+            flights = departures.union_all(arrivals)
+            limit, cursor = page_args()
+            flights, next_cursor = keyset_page(
+                flights, [Flight.scheduled_departure, Flight.flight_id], limit, cursor)
 
-            return jsonify([{
+            return paginated([{
                 'flight_id': f.flight_id,
                 'flight_number': f.flight_number,
-                'airline': f.airline.name,
+                'airline': f.airline,
                 'departure': f.departure_airport,
                 'arrival': f.arrival_airport,
                 'scheduled_departure': f.scheduled_departure.isoformat(),
                 'status': f.status
-            } for f in flights])
+            } for f in flights], next_cursor)
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -403,20 +597,27 @@ def create_app():
     def get_delayed_flights():
         """Get flights delayed by more than 2 hours"""
         try:
-            delayed_flights = Flight.query.join(Airline)\
-                .filter(Flight.delay_minutes >= 120)\
-                .all()
+            limit, cursor = page_args()
 
-            return jsonify([{
-                'flight_id': f.flight_id,
-                'flight_number': f.flight_number,
-                'airline': f.airline.name,
-                'departure': f.departure_airport,
-                'arrival': f.arrival_airport,
-                'scheduled_departure': f.scheduled_departure.isoformat(),
-                'delay_minutes': f.delay_minutes,
-                'status': f.status
-            } for f in delayed_flights])
+            def load():
+                delayed_flights = flight_list_query()\
+                    .filter(Flight.delay_minutes >= 120)
+                delayed_flights, next_cursor = keyset_page(
+                    delayed_flights, [Flight.scheduled_departure, Flight.flight_id], limit, cursor)
+                return list_json([{
+                    'flight_id': f.flight_id,
+                    'flight_number': f.flight_number,
+                    'airline': f.airline,
+                    'departure': f.departure_airport,
+                    'arrival': f.arrival_airport,
+                    'scheduled_departure': f.scheduled_departure.isoformat(),
+                    'delay_minutes': f.delay_minutes,
+                    'status': f.status
+                } for f in delayed_flights]), next_cursor
+
+            return cached_json(flights_etag(), load)
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -424,37 +625,72 @@ def create_app():
     def get_flight_details(flight_id):
         """Get detailed information for a specific flight"""
         try:
-            # Get flight and its latest status update
-            flight = Flight.query.get_or_404(flight_id)
-            latest_update = FlightStatusUpdate.query\
-                .filter_by(flight_id=flight_id)\
-                .order_by(FlightStatusUpdate.status_update_time.desc())\
+            # Flight (with its materialized current state), airline and both airports: one PK lookup
+            dep_airport = aliased(Airport)
+            arr_airport = aliased(Airport)
+            flight = db.session.query(
+                Flight.flight_id,
+                Flight.flight_number,
+                Flight.departure_airport,
+                Flight.arrival_airport,
+                Flight.scheduled_departure,
+                Flight.scheduled_arrival,
+                Flight.actual_departure,
+                Flight.status,
+                Flight.delay_minutes,
+                Flight.departure_gate,
+                Flight.departure_terminal,
+                Flight.arrival_gate,
+                Flight.arrival_terminal,
+                Airline.name.label('airline_name'),
+                Airline.iata_code.label('airline_iata'),
+                dep_airport.name.label('departure_airport_name'),
+                arr_airport.name.label('arrival_airport_name'),
+                FlightHistorySummary.update_count.label('compacted_updates'),
+                FlightHistorySummary.first_status,
+                FlightHistorySummary.max_delay.label('compacted_max_delay'),
+                FlightHistorySummary.gate_changes
+            ).join(Airline, Flight.airline_id == Airline.airline_id)\
+                .outerjoin(dep_airport, Flight.departure_airport == dep_airport.iata_code)\
+                .outerjoin(arr_airport, Flight.arrival_airport == arr_airport.iata_code)\
+                .outerjoin(FlightHistorySummary, FlightHistorySummary.flight_id == Flight.flight_id)\
+                .filter(Flight.flight_id == flight_id)\
                 .first()
 
+            if not flight:
+                return jsonify({'error': 'Flight not found'}), 404
+
             return jsonify({
                 'flight_id': flight.flight_id,
                 'flight_number': flight.flight_number,
                 'airline': {
-                    'name': flight.airline.name,
-                    'iata_code': flight.airline.iata_code
+                    'name': flight.airline_name,
+                    'iata_code': flight.airline_iata
                 },
                 'departure': {
-                    'airport': flight.departure_airport_info.name,
+                    'airport': flight.departure_airport_name,
                     'iata': flight.departure_airport,
                     'scheduled': flight.scheduled_departure.isoformat(),
-                    'actual': latest_update.actual_departure.isoformat() if latest_update and latest_update.actual_departure else None,
-                    'gate': latest_update.departure_gate if latest_update else None,
-                    'terminal': latest_update.departure_terminal if latest_update else None
+                    'actual': flight.actual_departure.isoformat() if flight.actual_departure else None,
+                    'gate': flight.departure_gate,
+                    'terminal': flight.departure_terminal
                 },
                 'arrival': {
-                    'airport': flight.arrival_airport_info.name,
+                    'airport': flight.arrival_airport_name,
                     'iata': flight.arrival_airport,
                     'scheduled': flight.scheduled_arrival.isoformat() if flight.scheduled_arrival else None,
-                    'gate': latest_update.arrival_gate if latest_update else None,
-                    'terminal': latest_update.arrival_terminal if latest_update else None
+                    'gate': flight.arrival_gate,
+                    'terminal': flight.arrival_terminal
                 },
                 'status': flight.status,
-                'delay_minutes': flight.delay_minutes
+                'delay_minutes': flight.delay_minutes,
+                # Status updates older than the retention window, collapsed by `flask retention`
+                'history_summary': {
+                    'updates': flight.compacted_updates,
+                    'first_status': flight.first_status,
+                    'max_delay': flight.compacted_max_delay,
+                    'gate_changes': flight.gate_changes
+                } if flight.compacted_updates else None
             })
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -463,19 +699,26 @@ def create_app():
     def get_active_flights():
         """Get currently active flights"""
         try:
-            active_flights = Flight.query.join(Airline)\
-                .filter(Flight.status == 'ACTIVE')\
-                .all()
+            limit, cursor = page_args()
 
-            return jsonify([{
-                'flight_id': f.flight_id,
-                'flight_number': f.flight_number,
-                'airline': f.airline.name,
-                'departure': f.departure_airport,
-                'arrival': f.arrival_airport,
-                'scheduled_departure': f.scheduled_departure.isoformat(),
-                'status': f.status
-            } for f in active_flights])
+            def load():
+                active_flights = flight_list_query()\
+                    .filter(Flight.status == 'ACTIVE')
+                active_flights, next_cursor = keyset_page(
+                    active_flights, [Flight.scheduled_departure, Flight.flight_id], limit, cursor)
+                return list_json([{
+                    'flight_id': f.flight_id,
+                    'flight_number': f.flight_number,
+                    'airline': f.airline,
+                    'departure': f.departure_airport,
+                    'arrival': f.arrival_airport,
+                    'scheduled_departure': f.scheduled_departure.isoformat(),
+                    'status': f.status
+                } for f in active_flights]), next_cursor
+
+            return cached_json(flights_etag(), load)
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -484,7 +727,8 @@ def create_app():
         """Search for a specific flight by number"""
         try:
             # Get most recent flight with this number
-            flight = Flight.query.filter_by(flight_number=flight_number)\
+            flight = flight_list_query()\
+                .filter(Flight.flight_number == flight_number)\
                 .order_by(Flight.scheduled_departure.desc())\
                 .first()
 
@@ -494,7 +738,7 @@ def create_app():
             return jsonify({
                 'flight_id': flight.flight_id,
                 'flight_number': flight.flight_number,
-                'airline': flight.airline.name,
+                'airline': flight.airline,
                 'departure': flight.departure_airport,
                 'arrival': flight.arrival_airport,
                 'scheduled_departure': flight.scheduled_departure.isoformat(),
@@ -504,128 +748,135 @@ def create_app():
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
-    @app.route('/api/flights/live', methods=['GET'])
-    def get_live_flights():
-        """Get real-time flight data"""
-        try:
-            airline = request.args.get('airline')
-            limit = request.args.get('limit', 100, type=int)
-            
-            # Get live flight data from aviation service
-            flights = aviation_service.get_live_flights(limit=limit)
-            
-            # Filter by airline if specified
-            if airline:
-                flights['data'] = [f for f in flights['data'] 
-                                 if f.get('airline', {}).get('iata') == airline]
-            
-            # Store flight data in database
-            for flight_data in flights['data']:
-                store_flight_data(flight_data)
-            
-            return jsonify(flights)
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
+    # With `flask poll` running, INGEST_ON_REQUEST=0 leaves storage to the poller; the upstream calls of
+    # user requests still count against the quota in api_usage, so the poller plans around them
+    ingest_on_request = os.getenv('INGEST_ON_REQUEST', '1') == '1'
 
-    def enrich_airport_data(airport_info):
-        """Add additional airport info from local database"""
-        iata = airport_info.get('iata')
-        if iata and iata in AIRPORT_DATA:
-            supplementary_data = AIRPORT_DATA[iata]
-            return {
-                'iata_code': iata,
-                'name': airport_info.get('airport', supplementary_data['name']),
-                'city': supplementary_data['city'],
-                'country': supplementary_data['country'],
-                'latitude': supplementary_data['latitude'],
-                'longitude': supplementary_data['longitude'],
-                'timezone': supplementary_data['timezone']
-            }
-        return {
-            'iata_code': iata,
-            'name': airport_info.get('airport', f"Airport {iata}"),
-            'city': airport_info.get('city', 'Unknown'),
-            'country': airport_info.get('country', 'Unknown'),
-            'latitude': None,
-            'longitude': None,
-            'timezone': None
-        }
+    def persist_flights(records):
+        """Hand records to the write-behind queue, or store them inline when disabled"""
+        live_positions.update(records)
+        if not ingest_on_request:
+            return
+        if write_queue:
+            write_queue.put_many(records)
+        else:
+            store_flight_batch(records, load_airport_data())
 
-    def store_flight_data(flight_data):
-        """Store flight data in database"""
-        try:
-            # Get or create airline record
-            airline_info = flight_data.get('airline', {})
-            airline = Airline.query.filter_by(iata_code=airline_info.get('iata')).first()
-            if not airline and airline_info.get('iata'):
-                airline = Airline(
-                    name=airline_info.get('name', f"Airline {airline_info.get('iata')}"),
-                    iata_code=airline_info.get('iata'),
-                    icao_code=airline_info.get('icao'),
-                    country=airline_info.get('country', 'Unknown'),
-                    active=True
-                )
-                db.session.add(airline)
-                db.session.flush()
-            elif not airline:
-                return
+    def iter_live_flights(flight_filter, limit):
+        """Walk upstream pages with filters pushed down until `limit` records match, as (page, matches)"""
+        found = 0
+        matches = []
 
-            # Create airport records if needed
-            dep_info = flight_data.get('departure', {})
-            arr_info = flight_data.get('arrival', {})
-            
-            for airport_info in [dep_info, arr_info]:
-                iata = airport_info.get('iata')
-                if iata and not Airport.query.get(iata):
-                    enriched_data = enrich_airport_data(airport_info)
-                    airport = Airport(**enriched_data)
-                    db.session.add(airport)
-
-            # Create or update flight record
-            flight_number = flight_data.get('flight', {}).get('number')
-            if not flight_number:
-                return
-                
-            scheduled_dep = dep_info.get('scheduled')
-            if not scheduled_dep:
+        def wants_more(page):
+            nonlocal found
+            matches[:] = flight_filter.apply(page.get('data') or [], limit - found)
+            found += len(matches)
+            return found < limit
+
+        pages = aviation_service.iter_pages('flights', flight_filter.api_params(), prefetch=True,
+                                            max_pages=int(os.getenv('LIVE_MAX_PAGES', '10')),
+                                            wants_more=wants_more)
+        with closing(pages):
+            for page in pages:
+                yield page, list(matches)
+
+    def sweep_live_positions():
+        """Walk every live flight into the position index; False when LIVE_MAX_PAGES cut it short"""
+        max_pages = int(os.getenv('LIVE_MAX_PAGES', '10'))
+        with app.app_context():
+            pages = aviation_service.iter_pages('flights', {}, max_pages=max_pages, prefetch=True)
+            for page_number, page in enumerate(pages, 1):
+                persist_flights(page.get('data') or [])
+                if page_number >= max_pages:
+                    return False
+        return True
+
+    def live_flights_in_bbox(flight_filter, bbox, limit):
+        """Flights inside `bbox` from the live position index (a stale index is refilled in the background)"""
+        live_positions.refill(sweep_live_positions)
+        return list(flight_filter.apply(live_positions.in_bbox(bbox), limit))
+
+    def stream_live_flights(flight_filter, limit, fields, fmt):
+        """Stream flights page by page as NDJSON or chunked JSON"""
+        max_pages = int(os.getenv('LIVE_MAX_PAGES', '10'))
+
+        def generate():
+            count = 0
+            truncated = False
+            if fmt == 'json':
+                yield '{"data":['
+            try:
+                for page_number, (page, records) in enumerate(iter_live_flights(flight_filter, limit), 1):
+                    persist_flights(records)
+                    for record in records:
+                        record = json.dumps(project(record, fields))
+                        if fmt == 'ndjson':
+                            yield record + '\n'
+                        else:
+                            yield (',' if count else '') + record
+                        count += 1
+                    if count >= limit:
+                        break
+                    if page_number >= max_pages:
+                        # Same page cap as the buffered path; tell the client upstream had more
+                        pagination = page.get('pagination') or {}
+                        total = pagination.get('total')
+                        seen = (pagination.get('offset') or 0) + len(page.get('data') or [])
+                        truncated = bool(page.get('data')) and (total is None or seen < total)
+                        break
+            except Exception as e:
+                # Headers are already sent, so report the failure in-band
+                if fmt == 'ndjson':
+                    yield json.dumps({'error': str(e)}) + '\n'
+                else:
+                    yield '],"error":%s,"pagination":{"count":%d}}' % (json.dumps(str(e)), count)
                 return
+            if fmt == 'ndjson':
+                if truncated:
+                    yield json.dumps({'truncated': True, 'count': count}) + '\n'
+            else:
+                yield '],%s"pagination":{"count":%d}}' % ('"truncated":true,' if truncated else '', count)
 
-            flight = Flight.query.filter_by(
-                flight_number=flight_number,
-                scheduled_departure=datetime.fromisoformat(scheduled_dep)
-            ).first()
+        mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+        return Response(stream_with_context(generate()), mimetype=mimetype)
 
-            if not flight:
-                flight = Flight(
-                    flight_number=flight_number,
-                    airline_id=airline.airline_id,
-                    departure_airport=dep_info.get('iata'),
-                    arrival_airport=arr_info.get('iata'),
-                    scheduled_departure=datetime.fromisoformat(scheduled_dep),
-                    scheduled_arrival=datetime.fromisoformat(arr_info.get('scheduled', scheduled_dep)),
-                    status='SCHEDULED'
-                )
-                db.session.add(flight)
-                db.session.flush()
-
-            # Create status update record
-            status_update = FlightStatusUpdate(
-                flight_id=flight.flight_id,
-                status=flight_data.get('flight_status', 'SCHEDULED').upper(),
-                actual_departure=dep_info.get('actual'),
-                estimated_departure=dep_info.get('estimated'),
-                delay_minutes=dep_info.get('delay'),
-                departure_gate=dep_info.get('gate'),
-                departure_terminal=dep_info.get('terminal'),
-                arrival_gate=arr_info.get('gate'),
-                arrival_terminal=arr_info.get('terminal')
-            )
-            db.session.add(status_update)
-            db.session.commit()
+    @app.route('/api/flights/live', methods=['GET'])
+    def get_live_flights():
+        """Get real-time flight data (?stream=ndjson|json walks every page up to limit)"""
+        try:
+            limit = request.args.get('limit', 100, type=int)
+            stream = request.args.get('stream')
+            flight_filter = FlightFilter.from_args(request.args, load_airport_data())
+            fields = parse_fields(request.args.get('fields'))
+            if stream:
+                if stream not in ('ndjson', 'json'):
+                    return jsonify({'error': 'stream must be ndjson or json'}), 400
+                return stream_live_flights(flight_filter, limit, fields, stream)
+
+            if request.args.get('bbox'):
+                try:
+                    bbox = parse_bbox(request.args.get('bbox'))
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
+                data = live_flights_in_bbox(flight_filter, bbox, limit)
+                flights = {'pagination': {'limit': limit, 'count': len(data)}, 'data': data}
+            elif flight_filter.api_params() or flight_filter.has_residual:
+                # Keep fetching pages until `limit` flights match
+                data = []
+                for page, records in iter_live_flights(flight_filter, limit):
+                    persist_flights(records)
+                    data.extend(records)
+                flights = {'pagination': {'limit': limit, 'count': len(data)}, 'data': data}
+            else:
+                # Get live flight data from aviation service
+                flights = aviation_service.get_live_flights(limit=limit)
+                persist_flights(flights['data'])
 
+            if fields:
+                flights['data'] = [project(f, fields) for f in flights['data']]
+            return jsonify(flights)
         except Exception as e:
-            db.session.rollback()
-            raise e
+            return jsonify({'error': str(e)}), 500
 
     @app.route('/api/flights/search', methods=['GET'])
     def search_flights():
@@ -643,41 +894,254 @@ def create_app():
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
-    @app.route('/api/stats/delays', methods=['GET'])
-    def get_delay_stats():
-        """Get airline delay statistics"""
+    @app.route('/api/airports/schedules', methods=['GET'])
+    def get_airport_schedules_batch():
+        """Get schedules for several airports in one request (?iata=FRA,MUC,...)"""
         try:
-            # Calculate average delays by airline
-            stats = db.session.query(
-                Airline.name,
-                db.func.avg(Flight.delay_minutes).label('avg_delay'),
-                db.func.count(Flight.flight_id).label('total_flights')
-            ).join(Flight).group_by(Airline.name).all()
+            codes = parse_codes(request.args.get('iata'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if not codes:
+            return jsonify({'error': 'iata parameter is required'}), 400
+        try:
+            return jsonify(fan_out_service.get_airport_schedules_many(codes))
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/airlines/routes', methods=['GET'])
+    def get_airline_routes_batch():
+        """Get routes for several airlines in one request (?airline=LH,AF,...)"""
+        try:
+            codes = parse_codes(request.args.get('airline'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if not codes:
+            return jsonify({'error': 'airline parameter is required'}), 400
+        try:
+            return jsonify(fan_out_service.get_airline_routes_many(codes))
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/ingest/status', methods=['GET'])
+    def get_ingest_status():
+        """Get write-behind queue depth, lag and counters"""
+        caches = {'dedup': fingerprint_cache.metrics(), 'airlines': airline_registry.metrics(),
+                  'responses': response_cache.metrics(), 'stream': change_feed.metrics(),
+                  'api_usage': usage_counter.metrics()}
+        if not write_queue:
+            return jsonify({'mode': 'inline', **caches})
+        return jsonify({'mode': 'write-behind', **write_queue.metrics(), **caches})
+
+    @app.route('/api/stream', methods=['GET'])
+    def stream_status_changes():
+        """Server-Sent Events of flight status changes (?flight_id=&airline=&airport=&status=)
+
+        Event ids are status update ids: a reconnect with Last-Event-ID (or
+        ?last_event_id=) first replays what was missed from the database.
+        """
+        try:
+            flight_ids = [int(v) for v in request.args.get('flight_id', '').split(',') if v.strip()]
+            last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+            last_id = int(last_id) if last_id else None
+            subscription = Subscription(
+                flight_ids=flight_ids,
+                airlines=parse_codes(request.args.get('airline')),
+                airports=parse_codes(request.args.get('airport')),
+                statuses=parse_codes(request.args.get('status')),
+                maxsize=change_feed.queue_size
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        replay_limit = int(os.getenv('STREAM_REPLAY_LIMIT', '1000'))
+        max_seconds = float(os.getenv('STREAM_MAX_SECONDS', '30'))
+        keepalive = float(os.getenv('STREAM_KEEPALIVE', '15'))
+
+        def frame(event):
+            return f"id: {event['id']}\nevent: status\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+        # Subscribe before replaying so nothing committed in between is lost; duplicates are skipped below
+        if not change_feed.subscribe(subscription):
+            response = jsonify({'error': 'Too many open streams, retry later'})
+            response.headers['Retry-After'] = str(max(1, int(max_seconds)))
+            return response, 503
+        db.session.close()  # hold no connection while the stream is open
+
+        def generate():
+            try:
+                yield 'retry: 3000\n\n'
+                replayed = sent = last_id or 0
+                if last_id is not None:
+                    replay = change_feed.read(last_id, replay_limit, subscription)
+                    db.session.close()
+                    for event in replay:
+                        yield frame(event)
+                    if replay:
+                        replayed = sent = replay[-1]['id']
+                    if len(replay) == replay_limit:
+                        # More was missed than we replay; the client should reload its state
+                        yield f"event: truncated\ndata: {json.dumps({'last_id': sent})}\n\n"
+                deadline = time.monotonic() + max_seconds
+                while time.monotonic() < deadline:
+                    if subscription.lagged and subscription.queue.empty():
+                        # Dropped for falling behind: reconnecting with Last-Event-ID replays the gap
+                        yield f"event: lagged\ndata: {json.dumps({'last_id': sent})}\n\n"
+                        return
+                    try:
+                        event = subscription.queue.get(timeout=min(keepalive, max(deadline - time.monotonic(), 0)))
+                    except queue.Empty:
+                        yield ': keepalive\n\n'
+                        continue
+                    # Events up to the replayed id were already sent; late commits below `sent` still go out
+                    if event['id'] > replayed:
+                        sent = max(sent, event['id'])
+                        yield frame(event)
+            finally:
+                change_feed.unsubscribe(subscription)
+
+        response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+        # Also when the body is never iterated (client gone before the first chunk)
+        response.call_on_close(lambda: change_feed.unsubscribe(subscription))
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    def stats_window():
+        """Optional [from, to) window from the query string"""
+        bounds = []
+        for name in ('from', 'to'):
+            value = request.args.get(name)
+            bounds.append(datetime.fromisoformat(value).replace(tzinfo=None) if value else None)
+        return bounds
+
+    def delay_stats(kind, label):
+        """Rollup statistics for `kind`, with sketch percentiles/histograms on request"""
+        try:
+            start, end = stats_window()
+            percentiles = parse_percentiles(request.args.get('percentiles'))
+        except ValueError:
+            return jsonify({'error': 'from/to must be ISO datetimes, percentiles numbers in [0, 100]'}), 400
+        histogram = request.args.get('histogram', '').lower() in ('1', 'true', 'yes')
+        try:
+            # Merge pre-aggregated buckets instead of scanning flights
+            stats = query_delay_stats(kind, start, end)
+            sketches = query_delay_sketches(kind, start, end) if percentiles or histogram else {}
+            names = airline_names(s['key'] for s in stats) if kind == 'airline' else {}
 
             return jsonify([{
-                'airline': s.name,
-                'avg_delay': float(s.avg_delay or 0),
-                'total_flights': s.total_flights
+                **label(s['key'], names),
+                'avg_delay': s['avg_delay'],
+                'total_flights': s['total_flights'],
+                'max_delay': s['max_delay'],
+                'stddev_delay': s['stddev_delay'],
+                **describe(sketches.get(s['key']), percentiles, histogram)
             } for s in stats])
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
+    @app.route('/api/stats/delays', methods=['GET'])
+    def get_delay_stats():
+        """Get airline delay statistics (?from=&to=&percentiles=50,90,99&histogram=1)"""
+        return delay_stats('airline', lambda key, names: {'airline': names.get(key, key)})
+
+    @app.route('/api/stats/routes', methods=['GET'])
+    def get_route_stats():
+        """Get delay statistics per departure/arrival airport pair"""
+        return delay_stats('route', lambda key, names: {
+            'departure': key.split('-')[0],
+            'arrival': key.split('-')[-1]
+        })
+
+    @app.route('/api/stats/airports', methods=['GET'])
+    def get_airport_stats():
+        """Get departure delay statistics per airport"""
+        return delay_stats('airport', lambda key, names: {'airport': key})
+
+    def analytics_report(report):
+        """Run a columnar report over the (incrementally refreshed) flight snapshot"""
+        if analytics.get() is None:
+            return jsonify({'error': 'Analytics requires numpy (pip install numpy)'}), 503
+        try:
+            start, end = stats_window()
+        except ValueError:
+            return jsonify({'error': 'from/to must be ISO datetimes'}), 400
+        try:
+            analytics.ensure_fresh()
+            return jsonify({'data': report(start, end), 'snapshot': analytics.info()})
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/analytics/airlines', methods=['GET'])
+    def get_analytics_airlines():
+        """Get flight counts per airline"""
+        return analytics_report(lambda start, end: analytics.flights_per_airline(start, end))
+
+    @app.route('/api/analytics/airports', methods=['GET'])
+    def get_analytics_airports():
+        """Get departure counts per airport"""
+        return analytics_report(lambda start, end: analytics.departures_per_airport(start, end))
+
+    @app.route('/api/analytics/routes', methods=['GET'])
+    def get_analytics_routes():
+        """Get average and max delay per city pair (routes with more than one flight)"""
+        return analytics_report(lambda start, end: analytics.delay_by_route(start, end))
+
+    @app.route('/api/analytics/statuses', methods=['GET'])
+    def get_analytics_statuses():
+        """Get flight count and average delay per status"""
+        return analytics_report(lambda start, end: analytics.status_distribution(start, end))
+
+    @app.route('/api/analytics/multi-status', methods=['GET'])
+    def get_analytics_multi_status():
+        """Get flights with multiple status updates, most updated first"""
+        limit = page_size(request.args.get('limit', type=int))
+        return analytics_report(lambda start, end: analytics.multi_status_flights(limit))
+
     @app.route('/api/flights/<flight_id>/history', methods=['GET'])
     def get_flight_history(flight_id):
         """Get flight status history"""
         try:
             # Get all status updates for flight
-            updates = FlightStatusUpdate.query.filter_by(flight_id=flight_id)\
-                .order_by(FlightStatusUpdate.status_update_time.desc()).all()
+            limit, cursor = page_args()
+            updates, next_cursor = keyset_page(
+                FlightStatusUpdate.query.filter_by(flight_id=flight_id),
+                [FlightStatusUpdate.status_update_time, FlightStatusUpdate.update_id],
+                limit, cursor, descending=True)
             
-            return jsonify([{
+            return paginated([{
                 'status': u.status,
                 'update_time': u.status_update_time.isoformat(),
                 'delay_minutes': u.delay_minutes,
                 'delay_reason': u.delay_reason,
                 'departure_gate': u.departure_gate,
                 'arrival_gate': u.arrival_gate
-            } for u in updates])
+            } for u in updates], next_cursor)
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/airports/nearby', methods=['GET'])
+    def get_nearby_airports():
+        """Get airports near a point (?lat=&lon=&radius_km= or &k= nearest)"""
+        lat = request.args.get('lat', type=float)
+        lon = request.args.get('lon', type=float)
+        radius_km = request.args.get('radius_km', type=float)
+        k = request.args.get('k', type=int)
+        if lat is None or lon is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return jsonify({'error': 'lat and lon are required decimal degrees'}), 400
+        if (radius_km is not None and radius_km <= 0) or (k is not None and k <= 0):
+            return jsonify({'error': 'radius_km and k must be positive'}), 400
+        try:
+            geo = airport_registry.snapshot().geo
+            limit = min(k or (MAX_PAGE_SIZE if radius_km else 10), MAX_PAGE_SIZE)
+            if radius_km is not None:
+                found = geo.within(lat, lon, radius_km)[:limit]
+            else:
+                found = geo.nearest(lat, lon, limit)
+            return jsonify([{
+                **{f: airport[f] for f in LIST_FIELDS},
+                'distance_km': round(distance, 2)
+            } for distance, _, airport in found])
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -685,35 +1149,87 @@ def create_app():
     def get_european_airports():
         """Get European airports"""
         try:
-            # List of EU countries plus Norway and Switzerland
-            european_countries = [
-                'Austria', 'Belgium', 'Bulgaria', 'Croatia', 'Cyprus', 'Czech Republic',
-                'Denmark', 'Estonia', 'Finland', 'France', 'Germany', 'Greece', 'Hungary',
-                'Ireland', 'Italy', 'Latvia', 'Lithuania', 'Luxembourg', 'Malta',
-                'Netherlands', 'Poland', 'Portugal', 'Romania', 'Slovakia', 'Slovenia',
-                'Spain', 'Sweden', 'United Kingdom', 'Norway', 'Switzerland'
-            ]
-            
-            airports = Airport.query.filter(Airport.country.in_(european_countries)).all()
-            
-            return jsonify([{
-                'name': a.name,
-                'iata_code': a.iata_code,
-                'city': a.city,
-                'country': a.country,
-                'latitude': a.latitude,
-                'longitude': a.longitude
-            } for a in airports])
+            # Served from the in-process registry's prebuilt country index
+            body, etag = airport_registry.snapshot().region('europe')
+            return cached_json(etag, lambda: (body, None), response_cache.static_max_age)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
-    # Initialize database and flight statuses
-    with app.app_context():
-        db.create_all()
-        init_flight_statuses()
+    @app.cli.command('rebuild-rollups')
+    def rebuild_rollups_command():
+        """Recompute delay rollups and sketches from the flights table"""
+        print(f"Rolled up {rebuild_delay_rollups()} flights")
+        print(f"Sketched {rebuild_delay_sketches()} flights")
+
+    @app.cli.command('retention')
+    @click.option('--compact-days', default=30, show_default=True,
+                  help='Summarise and delete status updates older than this many days')
+    @click.option('--archive-months', default=12, show_default=True,
+                  help='Export and remove flights scheduled this many whole months ago or earlier')
+    @click.option('--archive-dir', default='archive', show_default=True)
+    @click.option('--format', 'fmt', type=click.Choice(ARCHIVE_FORMATS), default='csv', show_default=True)
+    @click.option('--dry-run', is_flag=True, help='Report what would be compacted/archived without changing anything')
+    def retention_command(compact_days, archive_months, archive_dir, fmt, dry_run):
+        """Compact old status history, archive cold months and pre-create partitions"""
+        now = datetime.utcnow()
+        if not dry_run:
+            for partition in ensure_partitions(now=now):
+                print(f"Created partition {partition}")
+        stats = compact_status_history(now - timedelta(days=compact_days), dry_run=dry_run)
+        print(f"Compacted {stats['updates_compacted']} status updates of {stats['flights']} flights")
+        for month in archive_flights(subtract_months(now, archive_months), archive_dir, fmt, dry_run=dry_run):
+            if month['flights']:
+                print(f"Archived {month['month']}: {month['flights']} flights, "
+                      f"{month['status_updates']} status updates {' '.join(month['files'])}")
+
+    @app.cli.command('partition-tables')
+    @click.option('--months-ahead', default=3, show_default=True, help='Monthly partitions to create past this month')
+    def partition_tables_command(months_ahead):
+        """Migrate flights and status updates to monthly partitions (MySQL, once; `flask retention` extends them)"""
+        tables = partition_tables(months_ahead)
+        print(f"Partitioned {', '.join(tables)}" if tables else "Nothing to partition (already done, or not MySQL)")
+
+    @app.cli.command('poll')
+    @click.option('--once', is_flag=True, help='Poll the targets that are due and exit (e.g. from cron)')
+    @click.option('--dry-run', is_flag=True, help='Report the plan and projected quota use without calling upstream')
+    def poll_command(once, dry_run):
+        """Ingest flights on a quota-aware schedule instead of on user requests"""
+        scheduler = PollScheduler.from_env(
+            code for code, info in load_airport_data().items() if info.get('country') in EUROPEAN_COUNTRIES)
+        if dry_run:
+            report = scheduler.report(datetime.utcnow())
+            for target in report['targets']:
+                print(f"{target['target']:<14} weight {target['weight']:>8}  every {target['interval_minutes']:>6} min"
+                      f"  x{target['pages']} pages  {target['calls_per_day']:>7} calls/day")
+            if report['flights']:
+                flights = report['flights']
+                phases = ', '.join(f"{phase} {count}" for phase, count in sorted(flights['phases'].items()))
+                print(f"Flight refresh: {flights['tracked']} open flights ({phases}) want "
+                      f"{flights['demand_per_day']} calls/day, share {flights['share_per_day']} "
+                      f"(intervals x{flights['interval_scale']})")
+            print(f"Planned {report['calls_per_day']} calls/day of {report['allowance_today']} allowed today "
+                  f"({report['used_today']} used)")
+            print(f"This month: {report['used_this_month']} used, {report['projected_month']} projected "
+                  f"of {report['monthly_quota']}")
+            return
+        from api.aviation_service import AviationService
+        # No response cache: every call should bring fresh data for the quota it costs
+        service = AviationService(cache=None)
+        stats = scheduler.run(service, lambda records: store_flight_batch(records, load_airport_data()), once=once)
+        print(f"Polled {stats['polls']} targets with {stats['calls']} calls, stored {stats['records']} records")
+
+    @app.cli.command('bootstrap')
+    def bootstrap_command():
+        """Create the schema and seed reference data; run on deploy, not on every cold start"""
+        bootstrap_database()
+        print("Database bootstrapped")
+
+    if bootstrap if bootstrap is not None else os.getenv('BOOTSTRAP_ON_START', '0') == '1':
+        with app.app_context():
+            bootstrap_database()
 
     return app
 
 if __name__ == '__main__':
-    app = create_app()
+    app = create_app(bootstrap=True)
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,122 @@
+"""EXPLAIN plan and latency of /airports/<code>/flights before and after the sargable rewrite.
+
+Usage: python benchmarks/bench_airport_flights.py [--rows 2000000] [--database-url sqlite:///bench_airports.db]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import select
+from database.models import db, Airline, Flight
+
+AIRPORTS = ['FRA', 'MUC', 'BER', 'HAM', 'DUS', 'CDG', 'LHR', 'AMS', 'MAD', 'FCO',
+            'VIE', 'ZRH', 'CPH', 'OSL', 'ARN', 'HEL', 'DUB', 'LIS', 'BCN', 'ATH']
+COLUMNS = [Flight.flight_id, Flight.flight_number, Airline.name.label('airline'),
+           Flight.departure_airport, Flight.arrival_airport, Flight.scheduled_departure,
+           Flight.delay_minutes, Flight.status]
+COMPOSITE = ['idx_departure_airport_time', 'idx_arrival_airport_time']
+
+
+def old_query(code, day):
+    """Previous form: DATE() on the column and an OR across both airport columns"""
+    return select(*COLUMNS).join(Airline, Flight.airline_id == Airline.airline_id)\
+        .where((Flight.departure_airport == code) | (Flight.arrival_airport == code))\
+        .where(db.func.date(Flight.scheduled_departure) == day.date().isoformat())\
+        .order_by(Flight.scheduled_departure, Flight.flight_id).limit(101)
+
+
+def new_query(code, day):
+    """Current form: half-open range and a UNION ALL of two index-friendly branches"""
+    start, end = day, day + timedelta(days=1)
+    base = select(*COLUMNS).join(Airline, Flight.airline_id == Airline.airline_id)
+    departures = base.where(Flight.departure_airport == code)\
+        .where(Flight.scheduled_departure >= start, Flight.scheduled_departure < end)
+    arrivals = base.where(Flight.arrival_airport == code, Flight.departure_airport != code)\
+        .where(Flight.scheduled_departure >= start, Flight.scheduled_departure < end)
+    union = departures.union_all(arrivals).subquery()
+    return select(union).order_by(union.c.scheduled_departure, union.c.flight_id).limit(101)
+
+
+def load(rows, base):
+    rng = random.Random(42)
+    db.session.execute(Airline.__table__.insert(), [
+        {'airline_id': i, 'name': f"Airline {i}", 'iata_code': f"A{i}", 'active': True} for i in range(1, 10)
+    ])
+    chunk = 50000
+    for start in range(0, rows, chunk):
+        batch = []
+        for i in range(start, min(rows, start + chunk)):
+            dep, arr = rng.sample(AIRPORTS, 2)
+            batch.append({
+                'flight_number': f"F{i}",
+                'airline_id': rng.randrange(1, 10),
+                'departure_airport': dep,
+                'arrival_airport': arr,
+                'scheduled_departure': base + timedelta(minutes=rng.randrange(0, 365 * 24 * 60)),
+                'status': 'SCHEDULED',
+                'delay_minutes': 0
+            })
+        db.session.execute(Flight.__table__.insert(), batch)
+    db.session.commit()
+
+
+def explain(stmt):
+    dialect = db.engine.dialect
+    sql = str(stmt.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+    for row in db.session.execute(db.text(prefix + sql)):
+        print('    ' + ' | '.join(str(v) for v in row))
+
+
+def measure(label, build, runs):
+    samples = []
+    for i in range(runs):
+        code = AIRPORTS[i % len(AIRPORTS)]
+        day = datetime(2024, 1, 1) + timedelta(days=i * 7 % 365)
+        start = time.perf_counter()
+        db.session.execute(build(code, day)).all()
+        samples.append((time.perf_counter() - start) * 1000)
+    print(f"{label:<36} median {statistics.median(samples):9.2f}ms  max {max(samples):9.2f}ms")
+    explain(build('FRA', datetime(2024, 3, 1)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL', 'sqlite:///bench_airports.db'))
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        # Baseline: only the single-column index from schema.sql
+        for name in COMPOSITE:
+            db.session.execute(db.text(f"DROP INDEX {name}" + ('' if db.engine.dialect.name == 'sqlite' else ' ON flights')))
+        db.session.execute(db.text('CREATE INDEX idx_departure_time ON flights(scheduled_departure)'))
+        start = time.perf_counter()
+        load(args.rows, datetime(2024, 1, 1))
+        print(f"loaded {args.rows} flights in {time.perf_counter() - start:.1f}s")
+
+        measure('before: DATE() + OR', old_query, args.runs)
+        for index in Flight.__table__.indexes:
+            if index.name in COMPOSITE:
+                index.create(db.engine)
+        measure('old query, composite indexes', old_query, args.runs)
+        measure('after: range + UNION ALL', new_query, args.runs)
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Columnar analytics kernels vs. the equivalent SQL reports from database/queries.sql.
+
+Usage: python benchmarks/bench_analytics.py [--rows 10000000] [--database-url sqlite:///bench_analytics.db]
+Requires numpy.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from database.models import db, Airline, Airport, Flight, FlightStatus, FlightStatusUpdate
+from database.columnar import ColumnarSnapshot
+
+AIRPORTS = ['FRA', 'MUC', 'BER', 'HAM', 'DUS', 'CDG', 'LHR', 'AMS', 'MAD', 'FCO',
+            'VIE', 'ZRH', 'CPH', 'OSL', 'ARN', 'HEL', 'DUB', 'LIS', 'BCN', 'ATH']
+STATUSES = ['SCHEDULED', 'ACTIVE', 'LANDED', 'CANCELLED', 'DIVERTED', 'DELAYED']
+
+SQL_REPORTS = {
+    'flights per airline': """
+        SELECT a.name, COUNT(f.flight_id) AS total_flights FROM airlines a
+        LEFT JOIN flights f ON a.airline_id = f.airline_id
+        GROUP BY a.airline_id, a.name ORDER BY total_flights DESC""",
+    'departures per airport': """
+        SELECT a.iata_code, COUNT(f.flight_id) AS departure_count FROM airports a
+        LEFT JOIN flights f ON a.iata_code = f.departure_airport
+        GROUP BY a.iata_code ORDER BY departure_count DESC""",
+    'delay by route': """
+        SELECT dep.city, arr.city, COUNT(*) AS flight_count, AVG(f.delay_minutes) AS avg_delay,
+               MAX(f.delay_minutes) FROM flights f
+        JOIN airports dep ON f.departure_airport = dep.iata_code
+        JOIN airports arr ON f.arrival_airport = arr.iata_code
+        GROUP BY dep.city, arr.city HAVING COUNT(*) > 1 ORDER BY avg_delay DESC""",
+    'status distribution': """
+        SELECT status, COUNT(*) AS flight_count, AVG(delay_minutes) FROM flights
+        GROUP BY status ORDER BY flight_count DESC""",
+    'multi-status flights': """
+        SELECT f.flight_id, COUNT(fsu.update_id) AS changes FROM flights f
+        JOIN flight_status_updates fsu ON f.flight_id = fsu.flight_id
+        GROUP BY f.flight_id HAVING COUNT(fsu.update_id) > 1 ORDER BY changes DESC LIMIT 100""",
+}
+
+
+def kernels(snapshot):
+    return {
+        'flights per airline': snapshot.flights_per_airline,
+        'departures per airport': snapshot.departures_per_airport,
+        'delay by route': snapshot.delay_by_route,
+        'status distribution': snapshot.status_distribution,
+        'multi-status flights': lambda: snapshot.multi_status_flights(100),
+    }
+
+
+def load(rows, first_id, base, rng):
+    """Insert `rows` flights from `first_id` plus one to three status updates each"""
+    chunk = 50000
+    for start in range(first_id, first_id + rows, chunk):
+        flights, updates = [], []
+        for i in range(start, min(first_id + rows, start + chunk)):
+            dep, arr = rng.sample(AIRPORTS, 2)
+            status = rng.choice(STATUSES)
+            scheduled = base + timedelta(minutes=rng.randrange(0, 365 * 24 * 60))
+            flights.append({
+                'flight_id': i,
+                'flight_number': f"F{i}",
+                'airline_id': rng.randrange(1, 30),
+                'departure_airport': dep,
+                'arrival_airport': arr,
+                'scheduled_departure': scheduled,
+                'status': status,
+                'delay_minutes': int(rng.expovariate(1 / 20))
+            })
+            for _ in range(rng.choice((1, 1, 2, 3))):
+                updates.append({'flight_id': i, 'status': rng.choice(STATUSES), 'status_update_time': scheduled})
+        db.session.execute(Flight.__table__.insert(), flights)
+        db.session.execute(FlightStatusUpdate.__table__.insert(), updates)
+    db.session.commit()
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000000)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL', 'sqlite:///bench_analytics.db'))
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    rng = random.Random(42)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(FlightStatus.__table__.insert(), [{'status': s} for s in STATUSES])
+        db.session.execute(Airport.__table__.insert(), [
+            {'iata_code': code, 'name': f"Airport {code}", 'city': f"City {code}", 'country': 'EU'}
+            for code in AIRPORTS
+        ])
+        db.session.execute(Airline.__table__.insert(), [
+            {'airline_id': i, 'name': f"Airline {i}", 'iata_code': f"A{i}", 'active': True} for i in range(1, 30)
+        ])
+        start = time.perf_counter()
+        load(args.rows, 1, datetime(2024, 1, 1), rng)
+        print(f"loaded {args.rows} flights in {time.perf_counter() - start:.1f}s")
+
+        snapshot = ColumnarSnapshot(refresh_interval=0)
+        stats = snapshot.refresh()
+        print(f"initial snapshot: {stats['flights_read']} flights, {stats['updates_read']} updates "
+              f"in {stats['seconds']:.1f}s, {snapshot.info()['memory_bytes'] / 1e6:.0f} MB")
+
+        print(f"{'report':<24} {'sql ms':>10} {'columnar ms':>12} {'speedup':>8}")
+        for name, run in kernels(snapshot).items():
+            sql = timed(lambda: db.session.execute(db.text(SQL_REPORTS[name])).all(), args.runs)
+            columnar = timed(run, args.runs)
+            print(f"{name:<24} {sql:>10.1f} {columnar:>12.1f} {sql / columnar:>7.1f}x")
+
+        # Incremental refresh: 1% new flights with their updates
+        extra = max(1, args.rows // 100)
+        load(extra, args.rows + 1, datetime(2024, 1, 1), rng)
+        stats = snapshot.refresh()
+        print(f"incremental refresh: {stats['flights_read']} flights, {stats['updates_read']} updates "
+              f"in {stats['seconds'] * 1000:.0f}ms")
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
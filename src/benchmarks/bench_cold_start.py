@@ -0,0 +1,102 @@
+"""Cold-start cost of the serverless entry point: import time, create_app time and first-request latency.
+
+Each run is a fresh interpreter, like a new Vercel instance. Fails (exit 1) when create_app
+issues SQL, when slow optional modules are imported before a request needs them, or when a
+median exceeds the given budget.
+
+Usage: python benchmarks/bench_cold_start.py [--runs 5] [--path /flights/active]
+                                             [--max-import-ms 1500] [--max-first-request-ms 500]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported lazily by the app; loading any of them during startup is a regression
+LAZY_MODULES = ('numpy', 'requests', 'pyarrow')
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+statements = []
+event.listen(Engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+flask_app = app.create_app()
+created = time.perf_counter()
+startup_statements = len(statements)
+startup_modules = [m for m in {lazy} if m in sys.modules]
+response = flask_app.test_client().get({path!r})
+done = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (done - created) * 1000,
+    'status': response.status_code,
+    'startup_statements': startup_statements,
+    'request_statements': len(statements) - startup_statements,
+    'startup_modules': startup_modules
+}}))
+"""
+
+
+def run_child(path, env):
+    code = CHILD.format(lazy=LAZY_MODULES, path=path)
+    output = subprocess.run([sys.executable, '-c', code], cwd=SRC, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/flights/active')
+    parser.add_argument('--database-url', default=None,
+                        help='bootstrapped database to use (default: a throwaway SQLite file)')
+    parser.add_argument('--max-import-ms', type=float, default=None)
+    parser.add_argument('--max-first-request-ms', type=float, default=None)
+    args = parser.parse_args()
+
+    env = dict(os.environ, WRITE_BEHIND_WORKERS='0', BOOTSTRAP_ON_START='0')
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.database_url:
+            env['DATABASE_URL'] = args.database_url
+        else:
+            env['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'cold_start.db')}"
+            subprocess.run([sys.executable, '-m', 'flask', 'bootstrap'], cwd=SRC, check=True,
+                           env=dict(env, FLASK_APP='app.py'), capture_output=True)
+        results = [run_child(args.path, env) for _ in range(args.runs)]
+
+    failures = []
+    print(f"{args.runs} cold starts, first request GET {args.path} -> {results[0]['status']}")
+    for key in ('import_ms', 'create_app_ms', 'first_request_ms'):
+        values = [r[key] for r in results]
+        print(f"{key:<18} median {statistics.median(values):8.1f}  min {min(values):8.1f}  max {max(values):8.1f}")
+    print(f"SQL during create_app: {results[0]['startup_statements']}, "
+          f"during first request: {results[0]['request_statements']}")
+
+    if any(r['startup_statements'] for r in results):
+        failures.append('create_app issued SQL (schema/seed work belongs in `flask bootstrap`)')
+    loaded = sorted({m for r in results for m in r['startup_modules']})
+    if loaded:
+        failures.append(f"imported at startup: {', '.join(loaded)}")
+    if any(r['status'] >= 500 for r in results):
+        failures.append('first request failed')
+    for key, budget in (('import_ms', args.max_import_ms), ('first_request_ms', args.max_first_request_ms)):
+        median = statistics.median(r[key] for r in results)
+        if budget is not None and median > budget:
+            failures.append(f"{key} median {median:.0f} over budget {budget:.0f}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Grid spatial index vs. a linear haversine scan for airport radius, k-nearest and bounding-box lookups.
+
+Usage: python benchmarks/bench_geo.py [--points 50000] [--queries 1000]
+"""
+import argparse
+import heapq
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.geo_index import GeoGrid, haversine_km, in_bbox
+
+
+def random_points(count, rng):
+    # Clustered like real airports: most around a few hubs, the rest spread over the globe
+    hubs = [(rng.uniform(-60, 70), rng.uniform(-180, 180)) for _ in range(200)]
+    points = {}
+    for i in range(count):
+        if rng.random() < 0.8:
+            lat, lon = rng.choice(hubs)
+            lat, lon = max(-90.0, min(90.0, lat + rng.gauss(0, 3))), (lon + rng.gauss(0, 3) + 180) % 360 - 180
+        else:
+            lat, lon = rng.uniform(-90, 90), rng.uniform(-180, 180)
+        points[f"P{i}"] = (lat, lon)
+    return points
+
+
+def linear_within(points, lat, lon, radius_km):
+    found = [(haversine_km(lat, lon, plat, plon), key) for key, (plat, plon) in points.items()]
+    return sorted((d, k) for d, k in found if d <= radius_km)
+
+
+def linear_nearest(points, lat, lon, k):
+    return heapq.nsmallest(k, ((haversine_km(lat, lon, plat, plon), key) for key, (plat, plon) in points.items()))
+
+
+def linear_bbox(points, bbox):
+    return sorted(key for key, (lat, lon) in points.items() if in_bbox(lat, lon, bbox))
+
+
+def timed(label, queries, grid_fn, linear_fn, same):
+    start = time.perf_counter()
+    grid_results = [grid_fn(q) for q in queries]
+    grid_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    start = time.perf_counter()
+    linear_results = [linear_fn(q) for q in queries]
+    linear_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    mismatches = sum(not same(g, l) for g, l in zip(grid_results, linear_results))
+    print(f"{label:<22} {grid_ms:>10.3f} {linear_ms:>10.3f} {linear_ms / grid_ms:>8.0f}x "
+          f"{'ok' if not mismatches else f'{mismatches} MISMATCHES'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--cell-degrees', type=float, default=1.0)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    points = random_points(args.points, rng)
+    start = time.perf_counter()
+    grid = GeoGrid(args.cell_degrees)
+    for key, (lat, lon) in points.items():
+        grid.insert(key, lat, lon)
+    print(f"indexed {len(grid)} points in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    centers = [(rng.uniform(-80, 80), rng.uniform(-180, 180)) for _ in range(args.queries)]
+    boxes = []
+    for lat, lon in centers:
+        height, width = rng.uniform(0.5, 10), rng.uniform(0.5, 20)
+        max_lon = (lon + width + 180) % 360 - 180  # may wrap across the antimeridian
+        boxes.append((max(-90.0, lat - height / 2), lon, min(90.0, lat + height / 2), max_lon))
+
+    def same_distances(a, b):
+        return [k for _, k in a] == [k for _, k in b] or \
+            all(abs(x[0] - y[0]) < 1e-9 for x, y in zip(a, b)) and len(a) == len(b)
+
+    print(f"{'query':<22} {'grid ms':>10} {'linear ms':>10} {'speedup':>9}")
+    for radius in (50, 250):
+        timed(f"within {radius} km", centers,
+              lambda c: [(d, k) for d, k, _ in grid.within(c[0], c[1], radius)],
+              lambda c: linear_within(points, c[0], c[1], radius), same_distances)
+    for k in (1, 10):
+        timed(f"{k} nearest", centers,
+              lambda c: [(d, key) for d, key, _ in grid.nearest(c[0], c[1], k)],
+              lambda c: linear_nearest(points, c[0], c[1], k), same_distances)
+    timed("bounding box", boxes,
+          lambda b: sorted(key for key, _, _, _ in grid.in_bbox(*b)),
+          lambda b: linear_bbox(points, b), lambda a, b: a == b)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Compare per-record vs batched ingestion throughput.
+
+Usage: python benchmarks/bench_ingest.py [--pages 20] [--page-size 100] [--database-url sqlite://]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from database.models import db, FlightStatus
+from database.airline_registry import airline_registry
+from database.airport_registry import airport_registry
+from database.ingest import fingerprint_cache, store_flight_data, store_flight_batch
+
+STATUSES = ['scheduled', 'active', 'landed', 'cancelled', 'diverted']
+AIRPORTS = ['FRA', 'MUC', 'BER', 'HAM', 'DUS', 'CDG', 'LHR', 'AMS', 'MAD', 'FCO']
+AIRLINES = ['LH', 'FR', 'EW', 'AF', 'BA', 'KL', 'IB', 'AZ']
+
+
+def make_page(page, page_size, base):
+    """Generate one Aviation Stack style page of flight records"""
+    rng = random.Random(page)
+    records = []
+    for i in range(page_size):
+        airline = rng.choice(AIRLINES)
+        dep, arr = rng.sample(AIRPORTS, 2)
+        scheduled = base + timedelta(minutes=rng.randrange(0, 60 * 24 * 7, 5))
+        records.append({
+            'flight_status': rng.choice(STATUSES),
+            'airline': {'name': f"Airline {airline}", 'iata': airline},
+            'flight': {'number': f"{airline}{rng.randrange(100, 9999)}"},
+            'departure': {
+                'iata': dep,
+                'airport': f"Airport {dep}",
+                'scheduled': scheduled.isoformat() + '+00:00',
+                'estimated': scheduled.isoformat() + '+00:00',
+                'delay': rng.choice([None, 0, 15, 130]),
+                'gate': f"A{rng.randrange(1, 40)}",
+            },
+            'arrival': {
+                'iata': arr,
+                'airport': f"Airport {arr}",
+                'scheduled': (scheduled + timedelta(hours=2)).isoformat() + '+00:00',
+            },
+        })
+    return records
+
+
+def make_app(database_url):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def reset_schema():
+    """Empty schema, and forget the process-wide caches that would otherwise point into the dropped one"""
+    db.drop_all()
+    db.create_all()
+    for status in ['SCHEDULED', 'ACTIVE', 'LANDED', 'CANCELLED', 'DIVERTED', 'DELAYED']:
+        db.session.add(FlightStatus(status=status))
+    db.session.commit()
+    airline_registry.invalidate()
+    airport_registry.invalidate()
+    fingerprint_cache.clear()
+
+
+def run(label, store_page, pages):
+    reset_schema()
+    rows = sum(len(p) for p in pages)
+    start = time.perf_counter()
+    for page in pages:
+        store_page(page)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {rows:>7} rows  {elapsed:8.3f}s  {rows / elapsed:10.0f} rows/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL', 'sqlite:///bench_ingest.db'))
+    args = parser.parse_args()
+
+    base = datetime(2024, 1, 1)
+    pages = [make_page(p, args.page_size, base) for p in range(args.pages)]
+    app = make_app(args.database_url)
+    with app.app_context():
+        per_record = run('per-record', lambda page: [store_flight_data(r, {}) for r in page], pages)
+        batched = run('batched', lambda page: store_flight_batch(page, {}), pages)
+        db.drop_all()
+    print(f"speedup: {per_record / batched:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Phase-driven per-flight refresh (FlightRefreshQueue) vs. round-robin at the same daily call budget.
+
+Simulates one day minute by minute over flights departing in the next two days. A
+refresh stores the flight's true state at that moment; the report is how long
+departures and landings take to show up in the database and how old the data of
+flights in their boarding window is.
+
+Usage: python benchmarks/bench_refresh.py [--flights 2000] [--calls-per-day 3000]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.models import db, Flight
+from database.refresh_schedule import BOARDING_WINDOW, DEPARTURE_GRACE, OPEN_STATUSES, FlightRefreshQueue
+from bench_ingest import make_app, reset_schema
+
+STEP = timedelta(minutes=1)
+RELOAD_EVERY = 15  # steps between reloads of the open flights, like the poller's replan
+
+
+class Truth:
+    """What upstream would report for one flight at any moment"""
+
+    def __init__(self, rng, start):
+        self.scheduled = start + timedelta(minutes=rng.randrange(-120, 46 * 60, 5))
+        delay = timedelta(minutes=rng.randrange(15, 90, 5)) if rng.random() < 0.3 else timedelta(0)
+        self.departure = self.scheduled + delay
+        self.arrival = self.departure + timedelta(minutes=rng.randrange(60, 240, 5))
+
+    def state(self, now):
+        status = 'SCHEDULED' if now < self.departure else 'ACTIVE' if now < self.arrival else 'LANDED'
+        # Delays become known three hours ahead
+        estimated = self.departure if now >= self.scheduled - timedelta(hours=3) else self.scheduled
+        return {'status': status, 'estimated_departure': estimated,
+                'estimated_arrival': self.arrival - self.departure + estimated}
+
+
+def seed(truths, start, rng):
+    reset_schema()
+    db.session.execute(Flight.__table__.insert(), [{
+        'flight_id': i + 1, 'flight_number': f"X{i}", 'airline_id': 1,
+        'departure_airport': 'FRA', 'arrival_airport': 'MUC',
+        'scheduled_departure': t.scheduled, 'scheduled_arrival': t.scheduled + (t.arrival - t.departure),
+        'status': 'SCHEDULED', 'status_updated_at': start - timedelta(minutes=rng.randrange(0, 360))
+    } for i, t in enumerate(truths)])
+    db.session.commit()
+
+
+def refresh(flight_id, truth, now, seen):
+    """Store the true state as ingestion would, noting when departure and landing became visible"""
+    state = truth.state(now)
+    flight = db.session.get(Flight, flight_id)
+    if any(getattr(flight, k) != v for k, v in state.items()):
+        for k, v in state.items():
+            setattr(flight, k, v)
+        flight.status_updated_at = now
+    db.session.commit()
+    seen['last'][flight_id] = now
+    if state['status'] != 'SCHEDULED':
+        seen['ACTIVE'].setdefault(flight_id, now)
+    if state['status'] == 'LANDED':
+        seen['LANDED'].setdefault(flight_id, now)
+
+
+def simulate(mode, truths, start, calls_per_day, rng):
+    seed(truths, start, rng)
+    seen = {'last': {}, 'ACTIVE': {}, 'LANDED': {}}
+    queue = FlightRefreshQueue()
+    order, cursor = [], 0
+    credit, calls, ages = 0.0, 0, []
+    now = start
+    for step in range(24 * 60):
+        if step % RELOAD_EVERY == 0:
+            if mode == 'adaptive':
+                queue.load(now, calls_per_day)
+            else:
+                order = [f for f, in db.session.query(Flight.flight_id).filter(
+                    Flight.status.in_(OPEN_STATUSES),
+                    Flight.scheduled_departure >= now - queue.lookback,
+                    Flight.scheduled_departure < now + queue.horizon).order_by(Flight.flight_id)]
+        credit += calls_per_day / (24 * 60)
+        while credit >= 1:
+            if mode == 'adaptive':
+                if queue.next_due() is None or queue.next_due() > now:
+                    break
+                flight_id = queue.pop().flight_id
+            else:
+                if not order:
+                    break
+                flight_id = order[cursor % len(order)]
+                cursor += 1
+            refresh(flight_id, truths[flight_id - 1], now, seen)
+            if mode == 'adaptive':
+                queue.refreshed(flight_id, now)
+            credit -= 1
+            calls += 1
+        # Unused credit is not banked beyond a few calls, like a paced poller
+        credit = min(credit, 5.0)
+        if step % 5 == 0:
+            for i, t in enumerate(truths, 1):
+                if t.departure - BOARDING_WINDOW <= now < t.departure + DEPARTURE_GRACE:
+                    ages.append((now - seen['last'].get(i, start)).total_seconds() / 60)
+        now += STEP
+
+    end = now
+    lags = {}
+    for status, attr in (('ACTIVE', 'departure'), ('LANDED', 'arrival')):
+        changes = [(i, getattr(t, attr)) for i, t in enumerate(truths, 1) if start <= getattr(t, attr) < end]
+        lags[status] = [((seen[status].get(i) or end) - at).total_seconds() / 60 for i, at in changes]
+    return calls, lags, ages
+
+
+def describe(values):
+    if not values:
+        return '-'
+    p90 = statistics.quantiles(values, n=10)[-1] if len(values) > 1 else values[0]
+    return f"mean {statistics.mean(values):7.1f}  p90 {p90:7.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--flights', type=int, default=2000)
+    parser.add_argument('--calls-per-day', type=int, default=3000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    app = make_app('sqlite://')
+    start = datetime(2024, 6, 1, 0, 0)
+    with app.app_context():
+        for mode in ('round-robin', 'adaptive'):
+            rng = random.Random(args.seed)
+            truths = [Truth(rng, start) for _ in range(args.flights)]
+            calls, lags, ages = simulate(mode, truths, start, args.calls_per_day, rng)
+            print(f"{mode} ({calls} calls for {args.flights} flights)")
+            print(f"  departure visible after (min) {describe(lags['ACTIVE'])}")
+            print(f"  landing visible after (min)   {describe(lags['LANDED'])}")
+            print(f"  data age while boarding (min) {describe(ages)}")
+
+
+if __name__ == '__main__':
+    main()
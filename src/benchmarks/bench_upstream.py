@@ -0,0 +1,79 @@
+"""Measure AviationService latency and failure handling against the local fake upstream.
+
+Usage: python benchmarks/bench_upstream.py [--requests 200] [--latency 0.01]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+from fake_aviationstack import FakeAviationStack
+from api.aviation_service import AviationService
+
+
+def make_service(base_url, **overrides):
+    os.environ['AVIATION_API_KEY'] = 'bench'
+    service = AviationService(cache=None)
+    service.base_url = base_url
+    for name, value in overrides.items():
+        setattr(service, name, value)
+    return service
+
+
+def timed(label, n, call):
+    samples, errors = [], 0
+    for _ in range(n):
+        start = time.perf_counter()
+        try:
+            call()
+        except ValueError:
+            errors += 1
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:<28} p50 {statistics.median(samples):7.2f}ms  p99 {p99:7.2f}ms  errors {errors}/{n}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.01)
+    args = parser.parse_args()
+    n = args.requests
+
+    server = FakeAviationStack(latency=args.latency).start()
+    url = f"{server.base_url}/flights"
+
+    # Connection reuse
+    timed('bare requests.get', n, lambda: requests.get(url, params={'access_key': 'k', 'limit': 10}).json())
+    service = make_service(server.base_url)
+    timed('pooled session', n, lambda: service.get_live_flights(limit=10))
+
+    # Transient 5xx absorbed by retries
+    server.error_rate = 0.2
+    timed('20% 503, no retries', n, make_service(server.base_url, max_retries=0).get_live_flights)
+    timed('20% 503, 3 retries', n, make_service(server.base_url, backoff_base=0.01).get_live_flights)
+    server.error_rate = 0.0
+
+    # Hung upstream bounded by the read timeout
+    server.latency = 1.0
+    timed('hung upstream, 0.2s timeout', 5,
+          make_service(server.base_url, timeout=(0.5, 0.2), max_retries=0).get_live_flights)
+    server.latency = args.latency
+
+    # Hard outage: circuit breaker fails fast once open
+    server.down = True
+    server.requests = 0
+    service = make_service(server.base_url, max_retries=0)
+    timed('outage, breaker', n, service.get_live_flights)
+    print(f"breaker state: {service.breaker.state}, upstream requests during outage: {server.requests}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
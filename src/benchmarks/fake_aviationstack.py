@@ -0,0 +1,128 @@
+"""Local stand-in for api.aviationstack.com with configurable latency and failures.
+
+Usage: python benchmarks/fake_aviationstack.py [--port 8099] [--latency 0.05] [--error-rate 0.1]
+Then point the app at it with AVIATION_BASE_URL=http://127.0.0.1:8099/v1
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_ingest import make_page
+
+
+class FakeAviationStack(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, error_rate=0.0, rate_limit_rate=0.0,
+                 retry_after=None, total=1000):
+        super().__init__(('127.0.0.1', port), _Handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.total = total
+        self.down = False
+        # Statuses to answer the next requests with, in order, before the random failures apply
+        self.script = deque()
+        self.requests = 0
+        self.connections = set()
+        self.rng = random.Random(0)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def handle_error(self, request, client_address):
+        # Clients giving up on a slow response (read timeouts) are expected here
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+    def start(self, poll_interval=0.5):
+        threading.Thread(target=self.serve_forever, args=(poll_interval,), daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Send headers and body in one segment so keep-alive clients don't hit delayed ACKs
+    wbufsize = 1 << 16
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        server.connections.add(self.client_address)
+        if server.latency:
+            time.sleep(server.latency)
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if not params.get('access_key'):
+            return self._send(401, {'error': {'message': 'missing access_key'}})
+        try:
+            status = server.script.popleft()
+        except IndexError:
+            status = None
+            if server.down or server.rng.random() < server.error_rate:
+                status = 503
+            elif server.rng.random() < server.rate_limit_rate:
+                status = 429
+        if status == 429:
+            headers = {'Retry-After': str(server.retry_after)} if server.retry_after is not None else {}
+            return self._send(429, {'error': {'message': 'rate limited'}}, headers)
+        if status is not None and status != 200:
+            return self._send(status, {'error': {'message': 'upstream unavailable'}})
+
+        limit = int(params.get('limit', 100))
+        offset = int(params.get('offset', 0))
+        count = max(0, min(limit, server.total - offset))
+        data = make_page(offset // max(limit, 1), count, datetime(2024, 1, 1))
+        for key, path in (('flight_number', ('flight', 'number')),
+                          ('airline_iata', ('airline', 'iata')),
+                          ('dep_iata', ('departure', 'iata')),
+                          ('arr_iata', ('arrival', 'iata'))):
+            if key in params:
+                data = [r for r in data if r[path[0]].get(path[1]) == params[key]]
+        self._send(200, {
+            'pagination': {'limit': limit, 'offset': offset, 'count': len(data), 'total': server.total},
+            'data': data
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--total', type=int, default=1000)
+    args = parser.parse_args()
+    server = FakeAviationStack(args.port, args.latency, args.error_rate, args.rate_limit_rate, total=args.total)
+    print(f"Serving fake Aviation Stack on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
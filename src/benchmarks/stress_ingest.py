@@ -0,0 +1,139 @@
+"""Concurrent ingestion from several processes into one database, then a check that nothing was lost.
+
+Every worker stores the same pages in its own shuffled order, so airlines, airports
+and flights are created concurrently by different processes. A record counts as lost
+when storing it fails with anything but a lock wait/deadlock (which a worker retries).
+
+Usage: python benchmarks/stress_ingest.py [--workers 8] [--pages 40] [--mode batch|single]
+                                          [--database-url mysql+pymysql://user:pw@host/db]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.exc import OperationalError
+from database.models import db, Airline, Flight, FlightStatusUpdate
+from database.ingest import store_flight_batch, store_flight_data
+from bench_ingest import AIRPORTS, STATUSES, make_app, reset_schema
+
+LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+RETRIES = 20
+
+
+def make_pages(pages, page_size, airlines, seed=7):
+    """Pages of records over `airlines` fresh carrier codes; pairs of carriers share an ICAO code"""
+    rng = random.Random(seed)
+    codes = [a + b for a in LETTERS for b in LETTERS][:airlines]
+    icao = {code: f"X{LETTERS[i // 10 // 36]}{LETTERS[i // 10 % 36]}" if i % 10 < 2 else f"Y{code}"
+            for i, code in enumerate(codes)}
+    base = datetime(2024, 1, 1)
+    result = []
+    for p in range(pages):
+        records = []
+        for i in range(page_size):
+            code = rng.choice(codes)
+            dep, arr = rng.sample(AIRPORTS, 2)
+            scheduled = base + timedelta(minutes=5 * (p * page_size + i))
+            records.append({
+                'flight_status': rng.choice(STATUSES),
+                'airline': {'name': f"Airline {code}", 'iata': code, 'icao': icao[code]},
+                'flight': {'number': f"{code}{p * page_size + i}"},
+                'departure': {'iata': dep, 'scheduled': scheduled.isoformat() + '+00:00',
+                              'delay': rng.choice([0, 15, 130])},
+                'arrival': {'iata': arr, 'scheduled': (scheduled + timedelta(hours=2)).isoformat() + '+00:00'},
+            })
+        result.append(records)
+    return result
+
+
+def worker(index, args, barrier, results):
+    pages = make_pages(args.pages, args.page_size, args.airlines)
+    random.Random(index).shuffle(pages)
+    app = make_app(args.database_url)
+    stats = {'stored': 0, 'retries': 0, 'lost': 0, 'errors': []}
+    with app.app_context():
+        barrier.wait()
+        units = pages if args.mode == 'batch' else [[r] for page in pages for r in page]
+        for unit in units:
+            for attempt in range(RETRIES):
+                try:
+                    if args.mode == 'batch':
+                        store_flight_batch(unit, {})
+                    else:
+                        store_flight_data(unit[0], {})
+                    stats['stored'] += len(unit)
+                    break
+                except OperationalError as e:  # lock timeout / deadlock: the transaction was rolled back
+                    stats['retries'] += 1
+                    if attempt == RETRIES - 1:
+                        stats['lost'] += len(unit)
+                        stats['errors'].append(str(e.orig))
+                    time.sleep(random.random() * 0.05)
+                except Exception as e:
+                    stats['lost'] += len(unit)
+                    stats['errors'].append(f"{type(e).__name__}: {e}"[:200])
+                    break
+    results.put(stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--pages', type=int, default=40)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--airlines', type=int, default=300)
+    parser.add_argument('--mode', choices=('batch', 'single'), default='batch')
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL', 'sqlite:///stress_ingest.db'))
+    args = parser.parse_args()
+
+    app = make_app(args.database_url)
+    with app.app_context():
+        reset_schema()
+        db.engine.dispose()  # no inherited connections in the workers
+
+    barrier = multiprocessing.Barrier(args.workers)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(i, args, barrier, results))
+                 for i in range(args.workers)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    stats = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    pages = make_pages(args.pages, args.page_size, args.airlines)
+    expected_flights = {r['flight']['number'] for page in pages for r in page}
+    expected_airlines = {r['airline']['iata'] for page in pages for r in page}
+    with app.app_context():
+        flights = {n for n, in db.session.query(Flight.flight_number)}
+        airlines = [c for c, in db.session.query(Airline.iata_code)]
+        without_updates = db.session.query(Flight.flight_id)\
+            .outerjoin(FlightStatusUpdate, FlightStatusUpdate.flight_id == Flight.flight_id)\
+            .filter(FlightStatusUpdate.update_id.is_(None)).count()
+        db.drop_all()
+
+    lost = sum(s['lost'] for s in stats)
+    print(f"{args.workers} workers x {len(expected_flights)} records ({args.mode}) in {elapsed:.1f}s, "
+          f"{sum(s['retries'] for s in stats)} lock retries")
+    print(f"records lost to errors:      {lost}")
+    for error in sorted({e for s in stats for e in s['errors']})[:5]:
+        print(f"  {error}")
+    print(f"flights missing:             {len(expected_flights - flights)} of {len(expected_flights)}")
+    print(f"airlines missing/duplicated: {len(expected_airlines - set(airlines))}/{len(airlines) - len(set(airlines))}")
+    print(f"flights without a status:    {without_updates}")
+    ok = not lost and expected_flights <= flights and set(airlines) == expected_airlines \
+        and len(airlines) == len(set(airlines)) and not without_updates
+    print('OK' if ok else 'DATA LOSS')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
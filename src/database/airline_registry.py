@@ -0,0 +1,61 @@
+import threading
+from typing import Dict, Iterable
+
+from database.models import db, Airline
+
+
+class AirlineRegistry:
+    """Process-wide IATA code -> airline_id map, so ingestion skips the airlines lookup for known carriers.
+
+    Warmed with every stored airline by the first lookup. Airlines are never
+    renamed or deleted by the app, so entries stay valid once learned; callers
+    only `remember` ids after the transaction that read or created them has
+    committed, so a rollback never leaves a dangling id behind.
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._warmed = False
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def warm(self) -> int:
+        """Load every stored airline (done by the first lookup)"""
+        ids = dict(db.session.query(Airline.iata_code, Airline.airline_id)
+                   .filter(Airline.iata_code.isnot(None)).all())
+        with self._lock:
+            self._ids.update(ids)
+            self._warmed = True
+        return len(ids)
+
+    def lookup(self, codes: Iterable[str]) -> Dict[str, int]:
+        """Known airline_id for each code; unknown codes are left out"""
+        if not self._warmed:
+            self.warm()
+        found = {}
+        with self._lock:
+            for code in codes:
+                airline_id = self._ids.get(code)
+                if airline_id is None:
+                    self.stats['misses'] += 1
+                else:
+                    self.stats['hits'] += 1
+                    found[code] = airline_id
+        return found
+
+    def remember(self, ids: Dict[str, int]) -> None:
+        with self._lock:
+            self._ids.update(ids)
+
+    def invalidate(self) -> None:
+        """Forget everything (e.g. after the airlines table was rebuilt)"""
+        with self._lock:
+            self._ids.clear()
+            self._warmed = False
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {'entries': len(self._ids), **self.stats}
+
+
+airline_registry = AirlineRegistry()
@@ -0,0 +1,158 @@
+import bisect
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from database.geo_index import GeoGrid
+from database.models import db, Airport
+
+logger = logging.getLogger(__name__)
+
+# EU countries plus Norway and Switzerland
+EUROPEAN_COUNTRIES = (
+    'Austria', 'Belgium', 'Bulgaria', 'Croatia', 'Cyprus', 'Czech Republic',
+    'Denmark', 'Estonia', 'Finland', 'France', 'Germany', 'Greece', 'Hungary',
+    'Ireland', 'Italy', 'Latvia', 'Lithuania', 'Luxembourg', 'Malta',
+    'Netherlands', 'Poland', 'Portugal', 'Romania', 'Slovakia', 'Slovenia',
+    'Spain', 'Sweden', 'United Kingdom', 'Norway', 'Switzerland'
+)
+REGIONS = {'europe': frozenset(EUROPEAN_COUNTRIES)}
+
+FIELDS = ('iata_code', 'icao_code', 'name', 'city', 'country', 'latitude', 'longitude', 'timezone')
+LIST_FIELDS = ('iata_code', 'name', 'city', 'country', 'latitude', 'longitude')
+
+ReferenceData = Union[None, Dict[str, Dict], Callable[[], Dict[str, Dict]]]
+
+
+def _dumps(value) -> bytes:
+    return json.dumps(value, sort_keys=True, separators=(',', ':')).encode()
+
+
+class _Snapshot:
+    """Immutable view of all airports; readers keep whichever snapshot they grabbed"""
+
+    def __init__(self, stored: List[Dict], reference: Dict[str, Dict], version: int):
+        self.version = version
+        self.by_iata: Dict[str, Dict] = {}
+        # Curated reference data first, airports table rows override it but keep its non-empty fields
+        for code, info in reference.items():
+            self.by_iata[code] = {f: info.get(f) for f in FIELDS}
+        for row in stored:
+            merged = dict(self.by_iata.get(row['iata_code'], {}))
+            merged.update({f: v for f, v in row.items() if v not in (None, 'Unknown') or f not in merged})
+            self.by_iata[row['iata_code']] = merged
+        self.by_icao = {a['icao_code']: a for a in self.by_iata.values() if a.get('icao_code')}
+        self.stored = frozenset(row['iata_code'] for row in stored)
+
+        # /airports lists the airports table in IATA order, one pre-serialized fragment per airport
+        self.codes = sorted(self.stored)
+        self.fragments = [_dumps({f: self.by_iata[c][f] for f in LIST_FIELDS}) for c in self.codes]
+        self.by_country: Dict[str, List[str]] = {}
+        for code in self.codes:
+            self.by_country.setdefault(self.by_iata[code]['country'], []).append(code)
+        self.digest = hashlib.sha1(b'\n'.join(self.fragments)).hexdigest()[:16]
+        self._regions: Dict[str, Tuple[bytes, str]] = {}
+        self._geo: Optional[GeoGrid] = None
+
+    @property
+    def geo(self) -> GeoGrid:
+        """Spatial index over every catalogued airport with coordinates (built on first use)"""
+        if self._geo is None:
+            grid = GeoGrid()
+            for code, airport in self.by_iata.items():
+                if airport.get('latitude') is not None and airport.get('longitude') is not None:
+                    grid.insert(code, airport['latitude'], airport['longitude'], airport)
+            self._geo = grid
+        return self._geo
+
+    def page(self, after: Optional[str], limit: int) -> Tuple[bytes, str, Optional[str]]:
+        """(JSON body, ETag, last code when more remain) for airports after `after`"""
+        start = bisect.bisect_right(self.codes, after) if after else 0
+        end = min(len(self.codes), start + limit)
+        body = b'[' + b','.join(self.fragments[start:end]) + b']'
+        etag = f"{self.digest}-{start}-{end}"
+        return body, etag, (self.codes[end - 1] if end < len(self.codes) else None)
+
+    def region(self, name: str) -> Tuple[bytes, str]:
+        """(JSON body, ETag) of all airports in a region, serialized once per snapshot"""
+        cached = self._regions.get(name)
+        if cached is None:
+            countries = REGIONS[name]
+            codes = [c for country, codes in self.by_country.items() if country in countries for c in codes]
+            body = _dumps([{f: self.by_iata[c][f] for f in LIST_FIELDS} for c in sorted(codes)])
+            cached = self._regions[name] = (body, hashlib.sha1(body).hexdigest()[:16])
+        return cached
+
+
+class AirportRegistry:
+    """In-process airport index built from data/airports.json and the airports table.
+
+    Ingestion calls `invalidate()` after committing new airports; other processes
+    notice new rows through a cheap periodic count check.
+    """
+
+    def __init__(self, reference: ReferenceData = None, check_interval: float = 60.0):
+        # Curated airport data, or a function returning it (called on each rebuild)
+        self.reference = reference or {}
+        self.check_interval = check_interval
+        self._snapshot: Optional[_Snapshot] = None
+        self._version = 0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def configure(self, reference: ReferenceData, check_interval: Optional[float] = None) -> None:
+        self.reference = reference
+        if check_interval is not None:
+            self.check_interval = check_interval
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """Mark the snapshot stale; the next read rebuilds it"""
+        with self._lock:
+            self._version += 1
+
+    def _load(self) -> _Snapshot:
+        version = self._version  # taken first so an invalidation during the read forces another rebuild
+        rows = [dict(zip(FIELDS, row)) for row in
+                db.session.query(*(getattr(Airport, f) for f in FIELDS)).all()]
+        reference = self.reference() if callable(self.reference) else self.reference
+        return _Snapshot(rows, reference, version)
+
+    def snapshot(self) -> _Snapshot:
+        """Current snapshot, rebuilt after invalidation or when another process added airports"""
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and snapshot.version == self._version:
+            if now - self._checked_at < self.check_interval:
+                return snapshot
+            self._checked_at = now
+            count = db.session.query(db.func.count(Airport.iata_code)).scalar()
+            if count == len(snapshot.stored):
+                return snapshot
+            self.invalidate()
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version != self._version:
+                self._snapshot = self._load()
+                self._checked_at = now
+                logger.debug("Airport registry rebuilt: %s airports", len(self._snapshot.by_iata))
+            return self._snapshot
+
+    def get(self, code: str) -> Optional[Dict]:
+        """Airport by IATA or ICAO code"""
+        if not code:
+            return None
+        snapshot = self.snapshot()
+        code = code.upper()
+        return snapshot.by_iata.get(code) or snapshot.by_icao.get(code)
+
+    def missing(self, codes) -> List[str]:
+        """Codes not yet stored in the airports table"""
+        stored = self.snapshot().stored
+        return [c for c in codes if c not in stored]
+
+
+airport_registry = AirportRegistry(check_interval=float(os.getenv('AIRPORT_REGISTRY_CHECK_INTERVAL', '60')))
@@ -0,0 +1,200 @@
+import logging
+import os
+import queue
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from database.models import db, Airline, Flight, FlightStatusUpdate
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """One stream client: its filters and a bounded queue of pending events"""
+
+    def __init__(self, flight_ids: Iterable[int] = (), airlines: Iterable[str] = (),
+                 airports: Iterable[str] = (), statuses: Iterable[str] = (), maxsize: int = 1000):
+        self.flight_ids = frozenset(flight_ids)
+        self.airlines = frozenset(airlines)
+        self.airports = frozenset(airports)
+        self.statuses = frozenset(statuses)
+        self.queue: 'queue.Queue[Dict]' = queue.Queue(maxsize)
+        # Set when the client fell behind and was dropped; it resumes from Last-Event-ID
+        self.lagged = False
+
+    def matches(self, event: Dict) -> bool:
+        return (not self.flight_ids or event['flight_id'] in self.flight_ids) \
+            and (not self.airlines or event.get('airline') in self.airlines) \
+            and (not self.airports or event.get('departure') in self.airports
+                 or event.get('arrival') in self.airports) \
+            and (not self.statuses or event['status'] in self.statuses)
+
+
+def _event(row) -> Dict:
+    """Compact change event of a status update row (None fields left out)"""
+    event = {
+        'id': row.update_id,
+        'flight_id': row.flight_id,
+        'flight_number': row.flight_number,
+        'airline': row.airline,
+        'departure': row.departure_airport,
+        'arrival': row.arrival_airport,
+        'status': row.status,
+        'delay_minutes': row.delay_minutes,
+        'departure_gate': row.departure_gate,
+        'arrival_gate': row.arrival_gate,
+        'estimated_departure': row.estimated_departure.isoformat() if row.estimated_departure else None,
+        'actual_departure': row.actual_departure.isoformat() if row.actual_departure else None,
+        'time': row.status_update_time.isoformat() if row.status_update_time else None
+    }
+    return {k: v for k, v in event.items() if v is not None}
+
+
+class ChangeFeed:
+    """In-process pub/sub of flight status changes, tailing flight_status_updates by update_id.
+
+    While anyone is subscribed, one thread per process reads new update rows (a
+    primary-key range scan) and fans them out to matching subscribers. Ingestion
+    calls `notify()` after committing, so local writes are pushed at once; writes
+    from other workers arrive within `poll_interval` seconds.
+    """
+
+    def __init__(self, poll_interval: float = 2.0, batch_size: int = 500, queue_size: int = 1000,
+                 overlap: int = 200, max_subscribers: int = 25):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        # Each subscriber holds a worker thread or greenlet for as long as its stream is open (0: no cap)
+        self.max_subscribers = max_subscribers
+        # Ids below the watermark can still commit late; re-read this many and skip the ones already sent
+        self.overlap = overlap
+        self.app = None
+        self._subscribers: List[Subscription] = []
+        self._last_id: Optional[int] = None
+        self._start_id = 0  # rows up to here existed before tailing began; replays cover them
+        self._sent: set = set()  # published ids within the overlap window
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {'published': 0, 'delivered': 0, 'dropped_subscribers': 0, 'rejected_subscribers': 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            poll_interval=float(os.getenv('STREAM_POLL_INTERVAL', '2')),
+            queue_size=int(os.getenv('STREAM_QUEUE_SIZE', '1000')),
+            max_subscribers=int(os.getenv('STREAM_MAX_SUBSCRIBERS', '25'))
+        )
+
+    def init_app(self, app) -> None:
+        self.app = app
+
+    def read(self, after: int, limit: int, subscription: Optional[Subscription] = None) -> List[Dict]:
+        """Change events with update_id > `after` in id order, filtered in SQL by `subscription`"""
+        query = db.session.query(
+            FlightStatusUpdate.update_id, FlightStatusUpdate.flight_id, Flight.flight_number,
+            Airline.iata_code.label('airline'), Flight.departure_airport, Flight.arrival_airport,
+            FlightStatusUpdate.status, FlightStatusUpdate.delay_minutes,
+            FlightStatusUpdate.departure_gate, FlightStatusUpdate.arrival_gate,
+            FlightStatusUpdate.estimated_departure, FlightStatusUpdate.actual_departure,
+            FlightStatusUpdate.status_update_time
+        ).join(Flight, Flight.flight_id == FlightStatusUpdate.flight_id)\
+            .join(Airline, Airline.airline_id == Flight.airline_id)\
+            .filter(FlightStatusUpdate.update_id > after)
+        if subscription is not None:
+            if subscription.flight_ids:
+                query = query.filter(FlightStatusUpdate.flight_id.in_(subscription.flight_ids))
+            if subscription.airlines:
+                query = query.filter(Airline.iata_code.in_(subscription.airlines))
+            if subscription.airports:
+                query = query.filter(db.or_(Flight.departure_airport.in_(subscription.airports),
+                                            Flight.arrival_airport.in_(subscription.airports)))
+            if subscription.statuses:
+                query = query.filter(FlightStatusUpdate.status.in_(subscription.statuses))
+        return [_event(row) for row in query.order_by(FlightStatusUpdate.update_id).limit(limit)]
+
+    def subscribe(self, subscription: Subscription) -> bool:
+        """Start delivering events committed from now on (call within an app context).
+
+        False, and nothing delivered, when the process already serves `max_subscribers` streams.
+        """
+        with self._lock:
+            if self.max_subscribers and len(self._subscribers) >= self.max_subscribers:
+                self.stats['rejected_subscribers'] += 1
+                return False
+            if self._last_id is None:
+                # Synchronous, so a replay run after subscribing overlaps the live feed rather than missing rows
+                self._last_id = db.session.query(db.func.max(FlightStatusUpdate.update_id)).scalar() or 0
+                self._start_id = self._last_id
+            self._subscribers.append(subscription)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return True
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def notify(self) -> None:
+        """New status updates were committed: poll now instead of at the next interval"""
+        if self._subscribers:
+            self._wake.set()
+
+    def publish(self, events: List[Dict]) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        self.stats['published'] += len(events)
+        for subscription in subscribers:
+            for event in events:
+                if not subscription.matches(event):
+                    continue
+                try:
+                    subscription.queue.put_nowait(event)
+                    self.stats['delivered'] += 1
+                except queue.Full:
+                    # A slow client must not hold events for everyone; it replays from the database instead
+                    subscription.lagged = True
+                    self.unsubscribe(subscription)
+                    self.stats['dropped_subscribers'] += 1
+                    break
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            with self._lock:
+                if not self._subscribers:
+                    # Idle: stop tailing; the next subscriber starts again from the current max id
+                    self._last_id = None
+                    self._sent.clear()
+                    self._thread = None
+                    return
+                last_id = self._last_id
+            try:
+                with self.app.app_context():
+                    rows = self.read(max(0, last_id - self.overlap), self.batch_size + self.overlap)
+                    db.session.remove()
+            except Exception:
+                logger.exception("Change feed poll failed")
+                continue
+            events = [e for e in rows if e['id'] > self._start_id and e['id'] not in self._sent]
+            if events:
+                with self._lock:
+                    self._last_id = max(last_id, events[-1]['id'])
+                    self._sent.update(e['id'] for e in events)
+                    floor = self._last_id - self.overlap
+                    self._sent = {i for i in self._sent if i > floor}
+                self.publish(events)
+            if sum(e['id'] > last_id for e in rows) >= self.batch_size:
+                self._wake.set()  # more rows are waiting
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {'subscribers': len(self._subscribers), 'max_subscribers': self.max_subscribers,
+                    'last_id': self._last_id, **self.stats}
+
+
+change_feed = ChangeFeed.from_env()
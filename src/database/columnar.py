@@ -0,0 +1,353 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from database.models import db, Airline, Airport, Flight, FlightStatusUpdate
+
+np = None  # imported by the first snapshot rather than on every cold start
+
+
+def _import_numpy() -> bool:
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:  # analytics endpoints report 503 without numpy
+            return False
+        np = numpy
+    return True
+
+logger = logging.getLogger(__name__)
+
+# delay is 0 where delay_minutes is NULL; has_delay marks the rows that have one, as SQL AVG/MAX skip NULLs
+FLIGHT_COLUMNS = ('flight_id', 'airline_id', 'departure', 'arrival', 'status', 'scheduled', 'delay', 'has_delay')
+UPDATE_COLUMNS = ('update_id', 'flight_id', 'status', 'time')
+
+
+class Dictionary:
+    """Dictionary encoding of a low-cardinality string column (append-only codes)"""
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def encode(self, value: Optional[str]) -> int:
+        value = value or ''
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def encode_many(self, values) -> 'np.ndarray':
+        return np.fromiter((self.encode(v) for v in values), dtype=np.int32, count=len(values))
+
+    def __len__(self):
+        return len(self.values)
+
+
+def _epoch_seconds(values) -> 'np.ndarray':
+    return np.array(values, dtype='datetime64[s]').astype(np.int64)
+
+
+def _group(keys: 'np.ndarray', *values: 'np.ndarray'):
+    """Sort-based group-by: (unique keys, counts, sorted values per column, group offsets)"""
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1]))) if len(keys) else np.array([], dtype=np.int64)
+    counts = np.diff(np.append(starts, len(keys)))
+    return keys[starts], counts, [v[order] for v in values], starts
+
+
+class ColumnarSnapshot:
+    """NumPy column store of flights and status updates for the ad-hoc reports.
+
+    Airports and statuses are dictionary-encoded, timestamps are int64 epoch
+    seconds. `refresh()` pulls only status updates and flights past the last
+    update_id/flight_id watermark and re-reads flights touched by new updates;
+    once rows below the watermarks were deleted (retention, compaction) it
+    reloads everything. Columns are never modified in place: each refresh
+    builds new arrays and swaps them in, so readers always see one consistent set.
+    """
+
+    def __init__(self, refresh_interval: float = 30.0, batch_size: int = 50000, overlap: int = 1000):
+        if not _import_numpy():
+            raise RuntimeError("Columnar analytics requires numpy")
+        self.refresh_interval = refresh_interval
+        self.batch_size = batch_size
+        # Ids below the watermark can still commit late; re-read this many so they are not missed
+        self.overlap = overlap
+        self.airports = Dictionary()
+        self.statuses = Dictionary()
+        self.flights = self._empty(FLIGHT_COLUMNS)
+        self.updates = self._empty(UPDATE_COLUMNS)
+        self.airline_names: Dict[int, str] = {}
+        self.airport_info: Dict[str, Dict] = {}
+        self.refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build a snapshot from ANALYTICS_* environment variables (None without numpy or when disabled)"""
+        if os.getenv('ANALYTICS_ENABLED', '1') == '0' or not _import_numpy():
+            return None
+        return cls(
+            refresh_interval=float(os.getenv('ANALYTICS_REFRESH_INTERVAL', '30')),
+            batch_size=int(os.getenv('ANALYTICS_BATCH_SIZE', '50000'))
+        )
+
+    @staticmethod
+    def _empty(names) -> Dict:
+        return {name: np.empty(0, dtype=bool if name == 'has_delay' else np.int64) for name in names}
+
+    def _watermark(self, columns: Dict, key: str) -> int:
+        return int(columns[key][-1]) if len(columns[key]) else 0
+
+    def _read_flights(self, query) -> Dict:
+        rows = query.all()
+        return {
+            'flight_id': np.fromiter((r.flight_id for r in rows), dtype=np.int64, count=len(rows)),
+            'airline_id': np.fromiter((r.airline_id for r in rows), dtype=np.int64, count=len(rows)),
+            'departure': self.airports.encode_many([r.departure_airport for r in rows]),
+            'arrival': self.airports.encode_many([r.arrival_airport for r in rows]),
+            'status': self.statuses.encode_many([r.status for r in rows]),
+            'scheduled': _epoch_seconds([r.scheduled_departure for r in rows]),
+            'delay': np.fromiter((r.delay_minutes or 0 for r in rows), dtype=np.int32, count=len(rows)),
+            'has_delay': np.fromiter((r.delay_minutes is not None for r in rows), dtype=bool, count=len(rows))
+        }
+
+    def _read_updates(self, rows) -> Dict:
+        return {
+            'update_id': np.fromiter((r.update_id for r in rows), dtype=np.int64, count=len(rows)),
+            'flight_id': np.fromiter((r.flight_id for r in rows), dtype=np.int64, count=len(rows)),
+            'status': self.statuses.encode_many([r.status for r in rows]),
+            'time': _epoch_seconds([r.status_update_time for r in rows])
+        }
+
+    @staticmethod
+    def _merge_flights(flights: Dict, fresh: Dict) -> Dict:
+        """New columns with the rows of `fresh` overwriting those held (by flight_id) or inserted in flight_id order"""
+        new_ids = fresh['flight_id']
+        if not len(new_ids):
+            return flights
+        if len(new_ids) > 1 and (new_ids[1:] < new_ids[:-1]).any():
+            order = np.argsort(new_ids, kind='stable')
+            fresh = {name: column[order] for name, column in fresh.items()}
+            new_ids = fresh['flight_id']
+        ids = flights['flight_id']
+        pos = np.searchsorted(ids, new_ids)
+        present = pos < len(ids)
+        present[present] = ids[pos[present]] == new_ids[present]
+        merged = flights
+        if present.any():
+            # Copy before overwriting: readers may still be using the current arrays
+            merged = {name: flights[name].copy() for name in FLIGHT_COLUMNS}
+            for name in FLIGHT_COLUMNS:
+                merged[name][pos[present]] = fresh[name][present]
+        if present.all():
+            return merged
+        merged = {name: np.concatenate((merged[name], fresh[name][~present])) for name in FLIGHT_COLUMNS}
+        if len(ids) and new_ids[~present][0] < ids[-1]:
+            order = np.argsort(merged['flight_id'], kind='stable')
+            merged = {name: column[order] for name, column in merged.items()}
+        return merged
+
+    def _rows_deleted(self, last_flight: int, last_update: int) -> bool:
+        """Whether rows up to the watermarks were deleted since they were read (retention, compaction)"""
+        flights = db.session.query(db.func.count(Flight.flight_id))\
+            .filter(Flight.flight_id <= last_flight).scalar()
+        updates = db.session.query(db.func.count(FlightStatusUpdate.update_id))\
+            .filter(FlightStatusUpdate.update_id <= last_update).scalar()
+        return flights < len(self.flights['flight_id']) or updates < len(self.updates['update_id'])
+
+    def refresh(self) -> Dict:
+        """Pull changes since the last watermarks (everything after deletions); returns counts of rows read"""
+        started = time.perf_counter()
+        flights, updates = self.flights, self.updates
+        last_update = self._watermark(updates, 'update_id')
+        last_flight = self._watermark(flights, 'flight_id')
+        reload = bool(last_flight or last_update) and self._rows_deleted(last_flight, last_update)
+        if reload:
+            flights, updates = self._empty(FLIGHT_COLUMNS), self._empty(UPDATE_COLUMNS)
+            last_update = last_flight = 0
+        columns = (Flight.flight_id, Flight.airline_id, Flight.departure_airport, Flight.arrival_airport,
+                   Flight.status, Flight.scheduled_departure, Flight.delay_minutes)
+
+        # Status updates are append-only, so only ids past the watermark are new
+        batches = []
+        cursor = max(0, last_update - self.overlap)
+        while True:
+            rows = db.session.query(
+                FlightStatusUpdate.update_id, FlightStatusUpdate.flight_id,
+                FlightStatusUpdate.status, FlightStatusUpdate.status_update_time
+            ).filter(FlightStatusUpdate.update_id > cursor)\
+                .order_by(FlightStatusUpdate.update_id).limit(self.batch_size).all()
+            batches.append(self._read_updates(rows))
+            if len(rows) < self.batch_size:
+                break
+            cursor = rows[-1].update_id
+        fresh_updates = {name: np.concatenate([b[name] for b in batches]) for name in UPDATE_COLUMNS}
+        known = np.isin(fresh_updates['update_id'], updates['update_id'][-self.overlap:])
+        fresh_updates = {name: column[~known] for name, column in fresh_updates.items()}
+
+        # New flights in id batches, then flights that changed since (they got new status updates)
+        batches = []
+        cursor = scan_from = max(0, last_flight - self.overlap)
+        while True:
+            fresh = self._read_flights(db.session.query(*columns).filter(Flight.flight_id > cursor)
+                                       .order_by(Flight.flight_id).limit(self.batch_size))
+            batches.append(fresh)
+            if len(fresh['flight_id']) < self.batch_size:
+                break
+            cursor = int(fresh['flight_id'][-1])
+        touched = np.unique(fresh_updates['flight_id'][fresh_updates['flight_id'] <= scan_from]).tolist()
+        for i in range(0, len(touched), 1000):
+            batches.append(self._read_flights(db.session.query(*columns)
+                                              .filter(Flight.flight_id.in_(touched[i:i + 1000]))))
+        # One merge, so held rows are copied once per refresh rather than once per batch
+        fresh = {name: np.concatenate([b[name] for b in batches]) for name in FLIGHT_COLUMNS}
+        flights = self._merge_flights(flights, fresh)
+
+        updates = {name: np.concatenate((updates[name], fresh_updates[name])) for name in UPDATE_COLUMNS}
+        if len(fresh_updates['update_id']) and last_update and fresh_updates['update_id'][0] < last_update:
+            order = np.argsort(updates['update_id'], kind='stable')
+            updates = {name: column[order] for name, column in updates.items()}
+
+        self.airline_names = dict(db.session.query(Airline.airline_id, Airline.name).all())
+        self.airport_info = {a.iata_code: {'name': a.name, 'city': a.city, 'country': a.country}
+                             for a in db.session.query(Airport.iata_code, Airport.name, Airport.city, Airport.country)}
+        db.session.commit()
+        self.flights, self.updates = flights, updates
+        self.refreshed_at = time.time()
+        stats = {'flights_read': len(fresh['flight_id']), 'updates_read': len(fresh_updates['update_id']),
+                 'reloaded': reload, 'seconds': time.perf_counter() - started}
+        logger.debug("Columnar refresh: %s", stats)
+        return stats
+
+    def ensure_fresh(self) -> None:
+        """Refresh when stale; readers keep using the current columns while another thread refreshes"""
+        if time.time() - self.refreshed_at < self.refresh_interval:
+            return
+        if not self._lock.acquire(blocking=not self.refreshed_at):
+            return
+        try:
+            if time.time() - self.refreshed_at >= self.refresh_interval:
+                self.refresh()
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def _window(scheduled, start: Optional[datetime], end: Optional[datetime]):
+        """Boolean mask of flights scheduled inside [start, end), or None for all"""
+        if start is None and end is None:
+            return None
+        mask = np.ones(len(scheduled), dtype=bool)
+        if start is not None:
+            mask &= scheduled >= _epoch_seconds([start])[0]
+        if end is not None:
+            mask &= scheduled < _epoch_seconds([end])[0]
+        return mask
+
+    def _columns(self, names, start=None, end=None) -> List:
+        flights = self.flights  # refresh swaps the dict, so read every column from the same one
+        mask = self._window(flights['scheduled'], start, end)
+        return [flights[n] if mask is None else flights[n][mask] for n in names]
+
+    def flights_per_airline(self, start=None, end=None) -> List[Dict]:
+        """Flight count per airline, including airlines without flights"""
+        airline_ids, = self._columns(('airline_id',), start, end)
+        counts = np.bincount(airline_ids).tolist() if len(airline_ids) else []
+        results = [{'airline_id': i, 'airline': name, 'total_flights': counts[i] if i < len(counts) else 0}
+                   for i, name in self.airline_names.items()]
+        return sorted(results, key=lambda r: r['total_flights'], reverse=True)
+
+    def departures_per_airport(self, start=None, end=None) -> List[Dict]:
+        """Departure count per airport, including airports without departures"""
+        departures, = self._columns(('departure',), start, end)
+        counts = np.bincount(departures, minlength=len(self.airports)).tolist()
+        results = [{'airport': code, **info, 'departure_count': counts[self.airports.codes[code]]
+                    if code in self.airports.codes else 0}
+                   for code, info in self.airport_info.items()]
+        return sorted(results, key=lambda r: r['departure_count'], reverse=True)
+
+    def delay_by_route(self, start=None, end=None, min_flights: int = 2) -> List[Dict]:
+        """Flight count, average and max delay per departure/arrival city pair"""
+        departures, arrivals, delays, has_delay = self._columns(('departure', 'arrival', 'delay', 'has_delay'),
+                                                                start, end)
+        # Airport code -> city code (-1 for airports missing from the airports table, as the SQL join drops them)
+        cities = Dictionary()
+        city_of = np.array([cities.encode(self.airport_info[c]['city']) if c in self.airport_info else -1
+                            for c in self.airports.values], dtype=np.int64)
+        dep_city, arr_city = city_of[departures], city_of[arrivals]
+        known = (dep_city >= 0) & (arr_city >= 0)
+        keys = dep_city[known] * max(1, len(cities)) + arr_city[known]
+        keys, counts, (sorted_delays, sorted_has), starts = _group(keys, delays[known].astype(np.int64),
+                                                                  has_delay[known])
+        if not len(keys):
+            return []
+        # Like SQL AVG/MAX, only flights with a delay count towards them (None when a route has none)
+        sums = np.add.reduceat(sorted_delays, starts)
+        delay_counts = np.add.reduceat(sorted_has.astype(np.int64), starts)
+        peaks = np.maximum.reduceat(np.where(sorted_has, sorted_delays, np.iinfo(np.int64).min), starts)
+        keep = counts >= min_flights
+        results = [{
+            'departure_city': cities.values[key // max(1, len(cities))],
+            'arrival_city': cities.values[key % max(1, len(cities))],
+            'flight_count': count,
+            'avg_delay': total / delayed if delayed else None,
+            'max_delay': peak if delayed else None
+        } for key, count, total, delayed, peak in zip(keys[keep].tolist(), counts[keep].tolist(), sums[keep].tolist(),
+                                                      delay_counts[keep].tolist(), peaks[keep].tolist())]
+        return sorted(results, key=lambda r: (r['avg_delay'] is not None, r['avg_delay'] or 0), reverse=True)
+
+    def status_distribution(self, start=None, end=None) -> List[Dict]:
+        """Flight count and average delay per current status"""
+        statuses, delays, has_delay = self._columns(('status', 'delay', 'has_delay'), start, end)
+        counts = np.bincount(statuses, minlength=len(self.statuses))
+        sums = np.bincount(statuses, weights=delays, minlength=len(self.statuses))
+        delay_counts = np.bincount(statuses, weights=has_delay, minlength=len(self.statuses))
+        results = [{'status': self.statuses.values[code], 'flight_count': int(counts[code]),
+                    'avg_delay': float(sums[code] / delay_counts[code]) if delay_counts[code] else None}
+                   for code in np.flatnonzero(counts).tolist()]
+        return sorted(results, key=lambda r: r['flight_count'], reverse=True)
+
+    def multi_status_flights(self, limit: int = 100) -> List[Dict]:
+        """Flights with more than one status update, most updated first"""
+        flights, updates = self.flights, self.updates
+        flight_ids, counts, (sorted_status,), starts = _group(updates['flight_id'], updates['status'])
+        many = counts > 1
+        top = np.argsort(-counts[many], kind='stable')[:limit]
+        selected = np.flatnonzero(many)[top]
+        if not len(selected):
+            return []
+        # Updates can reference flights the snapshot does not hold (yet): those get no airline
+        ids = flights['flight_id']
+        pos = np.searchsorted(ids, flight_ids[selected])
+        present = pos < len(ids)
+        present[present] = ids[pos[present]] == flight_ids[selected][present]
+        # Flight numbers are high-cardinality strings, so look up just the ones being returned
+        numbers = dict(db.session.query(Flight.flight_id, Flight.flight_number)
+                       .filter(Flight.flight_id.in_(flight_ids[selected].tolist())).all())
+        results = []
+        for group, row, found in zip(selected.tolist(), pos.tolist(), present.tolist()):
+            statuses = sorted_status[starts[group]:starts[group] + counts[group]]
+            results.append({
+                'flight_id': int(flight_ids[group]),
+                'flight_number': numbers.get(int(flight_ids[group])),
+                'airline': self.airline_names.get(int(flights['airline_id'][row])) if found else None,
+                'status_change_count': int(counts[group]),
+                'statuses': [self.statuses.values[s] for s in np.unique(statuses).tolist()]
+            })
+        return results
+
+    def info(self) -> Dict:
+        return {
+            'flights': int(len(self.flights['flight_id'])),
+            'status_updates': int(len(self.updates['update_id'])),
+            'refreshed_at': datetime.utcfromtimestamp(self.refreshed_at).isoformat() if self.refreshed_at else None,
+            'memory_bytes': int(sum(c.nbytes for c in self.flights.values())
+                                + sum(c.nbytes for c in self.updates.values()))
+        }
@@ -0,0 +1,128 @@
+import math
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in kilometres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def parse_bbox(value: str) -> Tuple[float, float, float, float]:
+    """Parse `bbox=min_lat,min_lon,max_lat,max_lon` (min_lon > max_lon crosses the antimeridian)"""
+    try:
+        min_lat, min_lon, max_lat, max_lon = (float(v) for v in value.split(','))
+    except (AttributeError, ValueError):
+        raise ValueError("bbox must be min_lat,min_lon,max_lat,max_lon")
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        raise ValueError("bbox out of range")
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def in_bbox(lat: float, lon: float, bbox: Tuple[float, float, float, float]) -> bool:
+    min_lat, min_lon, max_lat, max_lon = bbox
+    if not min_lat <= lat <= max_lat:
+        return False
+    if min_lon <= max_lon:
+        return min_lon <= lon <= max_lon
+    return lon >= min_lon or lon <= max_lon
+
+
+class GeoGrid:
+    """Equal-angle grid of lat/lon cells for radius, k-nearest and bounding-box lookups.
+
+    Queries only visit cells overlapping the search area, then filter by exact
+    haversine distance, so cost scales with the points nearby rather than the catalog.
+    """
+
+    def __init__(self, cell_degrees: float = 1.0):
+        self.cell_degrees = cell_degrees
+        self.rows = int(math.ceil(180 / cell_degrees))
+        self.columns = int(math.ceil(360 / cell_degrees))
+        self.cells: Dict[Tuple[int, int], Dict[Hashable, Tuple[float, float, object]]] = {}
+        self.locations: Dict[Hashable, Tuple[int, int]] = {}
+
+    def __len__(self):
+        return len(self.locations)
+
+    def _row(self, lat: float) -> int:
+        return min(self.rows - 1, max(0, int((lat + 90) // self.cell_degrees)))
+
+    def _column(self, lon: float) -> int:
+        return int((lon + 180) // self.cell_degrees) % self.columns
+
+    def insert(self, key: Hashable, lat: float, lon: float, item: object = None) -> None:
+        """Add or move a point"""
+        self.remove(key)
+        cell = (self._row(lat), self._column(lon))
+        self.cells.setdefault(cell, {})[key] = (lat, lon, item)
+        self.locations[key] = cell
+
+    def remove(self, key: Hashable) -> None:
+        cell = self.locations.pop(key, None)
+        if cell is not None:
+            points = self.cells[cell]
+            del points[key]
+            if not points:
+                del self.cells[cell]
+
+    def _cells(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> Iterator[Dict]:
+        if min_lon <= max_lon:
+            first, last = self._column(min_lon), self._column(max_lon)
+            columns = range(first, last + 1) if first <= last else range(self.columns)
+        else:  # wraps across the antimeridian
+            columns = [*range(self._column(min_lon), self.columns), *range(0, self._column(max_lon) + 1)]
+        for row in range(self._row(min_lat), self._row(max_lat) + 1):
+            for column in columns:
+                points = self.cells.get((row, column))
+                if points:
+                    yield points
+
+    def in_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[Tuple]:
+        """(key, lat, lon, item) for every point inside the box"""
+        bbox = (min_lat, min_lon, max_lat, max_lon)
+        return [(key, lat, lon, item)
+                for points in self._cells(*bbox)
+                for key, (lat, lon, item) in points.items() if in_bbox(lat, lon, bbox)]
+
+    def within(self, lat: float, lon: float, radius_km: float) -> List[Tuple]:
+        """(distance_km, key, item) for points within `radius_km`, nearest first"""
+        dlat = radius_km / KM_PER_DEGREE
+        min_lat, max_lat = lat - dlat, lat + dlat
+        angular = radius_km / EARTH_RADIUS_KM
+        if min_lat <= -90 or max_lat >= 90 or angular >= math.pi / 2 \
+                or math.sin(angular) >= math.cos(math.radians(lat)):
+            min_lon, max_lon = -180.0, 180.0  # the circle reaches a pole: every longitude
+        else:
+            dlon = math.degrees(math.asin(math.sin(angular) / math.cos(math.radians(lat))))
+            min_lon, max_lon = lon - dlon, lon + dlon
+            min_lon += 360 if min_lon < -180 else 0
+            max_lon -= 360 if max_lon > 180 else 0
+        results = []
+        for points in self._cells(max(-90.0, min_lat), min_lon, min(90.0, max_lat), max_lon):
+            for key, (plat, plon, item) in points.items():
+                distance = haversine_km(lat, lon, plat, plon)
+                if distance <= radius_km:
+                    results.append((distance, key, item))
+        results.sort(key=lambda r: r[0])
+        return results
+
+    def nearest(self, lat: float, lon: float, k: int, max_km: Optional[float] = None) -> List[Tuple]:
+        """k nearest points as (distance_km, key, item), growing the search radius until k are found"""
+        if k <= 0 or not self.locations:
+            return []
+        radius = self.cell_degrees * KM_PER_DEGREE
+        limit = max_km if max_km is not None else math.pi * EARTH_RADIUS_KM
+        while True:
+            radius = min(radius, limit)
+            found = self.within(lat, lon, radius)
+            # Every point within `radius` is known, so the k closest of them are the true k nearest
+            if len(found) >= k or radius >= limit:
+                return found[:k]
+            radius *= 2
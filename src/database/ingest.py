@@ -0,0 +1,364 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam
+from sqlalchemy.dialects import mysql, sqlite
+
+from database.models import db, Airport, Airline, Flight, FlightStatusUpdate
+from database.airline_registry import airline_registry
+from database.airport_registry import airport_registry
+from database.change_feed import change_feed
+from database.rollups import RollupDelta
+from database.sketches import SketchDelta
+
+
+def parse_api_time(value: Optional[str]) -> Optional[datetime]:
+    """Parse an Aviation Stack timestamp into a naive datetime (as stored by MySQL)"""
+    if not value:
+        return None
+    return datetime.fromisoformat(value).replace(tzinfo=None)
+
+
+def enrich_airport_data(airport_info: Dict, airport_data: Dict) -> Dict:
+    """Add additional airport info from local database"""
+    iata = airport_info.get('iata')
+    if iata and iata in airport_data:
+        supplementary_data = airport_data[iata]
+        return {
+            'iata_code': iata,
+            'name': airport_info.get('airport', supplementary_data['name']),
+            'city': supplementary_data['city'],
+            'country': supplementary_data['country'],
+            'latitude': supplementary_data['latitude'],
+            'longitude': supplementary_data['longitude'],
+            'timezone': supplementary_data['timezone']
+        }
+    return {
+        'iata_code': iata,
+        'name': airport_info.get('airport', f"Airport {iata}"),
+        'city': airport_info.get('city', 'Unknown'),
+        'country': airport_info.get('country', 'Unknown'),
+        'latitude': None,
+        'longitude': None,
+        'timezone': None
+    }
+
+
+def current_state(flight_data: Dict, now: datetime) -> Dict:
+    """Latest status, delay, times and gates of an API record, as materialized on Flight"""
+    dep_info = flight_data.get('departure', {})
+    arr_info = flight_data.get('arrival', {})
+    return {
+        'status': (flight_data.get('flight_status') or 'SCHEDULED').upper(),
+        'delay_minutes': dep_info.get('delay') or 0,
+        'actual_departure': parse_api_time(dep_info.get('actual')),
+        'estimated_departure': parse_api_time(dep_info.get('estimated')),
+        'actual_arrival': parse_api_time(arr_info.get('actual')),
+        'estimated_arrival': parse_api_time(arr_info.get('estimated')),
+        'departure_gate': dep_info.get('gate'),
+        'departure_terminal': dep_info.get('terminal'),
+        'arrival_gate': arr_info.get('gate'),
+        'arrival_terminal': arr_info.get('terminal'),
+        'baggage_claim': arr_info.get('baggage'),
+        'status_updated_at': now
+    }
+
+
+# Materialized columns compared to decide whether a flight row needs rewriting
+CURRENT_STATE_FIELDS = tuple(f for f in current_state({}, datetime.min) if f != 'status_updated_at')
+
+
+def state_fingerprint(state: Dict) -> int:
+    """Hash of the fields whose change warrants a new status update row"""
+    return hash(tuple(state[field] for field in CURRENT_STATE_FIELDS))
+
+
+class FingerprintCache:
+    """Bounded LRU of flight key -> fingerprint of the last state written by this process.
+
+    Lets ingestion drop unchanged records before touching the database; entries
+    are only recorded after a successful commit.
+    """
+
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'suppressed': 0}
+
+    @classmethod
+    def from_env(cls):
+        """Size from INGEST_FINGERPRINT_CACHE_SIZE (0 disables the in-memory check)"""
+        return cls(int(os.getenv('INGEST_FINGERPRINT_CACHE_SIZE', '100000')))
+
+    def matches(self, key, fingerprint: int) -> bool:
+        with self._lock:
+            if self._entries.get(key) != fingerprint:
+                self.stats['misses'] += 1
+                return False
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return True
+
+    def update(self, fingerprints: Dict) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            for key, fingerprint in fingerprints.items():
+                self._entries[key] = fingerprint
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Forget every fingerprint (e.g. after the flights table was rebuilt)"""
+        with self._lock:
+            self._entries.clear()
+
+    def suppressed(self, count: int) -> None:
+        with self._lock:
+            self.stats['suppressed'] += count
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {'entries': len(self._entries), **self.stats}
+
+
+fingerprint_cache = FingerprintCache.from_env()
+
+
+def store_flight_data(flight_data: Dict, airport_data: Dict) -> Dict:
+    """Store a single flight record in database (one transaction per record).
+
+    A one-record `store_flight_batch`, so it writes the same rollups, sketches and
+    change-feed notifications as paged ingestion.
+    """
+    return store_flight_batch([flight_data], airport_data)
+
+
+def _insert_ignore(table, rows: List[Dict]) -> None:
+    """Multi-row INSERT that skips rows colliding with a unique key"""
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'mysql':
+        stmt = mysql.insert(table)
+        # No-op update turns duplicate-key errors into skipped rows
+        key = list(table.primary_key.columns)[0].name
+        stmt = stmt.on_duplicate_key_update({key: stmt.inserted[key]})
+    elif dialect == 'sqlite':
+        stmt = sqlite.insert(table).on_conflict_do_nothing()
+    else:
+        stmt = table.insert()
+    # executemany keeps the compiled statement cacheable (a multi-row VALUES recompiles per batch size)
+    db.session.execute(stmt, rows)
+
+
+def _airline_row(info: Dict) -> Dict:
+    return {
+        'name': info.get('name') or f"Airline {info['iata']}",
+        'iata_code': info['iata'],
+        'icao_code': info.get('icao'),
+        'country': info.get('country', 'Unknown'),
+        'active': True
+    }
+
+
+def resolve_airlines(airline_rows: Dict[str, Dict]) -> Dict[str, int]:
+    """airline_id for each IATA code, creating missing airlines without racing other workers.
+
+    Known codes come from the airline registry. The rest are inserted with
+    insert-ignore and read back with a locking SELECT, which (unlike a plain read
+    under REPEATABLE READ) sees airlines another worker committed meanwhile.
+    Callers pass the result to `airline_registry.remember` once they commit.
+    """
+    ids = airline_registry.lookup(airline_rows)
+    missing = [code for code in airline_rows if code not in ids]
+    if not missing:
+        return ids
+
+    def select(codes):
+        return dict(db.session.query(Airline.iata_code, Airline.airline_id)
+                    .filter(Airline.iata_code.in_(codes)).with_for_update(read=True).all())
+
+    ids.update(select(missing))
+    new = [airline_rows[code] for code in missing if code not in ids]
+    if new:
+        _insert_ignore(Airline.__table__, new)
+        ids.update(select([row['iata_code'] for row in new]))
+        # Skipped because another airline already holds the ICAO code: keep the flights, drop the code
+        clashes = [dict(row, icao_code=None) for row in new if row['iata_code'] not in ids]
+        if clashes:
+            _insert_ignore(Airline.__table__, clashes)
+            ids.update(select([row['iata_code'] for row in clashes]))
+    return ids
+
+
+def _flight_key(flight_data: Dict):
+    """(flight_number, scheduled_departure) identity of an API record"""
+    flight_number = flight_data.get('flight', {}).get('number')
+    scheduled_dep = flight_data.get('departure', {}).get('scheduled')
+    if not flight_number or not scheduled_dep:
+        return None
+    return flight_number, parse_api_time(scheduled_dep)
+
+
+def store_flight_batch(records: Iterable[Dict], airport_data: Dict,
+                       fingerprints: Optional[FingerprintCache] = None) -> Dict:
+    """Store a page of flight records using one set-based lookup per table and a single commit.
+
+    Records whose state matches the last one written for that flight are
+    suppressed, first against the in-memory fingerprint cache and otherwise
+    against the flight row, so repeated polls do not grow flight_status_updates.
+    """
+    fingerprints = fingerprints or fingerprint_cache
+    now = datetime.utcnow()
+    received = [r for r in records if r.get('airline', {}).get('iata')]
+    stats = {'received': len(received), 'flights_created': 0, 'updates_written': 0, 'updates_suppressed': 0}
+
+    # Last record per flight wins; drop the ones this process already wrote unchanged
+    latest = {}
+    keyed_count = 0
+    for r in received:
+        key = _flight_key(r)
+        if key:
+            keyed_count += 1
+            latest[key] = (r, current_state(r, now))
+    changed = {key: (r, state) for key, (r, state) in latest.items()
+               if not fingerprints.matches(key, state_fingerprint(state))}
+    records = [r for r, _ in changed.values()]
+    stats['updates_suppressed'] = keyed_count - len(changed)
+    if not records:
+        fingerprints.suppressed(stats['updates_suppressed'])
+        return stats
+
+    try:
+        # Airlines: registry hits cost nothing, misses one SELECT and one insert-ignore per page
+        airline_ids = resolve_airlines({r['airline']['iata']: _airline_row(r['airline']) for r in records})
+
+        # Airports referenced by the page
+        airport_rows = {}
+        for r in records:
+            for airport_info in (r.get('departure', {}), r.get('arrival', {})):
+                iata = airport_info.get('iata')
+                if iata and iata not in airport_rows:
+                    airport_rows[iata] = airport_info
+        # Existence check against the in-process registry; insert-ignore covers a stale registry
+        new_airports = airport_registry.missing(airport_rows)
+        _insert_ignore(Airport.__table__, [enrich_airport_data(airport_rows[code], airport_data)
+                                           for code in new_airports])
+
+        # Flights: resolve every (flight_number, scheduled_departure) key at once
+        keyed = [(key, r) for key, (r, _) in changed.items() if r['airline']['iata'] in airline_ids]
+        if not keyed:
+            db.session.commit()
+            airline_registry.remember(airline_ids)
+            if new_airports:
+                airport_registry.invalidate()
+            fingerprints.suppressed(stats['updates_suppressed'])
+            return stats
+
+        def load_flights(lock=False):
+            numbers = {k[0] for k, _ in keyed}
+            times = {k[1] for k, _ in keyed}
+            query = db.session.query(
+                Flight.flight_number, Flight.scheduled_departure, Flight.flight_id, Flight.airline_id,
+                Flight.departure_airport, Flight.arrival_airport,
+                *(getattr(Flight, field) for field in CURRENT_STATE_FIELDS)
+            ).filter(Flight.flight_number.in_(numbers))\
+                .filter(Flight.scheduled_departure.in_(times))
+            if lock:
+                # Serialise concurrent batches touching the same flights so rollup deltas apply once
+                query = query.with_for_update()
+            return {(f.flight_number, f.scheduled_departure): f for f in query.all()}
+
+        flights = load_flights()
+        new_flights = {}
+        for key, r in keyed:
+            if key in flights or key in new_flights:
+                continue
+            dep_info = r.get('departure', {})
+            arr_info = r.get('arrival', {})
+            new_flights[key] = {
+                'flight_number': key[0],
+                'airline_id': airline_ids[r['airline']['iata']],
+                'departure_airport': dep_info.get('iata'),
+                'arrival_airport': arr_info.get('iata'),
+                'scheduled_departure': key[1],
+                'scheduled_arrival': parse_api_time(arr_info.get('scheduled') or dep_info.get('scheduled')),
+                'status': 'SCHEDULED',
+                # NULL marks a flight not yet counted in the delay rollups
+                'delay_minutes': None
+            }
+        if new_flights:
+            _insert_ignore(Flight.__table__, list(new_flights.values()))
+            stats['flights_created'] = len(new_flights)
+        flights = load_flights(lock=True)
+        flight_ids = {key: f.flight_id for key, f in flights.items()}
+
+        # Materialize each flight's latest state on its row and fold delay changes into the rollups
+        delta = RollupDelta()
+        sketches = SketchDelta()
+        state_changes = []
+        written = []
+        for key, r in keyed:
+            flight, state = flights[key], changed[key][1]
+            if all(getattr(flight, field) == state[field] for field in CURRENT_STATE_FIELDS):
+                # Unchanged since the last write (e.g. by another worker or before a restart)
+                stats['updates_suppressed'] += 1
+                continue
+            written.append((key, r))
+            state_changes.append({'b_flight_id': flight.flight_id,
+                                  **{f"b_{field}": value for field, value in state.items()}})
+            for change in (delta, sketches):
+                change.add(flight.airline_id, flight.departure_airport, flight.arrival_airport,
+                           flight.scheduled_departure, flight.delay_minutes, state['delay_minutes'])
+        if state_changes:
+            table = Flight.__table__
+            db.session.execute(
+                table.update()
+                .where(table.c.flight_id == bindparam('b_flight_id'))
+                .values({field: bindparam(f"b_{field}") for field in (*CURRENT_STATE_FIELDS, 'status_updated_at')}),
+                state_changes
+            )
+        delta.apply()
+        sketches.apply()
+
+        # Status updates: one executemany INSERT for the flights that changed
+        updates = []
+        for key, r in written:
+            dep_info = r.get('departure', {})
+            arr_info = r.get('arrival', {})
+            updates.append({
+                'flight_id': flight_ids[key],
+                'status': (r.get('flight_status') or 'SCHEDULED').upper(),
+                'status_update_time': now,
+                'actual_departure': parse_api_time(dep_info.get('actual')),
+                'estimated_departure': parse_api_time(dep_info.get('estimated')),
+                'delay_minutes': dep_info.get('delay'),
+                'delay_reason': None,
+                'departure_gate': dep_info.get('gate'),
+                'departure_terminal': dep_info.get('terminal'),
+                'arrival_gate': arr_info.get('gate'),
+                'arrival_terminal': arr_info.get('terminal'),
+                'baggage_claim': arr_info.get('baggage')
+            })
+        if updates:
+            db.session.execute(FlightStatusUpdate.__table__.insert(), updates)
+        stats['updates_written'] = len(updates)
+
+        db.session.commit()
+        airline_registry.remember(airline_ids)
+        if new_airports:
+            airport_registry.invalidate()
+        if updates:
+            change_feed.notify()
+        fingerprints.update({key: state_fingerprint(changed[key][1]) for key, _ in keyed})
+        fingerprints.suppressed(stats['updates_suppressed'])
+        return stats
+    except Exception as e:
+        db.session.rollback()
+        raise e
@@ -38,6 +38,13 @@ class Airline(db.Model):
 # Main flight information including schedule and status
 class Flight(db.Model):
     __tablename__ = 'flights'
+    __table_args__ = (
+        db.UniqueConstraint('flight_number', 'scheduled_departure', name='uq_flight_schedule'),
+        db.Index('idx_departure_airport_time', 'departure_airport', 'scheduled_departure'),
+        db.Index('idx_arrival_airport_time', 'arrival_airport', 'scheduled_departure'),
+        db.Index('idx_status_time', 'status', 'scheduled_departure'),
+        db.Index('idx_delay_minutes', 'delay_minutes'),
+    )
     flight_id = db.Column(db.Integer, primary_key=True)
     flight_number = db.Column(db.String(10), nullable=False)
     airline_id = db.Column(db.Integer, db.ForeignKey('airlines.airline_id'), nullable=False)
@@ -53,6 +60,13 @@ class Flight(db.Model):
     delay_minutes = db.Column(db.Integer, default=0)
     aircraft_registration = db.Column(db.String(20))
     aircraft_type = db.Column(db.String(50))
+    # Latest gates and update time, copied from the newest FlightStatusUpdate on ingestion
+    departure_gate = db.Column(db.String(10))
+    departure_terminal = db.Column(db.String(10))
+    arrival_gate = db.Column(db.String(10))
+    arrival_terminal = db.Column(db.String(10))
+    baggage_claim = db.Column(db.String(20))
+    status_updated_at = db.Column(db.DateTime)
     status_updates = db.relationship('FlightStatusUpdate', backref='flight')
 
 # Tracks changes in flight status, delays and gate information
@@ -70,4 +84,56 @@ class FlightStatusUpdate(db.Model):
     departure_terminal = db.Column(db.String(10))
     arrival_gate = db.Column(db.String(10))
     arrival_terminal = db.Column(db.String(10))
-    baggage_claim = db.Column(db.String(20))
\ No newline at end of file
+    baggage_claim = db.Column(db.String(20))
+
+# Pre-aggregated delay statistics per airline/route/airport and hour/day bucket
+class DelayRollup(db.Model):
+    __tablename__ = 'delay_rollups'
+    kind = db.Column(db.String(10), primary_key=True)
+    granularity = db.Column(db.String(4), primary_key=True)
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    bucket_key = db.Column(db.String(16), primary_key=True)
+    flight_count = db.Column(db.BigInteger, nullable=False, default=0)
+    delay_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    delay_sum_sq = db.Column(db.BigInteger, nullable=False, default=0)
+    max_delay = db.Column(db.Integer, nullable=False, default=0)  # peak ever observed, reset by a rebuild
+
+# Mergeable delay quantile sketch + fixed histogram per rollup bucket (see database/sketches.py)
+class DelayDistribution(db.Model):
+    __tablename__ = 'delay_distributions'
+    kind = db.Column(db.String(10), primary_key=True)
+    granularity = db.Column(db.String(4), primary_key=True)
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    bucket_key = db.Column(db.String(16), primary_key=True)
+    sketch = db.Column(db.LargeBinary, nullable=False)
+
+# One row per flight summarising status updates removed by compaction (see database/retention.py)
+class FlightHistorySummary(db.Model):
+    __tablename__ = 'flight_history_summaries'
+    flight_id = db.Column(db.Integer, db.ForeignKey('flights.flight_id'), primary_key=True)
+    update_count = db.Column(db.Integer, nullable=False, default=0)
+    first_status = db.Column(db.String(20))
+    last_status = db.Column(db.String(20))
+    first_update_time = db.Column(db.DateTime)
+    last_update_time = db.Column(db.DateTime)
+    max_delay = db.Column(db.Integer)
+    gate_changes = db.Column(db.Integer, nullable=False, default=0)
+    last_departure_gate = db.Column(db.String(10))
+    last_arrival_gate = db.Column(db.String(10))
+    compacted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Where the background poller is for each polling target, so it resumes after a restart (see database/poller.py)
+class PollCursor(db.Model):
+    __tablename__ = 'poll_cursors'
+    target = db.Column(db.String(32), primary_key=True)
+    next_poll_at = db.Column(db.DateTime, nullable=False)
+    last_polled_at = db.Column(db.DateTime)
+    page_offset = db.Column(db.Integer, nullable=False, default=0)
+    last_total = db.Column(db.Integer)
+    failures = db.Column(db.Integer, nullable=False, default=0)
+
+# Aviation Stack calls made by the poller per day, counted against the plan's quota
+class ApiUsage(db.Model):
+    __tablename__ = 'api_usage'
+    day = db.Column(db.Date, primary_key=True)
+    calls = db.Column(db.Integer, nullable=False, default=0)
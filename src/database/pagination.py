@@ -0,0 +1,63 @@
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from database.models import db
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor we did not issue"""
+
+
+def page_size(requested: Optional[int]) -> int:
+    """Clamp a requested page size to [1, MAX_PAGE_SIZE]"""
+    if not requested or requested < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(requested, MAX_PAGE_SIZE)
+
+
+def encode_cursor(values: Sequence) -> str:
+    """Opaque token holding the sort key of the last row served"""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str, columns: Sequence) -> List:
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        return [
+            datetime.fromisoformat(v) if isinstance(column.type, db.DateTime) and v is not None else v
+            for column, v in zip(columns, values)
+        ]
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+
+
+def _after(columns: Sequence, values: Sequence, descending: bool):
+    """Rows strictly past the cursor in sort order, expanded so MySQL can range-scan the index"""
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        past = column < values[i] if descending else column > values[i]
+        clauses.append(db.and_(*equal, past))
+    return db.or_(*clauses)
+
+
+def keyset_page(query, columns: Sequence, limit: int, cursor: Optional[str] = None,
+                descending: bool = False) -> Tuple[list, Optional[str]]:
+    """Fetch one page ordered by `columns` (unique as a whole), returns (rows, next_cursor)"""
+    if cursor:
+        query = query.filter(_after(columns, decode_cursor(cursor, columns), descending))
+    order = [c.desc() if descending else c.asc() for c in columns]
+    rows = query.order_by(*order).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([getattr(rows[-1], c.key) for c in columns])
@@ -0,0 +1,419 @@
+import atexit
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from calendar import monthrange
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy.dialects import mysql, sqlite
+
+from database.models import db, Airline, ApiUsage, Flight, PollCursor
+from database.refresh_schedule import FlightRefreshQueue
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+ACTIVE_TARGET = 'active'
+
+
+def _codes(value: Optional[str]) -> List[str]:
+    return [c.strip().upper() for c in (value or '').split(',') if c.strip()]
+
+
+class PollTarget:
+    """One upstream query the poller repeats: an airport's departures, an airline's flights or flights in the air"""
+
+    def __init__(self, key: str, params: Dict, weight: float):
+        self.key = key
+        self.params = params
+        self.weight = weight
+        self.pages = 1        # upstream calls per poll, from the last result size
+        self.interval = 0.0   # seconds between polls, set by the plan
+
+    @property
+    def calls_per_day(self) -> float:
+        return 86400 / self.interval * self.pages
+
+
+class QuotaBudget:
+    """Aviation Stack plan quota: the monthly allowance spread evenly over the days left, optionally capped per day"""
+
+    def __init__(self, monthly: int, daily: Optional[int] = None):
+        self.monthly = monthly
+        self.daily = daily
+
+    @classmethod
+    def from_env(cls):
+        daily = os.getenv('AVIATION_DAILY_QUOTA')
+        return cls(int(os.getenv('AVIATION_MONTHLY_QUOTA', '10000')), int(daily) if daily else None)
+
+    def usage(self, day: date) -> Dict:
+        """Calls made on `day` and earlier in its month"""
+        rows = dict(db.session.query(ApiUsage.day, ApiUsage.calls)
+                    .filter(ApiUsage.day >= day.replace(day=1), ApiUsage.day <= day).all())
+        today = rows.pop(day, 0)
+        return {'today': today, 'before_today': sum(rows.values())}
+
+    def allowance(self, day: date, usage: Optional[Dict] = None) -> int:
+        """Calls allowed on `day`: what is left of the month divided by the days left, including `day`"""
+        usage = usage or self.usage(day)
+        days_left = monthrange(day.year, day.month)[1] - day.day + 1
+        allowed = (self.monthly - usage['before_today']) // days_left
+        if self.daily is not None:
+            allowed = min(allowed, self.daily)
+        return max(allowed, 0)
+
+    def remaining(self, day: date) -> int:
+        usage = self.usage(day)
+        return max(self.allowance(day, usage) - usage['today'], 0)
+
+    def paced(self, now: datetime, slack: float = 0) -> int:
+        """Calls that can be made by `now` (plus `slack` seconds) while keeping today's use on an even spread"""
+        day = now.date()
+        usage = self.usage(day)
+        elapsed = (now - datetime.combine(day, datetime.min.time())).total_seconds()
+        return int(self.allowance(day, usage) * min(1.0, (elapsed + slack) / 86400)) - usage['today']
+
+    @staticmethod
+    def spend(calls: int = 1, day: Optional[date] = None) -> None:
+        """Add calls to the day's usage in a transaction of its own, so every process sees them at once"""
+        day = day or datetime.utcnow().date()
+        table = ApiUsage.__table__
+        with db.engine.begin() as conn:
+            dialect = conn.dialect.name
+            if dialect == 'mysql':
+                stmt = mysql.insert(table).values(day=day, calls=calls)
+                conn.execute(stmt.on_duplicate_key_update(calls=table.c.calls + stmt.inserted.calls))
+            elif dialect == 'sqlite':
+                stmt = sqlite.insert(table).values(day=day, calls=calls)
+                conn.execute(stmt.on_conflict_do_update(index_elements=['day'],
+                                                        set_={'calls': table.c.calls + stmt.excluded.calls}))
+            elif not conn.execute(table.update().where(table.c.day == day)
+                                  .values(calls=table.c.calls + calls)).rowcount:
+                conn.execute(table.insert().values(day=day, calls=calls))
+
+
+
+class UsageCounter:
+    """Upstream calls of the web app, counted in memory and added to api_usage off the request path.
+
+    `add` only bumps a per-day counter. A daemon thread, started lazily in each worker
+    process, flushes the pending calls every `flush_interval` seconds, and once more
+    at exit. Calls whose flush fails stay pending for the next one, so the quota the
+    poller plans with trails web traffic by about one interval.
+    """
+
+    def __init__(self, app, flush_interval: float = 60.0):
+        self.app = app
+        self.flush_interval = flush_interval
+        self._pending: Dict[date, int] = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._stopping = threading.Event()
+        atexit.register(self.shutdown)
+
+    @classmethod
+    def from_env(cls, app):
+        return cls(app, flush_interval=float(os.getenv('API_USAGE_FLUSH_INTERVAL', '60')))
+
+    def add(self, calls: int = 1) -> None:
+        self._ensure_started()
+        day = datetime.utcnow().date()
+        with self._lock:
+            self._pending[day] = self._pending.get(day, 0) + calls
+
+    def _ensure_started(self) -> None:
+        # Threads do not survive a fork, so (re)start lazily in each gunicorn worker
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pending = {}  # the parent flushes its own calls
+            self._stopping.clear()
+            threading.Thread(target=self._run, name='api-usage-flush', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self) -> int:
+        """Add the pending calls to api_usage; returns how many were written"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        written = 0
+        try:
+            with self.app.app_context():
+                for day in list(pending):
+                    QuotaBudget.spend(pending[day], day)
+                    written += pending.pop(day)
+        except Exception as e:
+            logger.warning("Could not record %d upstream calls: %s", sum(pending.values()), e)
+            with self._lock:
+                for day, calls in pending.items():
+                    self._pending[day] = self._pending.get(day, 0) + calls
+        return written
+
+    def shutdown(self) -> None:
+        self._stopping.set()
+        if self._pid == os.getpid():
+            self.flush()
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {'pending_calls': sum(self._pending.values()), 'flush_interval': self.flush_interval}
+
+
+class PollScheduler:
+    """Spreads the daily quota over airports, airlines and in-air flights by recent traffic.
+
+    Each target's weight is its flights per day over the last `lookback_days` plus
+    `active_weight` per flight currently in the air, so busy hubs are polled more
+    often than quiet airports; `active_share` of the calls goes to the in-air sweep.
+    Intervals stay within [min_interval, max_interval]; a result set larger than
+    `max_pages` pages is walked across successive polls through the cursor's offset.
+    Cursors and call counts live in the database, so a restarted poller picks up
+    its schedule and the quota it already used.
+
+    With a `refresh` queue, `flight_share` of the calls instead goes to targeted
+    per-flight searches, most overdue flight first, paced so the day's calls so
+    far stay on an even spread of the allowance (plus any the targets left unused).
+    """
+
+    def __init__(self, budget: QuotaBudget, airports: Iterable[str], airlines: Iterable[str] = (),
+                 top_airlines: int = 10, active_share: float = 0.2, active_weight: float = 5.0,
+                 min_interval: float = 300, max_interval: float = 6 * 3600, max_pages: int = 3,
+                 lookback_days: int = 7, replan_interval: float = 900,
+                 refresh: Optional[FlightRefreshQueue] = None, flight_share: float = 0.5):
+        self.budget = budget
+        self.airports = list(airports)
+        self.airlines = list(airlines)
+        self.top_airlines = top_airlines
+        self.active_share = active_share
+        self.active_weight = active_weight
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_pages = max_pages
+        self.lookback_days = lookback_days
+        self.replan_interval = replan_interval
+        self.refresh = refresh
+        self.flight_share = flight_share if refresh is not None else 0.0
+        self.stats = {'polls': 0, 'calls': 0, 'records': 0, 'failures': 0, 'flight_refreshes': 0}
+
+    @classmethod
+    def from_env(cls, airports: Iterable[str]):
+        """Scheduler from POLL_* variables; `airports` are polled unless POLL_AIRPORTS lists others"""
+        return cls(
+            QuotaBudget.from_env(),
+            airports=_codes(os.getenv('POLL_AIRPORTS')) or airports,
+            airlines=_codes(os.getenv('POLL_AIRLINES')),
+            top_airlines=int(os.getenv('POLL_TOP_AIRLINES', '10')),
+            active_share=float(os.getenv('POLL_ACTIVE_SHARE', '0.2')),
+            min_interval=float(os.getenv('POLL_MIN_INTERVAL', '300')),
+            max_interval=float(os.getenv('POLL_MAX_INTERVAL', str(6 * 3600))),
+            max_pages=int(os.getenv('POLL_MAX_PAGES', '3')),
+            lookback_days=int(os.getenv('POLL_LOOKBACK_DAYS', '7')),
+            refresh=FlightRefreshQueue() if os.getenv('POLL_FLIGHT_REFRESH', '1') == '1' else None,
+            flight_share=float(os.getenv('POLL_FLIGHT_SHARE', '0.5'))
+        )
+
+    def _weights(self, column, keys: Optional[List], now: datetime, limit: Optional[int] = None) -> Dict:
+        """Flights per day in the lookback window plus a bonus per flight in the air, grouped by `column`"""
+        since = now - timedelta(days=self.lookback_days)
+        recent = db.session.query(column, db.func.count()).select_from(Flight)
+        active = db.session.query(column, db.func.count()).select_from(Flight)
+        if column is Airline.iata_code:
+            recent = recent.join(Airline, Airline.airline_id == Flight.airline_id)
+            active = active.join(Airline, Airline.airline_id == Flight.airline_id)
+        if keys is not None:
+            recent = recent.filter(column.in_(keys))
+            active = active.filter(column.in_(keys))
+        recent = recent.filter(Flight.scheduled_departure >= since).group_by(column)
+        if limit is not None:
+            recent = recent.order_by(db.func.count().desc()).limit(limit)
+        recent = dict(recent.all())
+        active = dict(active.filter(Flight.status == 'ACTIVE', column.in_(list(recent) if keys is None else keys))
+                      .group_by(column).all())
+        return {key: 1 + recent.get(key, 0) / self.lookback_days + self.active_weight * active.get(key, 0)
+                for key in (keys if keys is not None else recent) if key}
+
+    def targets(self, now: datetime) -> List[PollTarget]:
+        """Polling targets weighted by the traffic stored so far"""
+        targets = [PollTarget(f"airport:{code}", {'dep_iata': code}, weight)
+                   for code, weight in self._weights(Flight.departure_airport, self.airports, now).items()]
+        airlines = self._weights(Airline.iata_code, self.airlines or None, now,
+                                 limit=None if self.airlines else self.top_airlines)
+        targets += [PollTarget(f"airline:{code}", {'airline_iata': code}, weight)
+                    for code, weight in airlines.items()]
+        if self.active_share > 0:
+            rest = sum(t.weight for t in targets)
+            weight = rest * self.active_share / (1 - self.active_share) if rest and self.active_share < 1 else 1.0
+            targets.append(PollTarget(ACTIVE_TARGET, {'flight_status': 'active'}, weight))
+        return targets
+
+    def plan(self, now: datetime, cursors: Dict[str, PollCursor]) -> List[PollTarget]:
+        """Targets with intervals that fit today's allowance; creates cursors for new targets"""
+        targets = self.targets(now)
+        calls_per_day = self.budget.allowance(now.date()) * (1 - self.flight_share)
+        for target in targets:
+            cursor = cursors.get(target.key)
+            if cursor is not None and cursor.last_total:
+                target.pages = min(self.max_pages, max(1, math.ceil(cursor.last_total / PAGE_SIZE)))
+        # Water-filling: targets pinned at an interval bound take a fixed number of calls, the rest share what is left
+        pinned: Dict[str, float] = {}
+        while True:
+            free = [t for t in targets if t.key not in pinned]
+            budget = calls_per_day - sum(86400 / pinned[t.key] * t.pages for t in targets if t.key in pinned)
+            weight = sum(t.weight for t in free)
+            newly = {}
+            for t in free:
+                t.interval = 86400 * t.pages * weight / (budget * t.weight) if budget > 0 else self.max_interval
+                if t.interval < self.min_interval or t.interval > self.max_interval:
+                    newly[t.key] = min(max(t.interval, self.min_interval), self.max_interval)
+            if not newly:
+                break
+            pinned.update(newly)
+        for t in targets:
+            t.interval = pinned.get(t.key, t.interval)
+            if t.key not in cursors:
+                # Stagger first polls over one interval so a fresh start does not burst
+                jitter = int(hashlib.sha1(t.key.encode()).hexdigest()[:8], 16) / 0xffffffff
+                cursors[t.key] = PollCursor(target=t.key, page_offset=0, failures=0,
+                                            next_poll_at=now + timedelta(seconds=jitter * t.interval))
+        return targets
+
+    def poll(self, target: PollTarget, cursor: PollCursor, service, store: Callable[[List[Dict]], object],
+             now: datetime) -> int:
+        """Fetch up to `pages` pages from the cursor's offset and store them; returns the calls made"""
+        calls = 0
+        offset = cursor.page_offset or 0
+        total = None
+        try:
+            for page in service.iter_pages('flights', {**target.params, 'offset': offset},
+                                           max_records=target.pages * PAGE_SIZE):
+                calls += 1
+                records = page.get('data') or []
+                store(records)
+                self.stats['records'] += len(records)
+                offset += len(records)
+                total = (page.get('pagination') or {}).get('total')
+            cursor.last_total = total
+            # Continue a long result set next time, start over once it was walked to the end
+            cursor.page_offset = offset if total and offset < total else 0
+            cursor.failures = 0
+            cursor.next_poll_at = now + timedelta(seconds=target.interval)
+        except Exception as e:
+            calls += 1  # the failed call may still have counted against the quota
+            cursor.failures = (cursor.failures or 0) + 1
+            backoff = min(target.interval * 2 ** cursor.failures, self.max_interval)
+            cursor.next_poll_at = now + timedelta(seconds=backoff)
+            self.stats['failures'] += 1
+            logger.warning("Polling %s failed (%s); retrying in %.0fs", target.key, e, backoff)
+        cursor.last_polled_at = now
+        db.session.commit()
+        self.stats['polls'] += 1
+        self.stats['calls'] += calls
+        return calls
+
+    def refresh_flight(self, flight, service, store: Callable[[List[Dict]], object], now: datetime) -> int:
+        """One targeted search for a flight due for a refresh; returns the calls made"""
+        try:
+            records = service.search_flights(flight_number=flight.flight_number,
+                                             dep_iata=flight.departure_airport).get('data') or []
+            store(records)
+            self.stats['records'] += len(records)
+        except Exception as e:
+            self.stats['failures'] += 1
+            logger.warning("Refreshing flight %s failed (%s)", flight.flight_number, e)
+        db.session.commit()
+        self.refresh.refreshed(flight.flight_id, now)
+        self.stats['flight_refreshes'] += 1
+        self.stats['calls'] += 1
+        return 1
+
+    def run(self, service, store: Callable[[List[Dict]], object], once: bool = False,
+            sleep: Callable[[float], None] = time.sleep) -> Dict:
+        """Poll due targets until stopped (or one round with `once`, e.g. from cron)"""
+        if service.on_call is None:
+            service.on_call = self.budget.spend
+        cursors = {c.target: c for c in PollCursor.query.all()}
+        targets, replan_at = [], None
+        while True:
+            now = datetime.utcnow()
+            if replan_at is None or now >= replan_at:
+                targets = self.plan(now, cursors)
+                db.session.add_all(cursors[t.key] for t in targets)
+                db.session.commit()
+                replan_at = now + timedelta(seconds=self.replan_interval)
+                logger.info("Planned %d targets, %.0f calls/day", len(targets),
+                            sum(t.calls_per_day for t in targets))
+                if self.refresh is not None:
+                    tracked = self.refresh.load(now, self.budget.allowance(now.date()) * self.flight_share)
+                    logger.info("Tracking %d open flights, intervals x%.1f", tracked, self.refresh.scale)
+            remaining = self.budget.remaining(now.date())
+            exhausted = False
+            for target in sorted(targets, key=lambda t: cursors[t.key].next_poll_at):
+                if cursors[target.key].next_poll_at > now:
+                    break
+                if remaining < target.pages:
+                    exhausted = True
+                    break
+                remaining -= self.poll(target, cursors[target.key], service, store, now)
+                now = datetime.utcnow()
+            paced = 0
+            if self.refresh is not None:
+                paced = self.budget.paced(now, self.replan_interval)
+                while self.refresh.next_due() is not None and self.refresh.next_due() <= now and paced >= 1:
+                    paced -= self.refresh_flight(self.refresh.pop(), service, store, now)
+                    now = datetime.utcnow()
+                exhausted = exhausted or self.budget.remaining(now.date()) < 1
+            if once:
+                return self.stats
+            wake = min([cursors[t.key].next_poll_at for t in targets] + [replan_at])
+            if self.refresh is not None and self.refresh.next_due() is not None:
+                # Due flights that are over the pace wait for roughly one call's share of the day
+                allowance = self.budget.allowance(now.date())
+                wait = 0 if paced >= 1 else 86400 / allowance if allowance else self.replan_interval
+                ready = now + timedelta(seconds=wait)
+                wake = min(wake, max(self.refresh.next_due(), ready))
+            if exhausted:
+                # Today's allowance is spent: wait for tomorrow's
+                wake = max(wake, datetime.combine(now.date() + timedelta(days=1), datetime.min.time()))
+            sleep(min(max((wake - datetime.utcnow()).total_seconds(), 1), self.replan_interval))
+
+    def report(self, now: datetime) -> Dict:
+        """Projected quota use of the current plan, without calling upstream or writing anything"""
+        cursors = {c.target: c for c in PollCursor.query.all()}
+        targets = self.plan(now, cursors)
+        db.session.expunge_all()  # new cursors stay unsaved
+        day = now.date()
+        usage = self.budget.usage(day)
+        per_day = sum(t.calls_per_day for t in targets)
+        flights = None
+        if self.refresh is not None:
+            share = self.budget.allowance(day, usage) * self.flight_share
+            self.refresh.load(now, share)
+            demand = self.refresh.demand(now)
+            flights = {'tracked': len(self.refresh), 'phases': self.refresh.phases(now),
+                       'demand_per_day': round(demand, 1), 'share_per_day': round(share, 1),
+                       'interval_scale': round(self.refresh.scale, 2)}
+            per_day += min(demand, share)
+        days_left = monthrange(day.year, day.month)[1] - day.day + 1
+        return {
+            'targets': [{'target': t.key, 'weight': round(t.weight, 2), 'pages': t.pages,
+                         'interval_minutes': round(t.interval / 60, 1), 'calls_per_day': round(t.calls_per_day, 1),
+                         'next_poll_at': cursors[t.key].next_poll_at.isoformat()}
+                        for t in sorted(targets, key=lambda t: -t.calls_per_day)],
+            'flights': flights,
+            'calls_per_day': round(per_day, 1),
+            'allowance_today': self.budget.allowance(day, usage),
+            'used_today': usage['today'],
+            'used_this_month': usage['before_today'] + usage['today'],
+            'monthly_quota': self.budget.monthly,
+            'projected_month': round(usage['before_today'] + per_day * days_left)
+        }
@@ -0,0 +1,148 @@
+import heapq
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from database.models import db, Flight
+
+TERMINAL_STATUSES = ('LANDED', 'CANCELLED', 'DIVERTED')
+OPEN_STATUSES = ('SCHEDULED', 'DELAYED', 'ACTIVE')
+
+# Seconds between refreshes of one flight in each phase (terminal flights are not refreshed)
+REFRESH_INTERVALS = {
+    'scheduled_far': 6 * 3600,   # departure more than NEAR_WINDOW away
+    'scheduled_near': 45 * 60,   # departure within NEAR_WINDOW
+    'boarding': 5 * 60,          # from BOARDING_WINDOW before departure until DEPARTURE_GRACE after it
+    'overdue': 15 * 60,          # past departure, not reported airborne yet
+    'active': 15 * 60,           # airborne
+    'arriving': 5 * 60           # airborne, within ARRIVAL_WINDOW of arrival
+}
+MAX_INTERVAL = 24 * 3600
+NEAR_WINDOW = timedelta(hours=6)
+BOARDING_WINDOW = timedelta(hours=1)
+DEPARTURE_GRACE = timedelta(minutes=30)
+ARRIVAL_WINDOW = timedelta(minutes=30)
+# Flights still not airborne this long after departure are given up on
+OVERDUE_LIMIT = timedelta(hours=12)
+
+
+def flight_phase(flight, now: datetime) -> Tuple[Optional[str], Optional[datetime]]:
+    """Phase of a flight row and when it enters the next one (None for terminal flights)"""
+    if flight.status in TERMINAL_STATUSES:
+        return None, None
+    if flight.status == 'ACTIVE':
+        arrival = flight.estimated_arrival or flight.scheduled_arrival
+        if arrival is None or now >= arrival - ARRIVAL_WINDOW:
+            return 'arriving', None
+        return 'active', arrival - ARRIVAL_WINDOW
+    departure = flight.estimated_departure or flight.scheduled_departure
+    if now < departure - NEAR_WINDOW:
+        return 'scheduled_far', departure - NEAR_WINDOW
+    if now < departure - BOARDING_WINDOW:
+        return 'scheduled_near', departure - BOARDING_WINDOW
+    if now < departure + DEPARTURE_GRACE:
+        return 'boarding', departure + DEPARTURE_GRACE
+    if now < departure + OVERDUE_LIMIT:
+        return 'overdue', None
+    return None, None
+
+
+class FlightRefreshQueue:
+    """Min-heap of open flights keyed on when each is next due for a targeted refresh.
+
+    A flight is due one phase interval after its last refresh (its last status
+    update when it was not refreshed by this process yet), and no later than the
+    moment it enters its next phase, so a flight moving into its boarding window
+    is picked up at once rather than after the long interval of the phase before.
+    Given a daily call budget, `load` stretches every phase interval by the same
+    factor until the expected refreshes fit it, keeping near-departure and
+    arriving flights refreshed many times more often than the rest.
+    """
+
+    def __init__(self, intervals: Optional[Dict[str, float]] = None, horizon: timedelta = timedelta(hours=48),
+                 lookback: timedelta = timedelta(hours=20)):
+        self.intervals = {**REFRESH_INTERVALS, **(intervals or {})}
+        self.horizon = horizon
+        self.lookback = lookback
+        self._heap: List[Tuple[datetime, int, object]] = []
+        self._refreshed: Dict[int, datetime] = {}
+        self._scale = 1.0
+
+    def _candidates(self, now: datetime, flight_id: Optional[int] = None):
+        query = db.session.query(
+            Flight.flight_id, Flight.flight_number, Flight.departure_airport, Flight.status,
+            Flight.scheduled_departure, Flight.estimated_departure, Flight.scheduled_arrival,
+            Flight.estimated_arrival, Flight.status_updated_at
+        )
+        if flight_id is not None:
+            return query.filter(Flight.flight_id == flight_id).all()
+        # Range scan of idx_status_time: open flights departing within the window
+        return query.filter(Flight.status.in_(OPEN_STATUSES),
+                            Flight.scheduled_departure >= now - self.lookback,
+                            Flight.scheduled_departure < now + self.horizon).all()
+
+    def due_at(self, flight, now: datetime) -> Optional[datetime]:
+        """When `flight` should next be refreshed (None: never, it is finished or out of reach)"""
+        phase, phase_end = flight_phase(flight, now)
+        if phase is None:
+            return None
+        last = self._refreshed.get(flight.flight_id) or flight.status_updated_at
+        due = last + timedelta(seconds=self.interval(phase)) if last else now
+        return min(due, phase_end) if phase_end else due
+
+    def interval(self, phase: str) -> float:
+        return min(self.intervals[phase] * self._scale, MAX_INTERVAL)
+
+    def fit(self, flights, now: datetime, calls_per_day: Optional[float]) -> None:
+        """Scale phase intervals so the refreshes of `flights` take about `calls_per_day` calls"""
+        phases = (flight_phase(flight, now)[0] for flight in flights)
+        demand = sum(86400 / self.intervals[phase] for phase in phases if phase is not None)
+        self._scale = demand / calls_per_day if calls_per_day and demand > calls_per_day else 1.0
+
+    def load(self, now: datetime, calls_per_day: Optional[float] = None) -> int:
+        """Rebuild the heap from the open flights in the database, fitted to `calls_per_day` if given"""
+        self._heap = []
+        flights = self._candidates(now)
+        self.fit(flights, now, calls_per_day)
+        for flight in flights:
+            due = self.due_at(flight, now)
+            if due is not None:
+                self._heap.append((due, flight.flight_id, flight))
+        heapq.heapify(self._heap)
+        # Refresh times only matter while a flight can still be due
+        self._refreshed = {k: v for k, v in self._refreshed.items() if v >= now - self.lookback}
+        return len(self._heap)
+
+    def next_due(self) -> Optional[datetime]:
+        return self._heap[0][0] if self._heap else None
+
+    def pop(self):
+        return heapq.heappop(self._heap)[2]
+
+    def refreshed(self, flight_id: int, now: datetime) -> None:
+        """Reschedule a flight after refreshing it, from its newly stored state"""
+        self._refreshed[flight_id] = now
+        for flight in self._candidates(now, flight_id):
+            due = self.due_at(flight, now)
+            if due is not None:
+                heapq.heappush(self._heap, (due, flight.flight_id, flight))
+
+    def phases(self, now: datetime) -> Dict[str, int]:
+        """Flights per phase in the heap"""
+        counts: Dict[str, int] = {}
+        for _, _, flight in self._heap:
+            phase, _ = flight_phase(flight, now)
+            counts[phase] = counts.get(phase, 0) + 1
+        return counts
+
+    @property
+    def scale(self) -> float:
+        """Factor the phase intervals are stretched by to fit the budget (1 when it covers every refresh)"""
+        return self._scale
+
+    def demand(self, now: datetime) -> float:
+        """Refresh calls per day the current flights would take at the unstretched phase intervals"""
+        phases = (flight_phase(flight, now)[0] for _, _, flight in self._heap)
+        return sum(86400 / self.intervals[phase] for phase in phases if phase is not None)
+
+    def __len__(self) -> int:
+        return len(self._heap)
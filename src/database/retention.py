@@ -0,0 +1,343 @@
+import csv
+import gzip
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, select
+
+from database.models import db, Flight, FlightStatusUpdate, FlightHistorySummary
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FORMATS = ('csv', 'parquet')
+
+
+def _pyarrow():
+    """(pyarrow, pyarrow.parquet), or None: imported on demand, it is heavy and only archives need it"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:  # CSV archives only
+        return None
+    return pyarrow, pyarrow.parquet
+
+
+def month_start(ts: datetime) -> datetime:
+    return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(ts: datetime) -> datetime:
+    return ts.replace(year=ts.year + ts.month // 12, month=ts.month % 12 + 1)
+
+
+def subtract_months(ts: datetime, months: int) -> datetime:
+    index = ts.year * 12 + ts.month - 1 - months
+    return ts.replace(year=index // 12, month=index % 12 + 1)
+
+
+# Monthly RANGE partition column of each partitioned table
+PARTITION_COLUMNS = {Flight.__tablename__: 'scheduled_departure',
+                     FlightStatusUpdate.__tablename__: 'status_update_time'}
+
+
+def partition_name(month: datetime) -> str:
+    """Monthly RANGE partition holding rows before the next month, as declared in schema.sql"""
+    return f"p{month:%Y%m}"
+
+
+def _summarize(summary: Dict, updates: Iterable) -> Dict:
+    """Fold status updates (in time order) into a per-flight summary dict"""
+    for u in updates:
+        if not summary['update_count']:
+            summary['first_status'] = u.status
+            summary['first_update_time'] = u.status_update_time
+        summary['update_count'] += 1
+        summary['last_status'] = u.status
+        summary['last_update_time'] = u.status_update_time
+        if u.delay_minutes is not None:
+            summary['max_delay'] = max(summary['max_delay'] or 0, u.delay_minutes)
+        for field in ('departure_gate', 'arrival_gate'):
+            value, last = getattr(u, field), summary[f"last_{field}"]
+            if value:
+                if last and value != last:
+                    summary['gate_changes'] += 1
+                summary[f"last_{field}"] = value
+    return summary
+
+
+def compact_status_history(before: datetime, batch_size: int = 1000, dry_run: bool = False) -> Dict:
+    """Collapse status updates older than `before` into one summary row per flight, then delete them"""
+    stats = {'flights': 0, 'updates_compacted': 0}
+    columns = [c.name for c in FlightHistorySummary.__table__.columns]
+    last_flight = 0
+    while True:
+        flight_ids = [f for f, in db.session.query(FlightStatusUpdate.flight_id)
+                      .filter(FlightStatusUpdate.status_update_time < before,
+                              FlightStatusUpdate.flight_id > last_flight)
+                      .distinct().order_by(FlightStatusUpdate.flight_id).limit(batch_size)]
+        if not flight_ids:
+            break
+        last_flight = flight_ids[-1]
+
+        updates = db.session.query(FlightStatusUpdate)\
+            .filter(FlightStatusUpdate.flight_id.in_(flight_ids), FlightStatusUpdate.status_update_time < before)\
+            .order_by(FlightStatusUpdate.flight_id, FlightStatusUpdate.status_update_time,
+                      FlightStatusUpdate.update_id).all()
+        existing = {s.flight_id: s for s in db.session.query(FlightHistorySummary)
+                    .filter(FlightHistorySummary.flight_id.in_(flight_ids))}
+        by_flight: Dict[int, List] = {}
+        for u in updates:
+            by_flight.setdefault(u.flight_id, []).append(u)
+
+        now = datetime.utcnow()
+        for flight_id, flight_updates in by_flight.items():
+            row = existing.get(flight_id)
+            summary = {c: getattr(row, c) for c in columns} if row else {
+                'flight_id': flight_id, 'update_count': 0, 'first_status': None, 'last_status': None,
+                'first_update_time': None, 'last_update_time': None, 'max_delay': None,
+                'gate_changes': 0, 'last_departure_gate': None, 'last_arrival_gate': None
+            }
+            summary = _summarize(summary, flight_updates)
+            summary['compacted_at'] = now
+            if row:
+                for column, value in summary.items():
+                    setattr(row, column, value)
+            else:
+                db.session.add(FlightHistorySummary(**summary))
+
+        stats['flights'] += len(by_flight)
+        stats['updates_compacted'] += len(updates)
+        if dry_run:
+            db.session.rollback()
+            continue
+        db.session.query(FlightStatusUpdate)\
+            .filter(FlightStatusUpdate.update_id.in_([u.update_id for u in updates]))\
+            .delete(synchronize_session=False)
+        db.session.commit()
+    return stats
+
+
+def _write_archive(path: str, columns: List[str], rows: List, fmt: str) -> None:
+    """Write rows to `path` atomically (gzip CSV or Parquet)"""
+    tmp = f"{path}.tmp"
+    if fmt == 'parquet':
+        pa, pq = _pyarrow()
+        table = pa.table({c: [getattr(r, c) for r in rows] for c in columns})
+        pq.write_table(table, tmp, compression='zstd')
+    else:
+        with gzip.open(tmp, 'wt', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for r in rows:
+                writer.writerow([v.isoformat() if isinstance(v, datetime) else v
+                                 for v in (getattr(r, c) for c in columns)])
+    os.replace(tmp, path)
+
+
+def mysql_partitions(table: str) -> List[str]:
+    """Partition names of a MySQL table (empty when unpartitioned or on another dialect)"""
+    if db.session.get_bind().dialect.name != 'mysql':
+        return []
+    return [name for name, in db.session.execute(db.text(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL"
+    ), {'table': table})]
+
+
+def partition_tables(months_ahead: int = 3, now: Optional[datetime] = None) -> List[str]:
+    """Migrate `flights` and `flight_status_updates` to the monthly RANGE partitions declared in schema.sql.
+
+    MySQL only and idempotent: tables that are already partitioned are skipped. MySQL allows no foreign
+    keys on or to partitioned tables, so those are dropped, and each primary key widens to include the
+    partition column. Partitions run from the oldest row's month to `months_ahead` months ahead, plus
+    `pmax`. Returns the tables converted.
+    """
+    if db.session.get_bind().dialect.name != 'mysql':
+        return []
+    models = [m for m in (Flight, FlightStatusUpdate) if not mysql_partitions(m.__tablename__)]
+    if not models:
+        return []
+    now = now or datetime.utcnow()
+    tables = [Flight.__tablename__, FlightStatusUpdate.__tablename__]
+    foreign_keys = db.session.execute(db.text(
+        "SELECT TABLE_NAME, CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS "
+        "WHERE CONSTRAINT_SCHEMA = DATABASE() AND (TABLE_NAME IN :tables OR REFERENCED_TABLE_NAME IN :tables)"
+    ).bindparams(bindparam('tables', expanding=True)), {'tables': tables}).all()
+    for table, name in foreign_keys:
+        db.session.execute(db.text(f"ALTER TABLE {table} DROP FOREIGN KEY {name}"))
+
+    for model in models:
+        column = PARTITION_COLUMNS[model.__tablename__]
+        modify = ''
+        if model is FlightStatusUpdate:
+            # The partition column must be NOT NULL; undated updates take their flight's departure
+            db.session.execute(db.text(
+                "UPDATE flight_status_updates u JOIN flights f ON f.flight_id = u.flight_id "
+                "SET u.status_update_time = f.scheduled_departure WHERE u.status_update_time IS NULL"))
+            modify = f"MODIFY {column} DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, "
+        oldest = db.session.execute(db.text(f"SELECT MIN({column}) FROM {model.__tablename__}")).scalar()
+        month, last = month_start(oldest or now), month_start(now)
+        for _ in range(months_ahead):
+            last = next_month(last)
+        partitions = []
+        while month <= last:
+            partitions.append(f"PARTITION {partition_name(month)} VALUES LESS THAN ('{next_month(month):%Y-%m-%d}')")
+            month = next_month(month)
+        partitions.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+        key = list(model.__table__.primary_key.columns)[0].name
+        db.session.execute(db.text(
+            f"ALTER TABLE {model.__tablename__} {modify}DROP PRIMARY KEY, ADD PRIMARY KEY ({key}, {column}) "
+            f"PARTITION BY RANGE COLUMNS ({column}) ({', '.join(partitions)})"))
+        logger.info("Partitioned %s into %d monthly partitions", model.__tablename__, len(partitions) - 1)
+    db.session.commit()
+    return [m.__tablename__ for m in models]
+
+
+def ensure_partitions(months_ahead: int = 3, now: Optional[datetime] = None) -> List[str]:
+    """Split upcoming months out of the catch-all `pmax` partition of each partitioned table"""
+    created = []
+    now = now or datetime.utcnow()
+    for table in (Flight.__tablename__, FlightStatusUpdate.__tablename__):
+        partitions = mysql_partitions(table)
+        if 'pmax' not in partitions:
+            continue
+        month = month_start(now)
+        for _ in range(months_ahead + 1):
+            name = partition_name(month)
+            if name not in partitions:
+                db.session.execute(db.text(
+                    f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ("
+                    f"PARTITION {name} VALUES LESS THAN ('{next_month(month):%Y-%m-%d}'), "
+                    f"PARTITION pmax VALUES LESS THAN (MAXVALUE))"))
+                created.append(f"{table}.{name}")
+            month = next_month(month)
+    return created
+
+
+# Unpartitioned twin of flight_status_updates: old partitions are exchanged into it before being dropped
+STAGING_TABLE = 'flight_status_updates_staging'
+
+
+def _ensure_staging_table() -> None:
+    updates = FlightStatusUpdate.__tablename__
+    db.session.execute(db.text(f"CREATE TABLE IF NOT EXISTS {STAGING_TABLE} LIKE {updates}"))
+    if mysql_partitions(STAGING_TABLE):
+        db.session.execute(db.text(f"ALTER TABLE {STAGING_TABLE} REMOVE PARTITIONING"))
+
+
+def restore_staged_updates() -> int:
+    """Move status updates of still stored flights from the staging table back into
+    flight_status_updates, and empty it. Also recovers the rows of an interrupted archive run."""
+    if db.session.get_bind().dialect.name != 'mysql':
+        return 0
+    exists = db.session.execute(db.text(
+        "SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table"
+    ), {'table': STAGING_TABLE}).scalar()
+    if not exists:
+        return 0
+    # One transaction: the rows are in one table or the other, never in neither
+    restored = db.session.execute(db.text(
+        f"INSERT IGNORE INTO {FlightStatusUpdate.__tablename__} SELECT s.* FROM {STAGING_TABLE} s "
+        f"JOIN {Flight.__tablename__} f ON f.flight_id = s.flight_id")).rowcount
+    db.session.execute(db.text(f"DELETE FROM {STAGING_TABLE}"))
+    db.session.commit()
+    return restored
+
+
+def _drop_update_partition(name: str) -> int:
+    """Drop a flight_status_updates partition, carrying the updates of still stored flights over to
+    the next partition. Returns how many were carried."""
+    restore_staged_updates()  # EXCHANGE needs an empty staging table
+    _ensure_staging_table()
+    updates = FlightStatusUpdate.__tablename__
+    # Each ALTER commits on its own; in between, the rows sit in the staging table, not in memory
+    db.session.execute(db.text(f"ALTER TABLE {updates} EXCHANGE PARTITION {name} WITH TABLE {STAGING_TABLE}"))
+    db.session.execute(db.text(f"ALTER TABLE {updates} DROP PARTITION {name}"))
+    return restore_staged_updates()
+
+
+def archive_flights(before: datetime, archive_dir: str, fmt: str = 'csv', dry_run: bool = False) -> List[Dict]:
+    """Export each whole month of flights scheduled before `before` (with their remaining status
+    updates and history summaries) to compressed files, then remove them from the database.
+
+    On partitioned MySQL tables the month's partitions are dropped instead of deleted row by row: the
+    `flights` partition of the month, and every `flight_status_updates` partition up to it. Status updates
+    in those that belong to later, still stored flights (posted before the month ended) are carried over:
+    each partition is exchanged into a staging table, dropped, and the staging rows of still stored flights
+    re-inserted into the next partition. A run interrupted in between leaves them in the staging table,
+    and the next run puts them back first.
+    """
+    if fmt not in ARCHIVE_FORMATS:
+        raise ValueError(f"Unknown archive format: {fmt}")
+    if fmt == 'parquet' and _pyarrow() is None:
+        raise RuntimeError("Parquet archives require pyarrow (pip install pyarrow)")
+    oldest = db.session.query(db.func.min(Flight.scheduled_departure)).scalar()
+    if oldest is None:
+        return []
+    partitions = mysql_partitions(Flight.__tablename__)
+    if not dry_run and restore_staged_updates():
+        logger.warning("Restored status updates left in %s by an interrupted archive run", STAGING_TABLE)
+    update_partitions = [p for p in mysql_partitions(FlightStatusUpdate.__tablename__) if p != 'pmax']
+    suffix = 'csv.gz' if fmt == 'csv' else 'parquet'
+    results = []
+    month = month_start(oldest)
+    cutoff = month_start(before)
+    while month < cutoff:
+        end = next_month(month)
+        flights = db.session.execute(select(Flight.__table__).where(
+            Flight.scheduled_departure >= month, Flight.scheduled_departure < end
+        ).order_by(Flight.flight_id)).all()
+        flight_ids = [f.flight_id for f in flights]
+        result = {'month': f"{month:%Y-%m}", 'flights': len(flights), 'status_updates': 0, 'files': []}
+        if flights:
+            related = {}
+            for model in (FlightStatusUpdate, FlightHistorySummary):
+                rows = []
+                for i in range(0, len(flight_ids), 1000):
+                    rows += db.session.execute(select(model.__table__).where(
+                        model.flight_id.in_(flight_ids[i:i + 1000]))).all()
+                related[model] = rows
+            result['status_updates'] = len(related[FlightStatusUpdate])
+
+            if not dry_run:
+                os.makedirs(archive_dir, exist_ok=True)
+                for model, rows in ((Flight, flights), *related.items()):
+                    if not rows:
+                        continue
+                    path = os.path.join(archive_dir, f"{model.__tablename__}-{month:%Y-%m}.{suffix}")
+                    _write_archive(path, [c.name for c in model.__table__.columns], rows, fmt)
+                    result['files'].append(path)
+
+                # Updates before `end` sit in these partitions and go with them
+                stale = [p for p in update_partitions if p <= partition_name(month)]
+
+                # Children first (foreign keys), then the month's flights
+                for i in range(0, len(flight_ids), 1000):
+                    chunk = flight_ids[i:i + 1000]
+                    query = db.session.query(FlightStatusUpdate).filter(FlightStatusUpdate.flight_id.in_(chunk))
+                    if stale:
+                        query = query.filter(FlightStatusUpdate.status_update_time >= end)
+                    query.delete(synchronize_session=False)
+                    db.session.query(FlightHistorySummary).filter(FlightHistorySummary.flight_id.in_(chunk))\
+                        .delete(synchronize_session=False)
+                if partition_name(month) in partitions:
+                    db.session.commit()
+                    db.session.execute(db.text(
+                        f"ALTER TABLE {Flight.__tablename__} DROP PARTITION {partition_name(month)}"))
+                else:
+                    for i in range(0, len(flight_ids), 1000):
+                        db.session.query(Flight).filter(Flight.flight_id.in_(flight_ids[i:i + 1000]))\
+                            .delete(synchronize_session=False)
+                db.session.commit()
+                for name in sorted(stale):
+                    carried = _drop_update_partition(name)
+                    update_partitions.remove(name)
+                    if carried:
+                        logger.info("Carried %s status updates of later flights over from %s", carried, name)
+                logger.info("Archived %s flights for %s", len(flights), result['month'])
+        results.append(result)
+        month = end
+    return results
+
@@ -0,0 +1,174 @@
+import math
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy.dialects import mysql, sqlite
+
+from database.models import db, Airline, Flight, DelayRollup
+
+KINDS = ('airline', 'route', 'airport')
+GRANULARITIES = ('hour', 'day')
+
+
+def bucket_start(ts: datetime, granularity: str) -> datetime:
+    """Truncate a timestamp to the start of its hour or day"""
+    if granularity == 'hour':
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def bucket_keys(airline_id, departure: Optional[str], arrival: Optional[str]) -> List:
+    """(kind, bucket_key) pairs a flight contributes to"""
+    return [
+        ('airline', str(airline_id)),
+        ('route', f"{departure}-{arrival}"),
+        ('airport', departure or '')
+    ]
+
+
+class RollupDelta:
+    """Per-bucket changes collected during one ingestion transaction"""
+
+    def __init__(self):
+        self.buckets: Dict = {}
+
+    def add(self, airline_id, departure, arrival, scheduled_departure,
+            old_delay: Optional[int], new_delay: int) -> None:
+        """Record a flight's delay change; old_delay None means the flight was not counted yet.
+
+        Counts, sums and squares take the old delay back out, but max_delay is the peak ever
+        observed in the bucket: a downward revision does not lower it until `rebuild_delay_rollups`.
+        """
+        if old_delay is not None and old_delay == new_delay:
+            return
+        count = 0 if old_delay is not None else 1
+        old = old_delay or 0
+        for granularity in GRANULARITIES:
+            start = bucket_start(scheduled_departure, granularity)
+            for kind, key in bucket_keys(airline_id, departure, arrival):
+                bucket = self.buckets.setdefault((kind, granularity, start, key), [0, 0, 0, 0])
+                bucket[0] += count
+                bucket[1] += new_delay - old
+                bucket[2] += new_delay * new_delay - old * old
+                bucket[3] = max(bucket[3], new_delay)
+
+    def apply(self) -> None:
+        """Upsert every touched bucket, adding to the stored totals"""
+        if not self.buckets:
+            return
+        table = DelayRollup.__table__
+        rows = [{
+            'kind': kind, 'granularity': granularity, 'bucket_start': start, 'bucket_key': key,
+            'flight_count': count, 'delay_sum': total, 'delay_sum_sq': total_sq, 'max_delay': peak
+        } for (kind, granularity, start, key), (count, total, total_sq, peak) in self.buckets.items()]
+
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'mysql':
+            stmt = mysql.insert(table)
+            stmt = stmt.on_duplicate_key_update(
+                flight_count=table.c.flight_count + stmt.inserted.flight_count,
+                delay_sum=table.c.delay_sum + stmt.inserted.delay_sum,
+                delay_sum_sq=table.c.delay_sum_sq + stmt.inserted.delay_sum_sq,
+                max_delay=db.func.greatest(table.c.max_delay, stmt.inserted.max_delay)
+            )
+            db.session.execute(stmt, rows)
+        elif dialect == 'sqlite':
+            stmt = sqlite.insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[c.name for c in table.primary_key.columns],
+                set_={
+                    'flight_count': table.c.flight_count + stmt.excluded.flight_count,
+                    'delay_sum': table.c.delay_sum + stmt.excluded.delay_sum,
+                    'delay_sum_sq': table.c.delay_sum_sq + stmt.excluded.delay_sum_sq,
+                    'max_delay': db.func.max(table.c.max_delay, stmt.excluded.max_delay)
+                }
+            )
+            db.session.execute(stmt, rows)
+        else:
+            for row in rows:
+                existing = db.session.get(DelayRollup, (row['kind'], row['granularity'],
+                                                        row['bucket_start'], row['bucket_key']))
+                if existing is None:
+                    db.session.add(DelayRollup(**row))
+                else:
+                    existing.flight_count += row['flight_count']
+                    existing.delay_sum += row['delay_sum']
+                    existing.delay_sum_sq += row['delay_sum_sq']
+                    existing.max_delay = max(existing.max_delay, row['max_delay'])
+        self.buckets = {}
+
+
+def mark_counted_flights() -> None:
+    """Store 0 for NULL delays: ingestion reads NULL as not counted yet and would count rebuilt flights again"""
+    db.session.query(Flight).filter(Flight.delay_minutes.is_(None))\
+        .update({Flight.delay_minutes: 0}, synchronize_session=False)
+
+
+def rebuild_delay_rollups(batch_size: int = 10000) -> int:
+    """Recompute all rollups from the flights table (initial backfill or repair, also resets max_delay)"""
+    db.session.query(DelayRollup).delete()
+    mark_counted_flights()
+    delta = RollupDelta()
+    count = 0
+    flights = db.session.query(
+        Flight.airline_id, Flight.departure_airport, Flight.arrival_airport,
+        Flight.scheduled_departure, Flight.delay_minutes
+    ).yield_per(batch_size)
+    for flight in flights:
+        delta.add(flight.airline_id, flight.departure_airport, flight.arrival_airport,
+                  flight.scheduled_departure, None, flight.delay_minutes)
+        count += 1
+    delta.apply()
+    db.session.commit()
+    return count
+
+
+def rollup_granularity(start: Optional[datetime], end: Optional[datetime]) -> str:
+    """Day buckets answer whole-day windows, anything finer needs hour buckets"""
+    for bound in (start, end):
+        if bound is not None and bound != bucket_start(bound, 'day'):
+            return 'hour'
+    return 'day'
+
+
+def query_delay_stats(kind: str, start: Optional[datetime] = None,
+                      end: Optional[datetime] = None) -> List[Dict]:
+    """Delay statistics per key for `kind`, merged from buckets inside [start, end)"""
+    granularity = rollup_granularity(start, end)
+    query = db.session.query(
+        DelayRollup.bucket_key,
+        db.func.sum(DelayRollup.flight_count).label('flight_count'),
+        db.func.sum(DelayRollup.delay_sum).label('delay_sum'),
+        db.func.sum(DelayRollup.delay_sum_sq).label('delay_sum_sq'),
+        db.func.max(DelayRollup.max_delay).label('max_delay')
+    ).filter(DelayRollup.kind == kind, DelayRollup.granularity == granularity)
+    if start is not None:
+        query = query.filter(DelayRollup.bucket_start >= start)
+    if end is not None:
+        query = query.filter(DelayRollup.bucket_start < end)
+    rows = query.group_by(DelayRollup.bucket_key).all()
+
+    results = []
+    for row in rows:
+        count = int(row.flight_count or 0)
+        if not count:
+            continue
+        avg = float(row.delay_sum) / count
+        variance = max(0.0, float(row.delay_sum_sq) / count - avg * avg)
+        results.append({
+            'key': row.bucket_key,
+            'total_flights': count,
+            'avg_delay': avg,
+            'stddev_delay': math.sqrt(variance),
+            'max_delay': int(row.max_delay or 0)
+        })
+    return results
+
+
+def airline_names(keys) -> Dict[str, str]:
+    """Map airline rollup keys (airline_id strings) to airline names"""
+    ids = [int(k) for k in keys if k.isdigit()]
+    if not ids:
+        return {}
+    return {str(i): name for i, name in db.session.query(Airline.airline_id, Airline.name)
+            .filter(Airline.airline_id.in_(ids)).all()}
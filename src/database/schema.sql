@@ -50,6 +50,12 @@ CREATE TABLE airlines (
 --     delay_minutes INT DEFAULT 0,
 --     aircraft_registration VARCHAR(20),
 --     aircraft_type VARCHAR(50),
+--     departure_gate VARCHAR(10),
+--     departure_terminal VARCHAR(10),
+--     arrival_gate VARCHAR(10),
+--     arrival_terminal VARCHAR(10),
+--     baggage_claim VARCHAR(20),
+--     status_updated_at DATETIME,
 --     FOREIGN KEY (airline_id) REFERENCES airlines(airline_id),
 --     FOREIGN KEY (departure_airport) REFERENCES airports(iata_code),
 --     FOREIGN KEY (arrival_airport) REFERENCES airports(iata_code),
@@ -98,4 +104,115 @@ CREATE TABLE flight_status_updates (
 CREATE INDEX idx_flight_number ON flights(flight_number);
 CREATE INDEX idx_departure_time ON flights(scheduled_departure);
 CREATE INDEX idx_status ON flights(status);
-CREATE INDEX idx_flight_updates ON flight_status_updates(flight_id, status_update_time); 
\ No newline at end of file
+CREATE INDEX idx_flight_updates ON flight_status_updates(flight_id, status_update_time);
+-- One row per scheduled departure so batch ingestion can upsert flights
+CREATE UNIQUE INDEX uq_flight_schedule ON flights(flight_number, scheduled_departure);
+-- Per-airport schedules: one range scan per side of the departure/arrival UNION
+CREATE INDEX idx_departure_airport_time ON flights(departure_airport, scheduled_departure);
+CREATE INDEX idx_arrival_airport_time ON flights(arrival_airport, scheduled_departure); 
+-- Status- and delay-filtered lists read the materialized current state on flights
+CREATE INDEX idx_status_time ON flights(status, scheduled_departure);
+CREATE INDEX idx_delay_minutes ON flights(delay_minutes);
+
+-- Pre-aggregated delay statistics, maintained incrementally by ingestion
+CREATE TABLE delay_rollups (
+    kind VARCHAR(10) NOT NULL,          -- airline / route / airport
+    granularity VARCHAR(4) NOT NULL,    -- hour / day
+    bucket_start DATETIME NOT NULL,
+    bucket_key VARCHAR(16) NOT NULL,    -- airline_id, 'DEP-ARR' or departure IATA
+    flight_count BIGINT NOT NULL DEFAULT 0,
+    delay_sum BIGINT NOT NULL DEFAULT 0,
+    delay_sum_sq BIGINT NOT NULL DEFAULT 0,
+    max_delay INT NOT NULL DEFAULT 0,   -- peak ever observed: not lowered by revisions until a rebuild
+    PRIMARY KEY (kind, granularity, bucket_start, bucket_key)
+);
+
+-- Delay quantile sketch and fixed histogram per rollup bucket (binary, merged at query time)
+CREATE TABLE delay_distributions (
+    kind VARCHAR(10) NOT NULL,
+    granularity VARCHAR(4) NOT NULL,
+    bucket_start DATETIME NOT NULL,
+    bucket_key VARCHAR(16) NOT NULL,
+    sketch BLOB NOT NULL,
+    PRIMARY KEY (kind, granularity, bucket_start, bucket_key)
+);
+
+-- Per-flight summary of status updates removed by the retention job's compaction step
+CREATE TABLE flight_history_summaries (
+    flight_id INT PRIMARY KEY,
+    update_count INT NOT NULL DEFAULT 0,
+    first_status VARCHAR(20),
+    last_status VARCHAR(20),
+    first_update_time DATETIME,
+    last_update_time DATETIME,
+    max_delay INT,
+    gate_changes INT NOT NULL DEFAULT 0,
+    last_departure_gate VARCHAR(10),
+    last_arrival_gate VARCHAR(10),
+    compacted_at DATETIME,
+    FOREIGN KEY (flight_id) REFERENCES flights(flight_id) ON DELETE CASCADE
+);
+
+-- Background poller state (`flask poll`): per-target schedule and paging cursor
+CREATE TABLE poll_cursors (
+    target VARCHAR(32) PRIMARY KEY,     -- 'airport:FRA', 'airline:LH' or 'active'
+    next_poll_at DATETIME NOT NULL,
+    last_polled_at DATETIME,
+    page_offset INT NOT NULL DEFAULT 0, -- where the next poll continues a result set larger than one poll
+    last_total INT,
+    failures INT NOT NULL DEFAULT 0
+);
+
+-- Aviation Stack calls made by the poller per day, for the monthly/daily quota
+CREATE TABLE api_usage (
+    day DATE PRIMARY KEY,
+    calls INT NOT NULL DEFAULT 0
+);
+
+-- Partitioned layout (MySQL): monthly RANGE partitions so the retention job
+-- (`flask retention`) can drop a cold month instead of deleting it row by row.
+-- MySQL requires the partitioning column in every unique key and does not allow
+-- foreign keys on or to partitioned tables, so the primary keys widen and the FKs go.
+-- Apply it with `flask partition-tables` (database/retention.py:partition_tables),
+-- which drops every such FK, backfills NULL status_update_time and starts the
+-- partitions at the oldest stored month; the statements below show the result.
+-- `flask retention` splits upcoming months out of pmax; name partitions pYYYYMM.
+-- ALTER TABLE flights DROP FOREIGN KEY flights_ibfk_1;  -- ... and the other flights FKs
+-- ALTER TABLE flight_status_updates DROP FOREIGN KEY flight_status_updates_ibfk_1;
+-- ALTER TABLE flight_status_updates DROP FOREIGN KEY flight_status_updates_ibfk_2;
+-- ALTER TABLE flight_history_summaries DROP FOREIGN KEY flight_history_summaries_ibfk_1;
+-- ALTER TABLE flights
+--     DROP PRIMARY KEY, ADD PRIMARY KEY (flight_id, scheduled_departure)
+--     PARTITION BY RANGE COLUMNS (scheduled_departure) (
+--         PARTITION p202401 VALUES LESS THAN ('2024-02-01'),
+--         PARTITION p202402 VALUES LESS THAN ('2024-03-01'),
+--         PARTITION pmax VALUES LESS THAN (MAXVALUE)
+--     );
+-- ALTER TABLE flight_status_updates
+--     MODIFY status_update_time DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+--     DROP PRIMARY KEY, ADD PRIMARY KEY (update_id, status_update_time)
+--     PARTITION BY RANGE COLUMNS (status_update_time) (
+--         PARTITION p202401 VALUES LESS THAN ('2024-02-01'),
+--         PARTITION p202402 VALUES LESS THAN ('2024-03-01'),
+--         PARTITION pmax VALUES LESS THAN (MAXVALUE)
+--     );
+
+-- Existing databases: add the materialized current-state columns to flights and backfill
+-- them from each flight's newest status update
+-- ALTER TABLE flights
+--     ADD COLUMN departure_gate VARCHAR(10),
+--     ADD COLUMN departure_terminal VARCHAR(10),
+--     ADD COLUMN arrival_gate VARCHAR(10),
+--     ADD COLUMN arrival_terminal VARCHAR(10),
+--     ADD COLUMN baggage_claim VARCHAR(20),
+--     ADD COLUMN status_updated_at DATETIME;
+-- UPDATE flights f
+-- JOIN flight_status_updates u ON u.update_id = (
+--     SELECT u2.update_id FROM flight_status_updates u2 WHERE u2.flight_id = f.flight_id
+--     ORDER BY u2.status_update_time DESC, u2.update_id DESC LIMIT 1)
+-- SET f.status = u.status, f.delay_minutes = COALESCE(u.delay_minutes, 0),
+--     f.actual_departure = u.actual_departure, f.estimated_departure = u.estimated_departure,
+--     f.departure_gate = u.departure_gate, f.departure_terminal = u.departure_terminal,
+--     f.arrival_gate = u.arrival_gate, f.arrival_terminal = u.arrival_terminal,
+--     f.baggage_claim = u.baggage_claim, f.status_updated_at = u.status_update_time;
+-- (then run `flask rebuild-rollups` so the delay rollups match the backfilled delays)
@@ -0,0 +1,239 @@
+import math
+import struct
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, tuple_
+from sqlalchemy.dialects import mysql, sqlite
+
+from database.models import db, DelayDistribution, Flight
+from database.rollups import GRANULARITIES, bucket_keys, bucket_start, mark_counted_flights, rollup_granularity
+
+# Upper bounds (minutes) of the fixed histogram buckets; the last bucket is open-ended
+HISTOGRAM_BOUNDS = (0, 15, 30, 60, 120, 180, 240, 360)
+
+
+class DelaySketch:
+    """DDSketch-style log-bucketed quantile sketch plus a fixed histogram.
+
+    Quantiles carry at most `alpha` relative error, sketches merge by adding
+    bin counts, and values can be removed again when a flight's delay changes.
+    """
+
+    alpha = 0.02
+    gamma = (1 + alpha) / (1 - alpha)
+    log_gamma = math.log(gamma)
+    max_bins = 512
+
+    def __init__(self):
+        self.zero = 0
+        self.bins: Dict[int, int] = {}
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+
+    @property
+    def count(self) -> int:
+        return self.zero + sum(self.bins.values())
+
+    @classmethod
+    def _index(cls, value: float) -> int:
+        return math.ceil(math.log(value) / cls.log_gamma)
+
+    @staticmethod
+    def _histogram_slot(value: float) -> int:
+        for i, bound in enumerate(HISTOGRAM_BOUNDS):
+            if value <= bound:
+                return i
+        return len(HISTOGRAM_BOUNDS)
+
+    def add(self, value: float, n: int = 1) -> None:
+        """Add (or with negative n, remove) a delay observation"""
+        value = max(0.0, float(value))
+        if value == 0:
+            self.zero += n
+        else:
+            index = self._index(value)
+            self.bins[index] = self.bins.get(index, 0) + n
+            if not self.bins[index]:
+                del self.bins[index]
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        self.histogram[self._histogram_slot(value)] += n
+
+    def _collapse(self) -> None:
+        # Fold the lowest bins together so memory stays bounded (only low quantiles lose accuracy)
+        indexes = sorted(self.bins)
+        keep = indexes[-(self.max_bins - 1):]
+        folded = sum(self.bins.pop(i) for i in indexes[:len(indexes) - len(keep)])
+        self.bins[keep[0]] += folded
+
+    def merge(self, other: 'DelaySketch') -> 'DelaySketch':
+        self.zero += other.zero
+        for index, n in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + n
+            if not self.bins[index]:
+                del self.bins[index]
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        total = self.count
+        if total <= 0:
+            return None
+        rank = q * (total - 1)
+        seen = self.zero
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def histogram_buckets(self) -> List[Dict]:
+        buckets = [{'le': bound, 'count': n} for bound, n in zip(HISTOGRAM_BOUNDS, self.histogram)]
+        buckets.append({'le': None, 'count': self.histogram[-1]})
+        return buckets
+
+    def to_bytes(self) -> bytes:
+        """Compact encoding: zero count, histogram, then (index, count) pairs"""
+        header = struct.pack(f'<iH{len(self.histogram)}i', self.zero, len(self.bins), *self.histogram)
+        pairs = b''.join(struct.pack('<hi', i, n) for i, n in sorted(self.bins.items()))
+        return header + pairs
+
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes]) -> 'DelaySketch':
+        sketch = cls()
+        if not data:
+            return sketch
+        slots = len(sketch.histogram)
+        header = struct.calcsize(f'<iH{slots}i')
+        values = struct.unpack(f'<iH{slots}i', data[:header])
+        sketch.zero, nbins, sketch.histogram = values[0], values[1], list(values[2:])
+        for offset in range(header, header + nbins * 6, 6):
+            index, n = struct.unpack('<hi', data[offset:offset + 6])
+            sketch.bins[index] = n
+        return sketch
+
+
+class SketchDelta:
+    """Sketch changes collected during one ingestion transaction"""
+
+    def __init__(self):
+        self.buckets: Dict = {}
+
+    def add(self, airline_id, departure, arrival, scheduled_departure,
+            old_delay: Optional[int], new_delay: int) -> None:
+        if old_delay is not None and old_delay == new_delay:
+            return
+        for granularity in GRANULARITIES:
+            start = bucket_start(scheduled_departure, granularity)
+            for kind, key in bucket_keys(airline_id, departure, arrival):
+                sketch = self.buckets.setdefault((kind, granularity, start, key), DelaySketch())
+                if old_delay is not None:
+                    sketch.add(old_delay, -1)
+                sketch.add(new_delay)
+
+    def apply(self) -> None:
+        """Merge every touched sketch row (rows locked so concurrent batches don't lose updates)"""
+        if not self.buckets:
+            return
+        table = DelayDistribution.__table__
+        empty = DelaySketch().to_bytes()
+        rows = [{'kind': k, 'granularity': g, 'bucket_start': s, 'bucket_key': key, 'sketch': empty}
+                for k, g, s, key in self.buckets]
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'mysql':
+            stmt = mysql.insert(table)
+            db.session.execute(stmt.on_duplicate_key_update(kind=stmt.inserted.kind), rows)
+        elif dialect == 'sqlite':
+            db.session.execute(sqlite.insert(table).on_conflict_do_nothing(), rows)
+        else:
+            for row in rows:
+                if db.session.get(DelayDistribution, (row['kind'], row['granularity'],
+                                                   row['bucket_start'], row['bucket_key'])) is None:
+                    db.session.add(DelayDistribution(**row))
+            db.session.flush()
+
+        # Lock exactly the touched rows, in primary-key order across chunks so batches can't deadlock
+        pk = (DelayDistribution.kind, DelayDistribution.granularity,
+              DelayDistribution.bucket_start, DelayDistribution.bucket_key)
+        touched = sorted(self.buckets)
+        stored = []
+        for i in range(0, len(touched), 500):
+            stored += db.session.query(*pk, DelayDistribution.sketch)\
+                .filter(tuple_(*pk).in_(touched[i:i + 500]))\
+                .order_by(*pk).with_for_update().all()
+        merged = []
+        for kind, granularity, start, key, data in stored:
+            delta = self.buckets.get((kind, granularity, start, key))
+            if delta is not None:
+                merged.append({'b_kind': kind, 'b_granularity': granularity, 'b_start': start, 'b_key': key,
+                               'b_sketch': DelaySketch.from_bytes(data).merge(delta).to_bytes()})
+        db.session.execute(
+            table.update()
+            .where(table.c.kind == bindparam('b_kind'), table.c.granularity == bindparam('b_granularity'),
+                   table.c.bucket_start == bindparam('b_start'), table.c.bucket_key == bindparam('b_key'))
+            .values(sketch=bindparam('b_sketch')),
+            merged
+        )
+        self.buckets = {}
+
+
+def rebuild_delay_sketches(batch_size: int = 10000) -> int:
+    """Recompute all sketches from the flights table (initial backfill or repair)"""
+    db.session.query(DelayDistribution).delete()
+    mark_counted_flights()
+    delta = SketchDelta()
+    count = 0
+    flights = db.session.query(
+        Flight.airline_id, Flight.departure_airport, Flight.arrival_airport,
+        Flight.scheduled_departure, Flight.delay_minutes
+    ).yield_per(batch_size)
+    for flight in flights:
+        delta.add(flight.airline_id, flight.departure_airport, flight.arrival_airport,
+                  flight.scheduled_departure, None, flight.delay_minutes)
+        count += 1
+    delta.apply()
+    db.session.commit()
+    return count
+
+
+def query_delay_sketches(kind: str, start: Optional[datetime] = None,
+                         end: Optional[datetime] = None) -> Dict[str, DelaySketch]:
+    """Merged sketch per key for `kind` over buckets inside [start, end)"""
+    query = db.session.query(DelayDistribution.bucket_key, DelayDistribution.sketch).filter(
+        DelayDistribution.kind == kind,
+        DelayDistribution.granularity == rollup_granularity(start, end)
+    )
+    if start is not None:
+        query = query.filter(DelayDistribution.bucket_start >= start)
+    if end is not None:
+        query = query.filter(DelayDistribution.bucket_start < end)
+    merged: Dict[str, DelaySketch] = {}
+    for key, data in query.all():
+        merged.setdefault(key, DelaySketch()).merge(DelaySketch.from_bytes(data))
+    return merged
+
+
+def parse_percentiles(value: Optional[str]) -> List[float]:
+    """Parse `percentiles=50,90,99` into [50.0, 90.0, 99.0]"""
+    if not value:
+        return []
+    percentiles = [float(p) for p in value.split(',') if p.strip()]
+    if any(p < 0 or p > 100 for p in percentiles):
+        raise ValueError("percentiles must be between 0 and 100")
+    return percentiles
+
+
+def describe(sketch: Optional[DelaySketch], percentiles: Iterable[float], histogram: bool) -> Dict:
+    """Percentile and histogram fields for one stats row"""
+    result = {}
+    if percentiles:
+        result['percentiles'] = {
+            f"p{p:g}": (sketch.quantile(p / 100) if sketch else None) for p in percentiles
+        }
+    if histogram:
+        result['histogram'] = sketch.histogram_buckets() if sketch else []
+    return result
@@ -0,0 +1,187 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DROP_POLICIES = ('block', 'drop_newest', 'drop_oldest')
+
+
+class WriteBehindQueue:
+    """Bounded in-process queue that persists flight records off the request path.
+
+    Records are drained in batches by a small worker pool, each worker running
+    inside its own app context (and therefore its own SQLAlchemy session).
+    """
+
+    def __init__(self, app, store_batch: Callable[[List[Dict]], object],
+                 workers: int = 2, maxsize: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 0.5, policy: str = 'block', put_timeout: float = 1.0):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {policy}")
+        self.app = app
+        self.store_batch = store_batch
+        self.workers = workers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads: List[threading.Thread] = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._stats = {
+            'enqueued': 0,
+            'dropped': 0,
+            'written': 0,
+            'failed': 0,
+            'batches': 0,
+            'last_lag_seconds': 0.0,
+            'max_lag_seconds': 0.0
+        }
+        atexit.register(self.shutdown)
+
+    @classmethod
+    def from_env(cls, app, store_batch):
+        """Build a queue from WRITE_BEHIND_* environment variables (None, i.e. inline, unless workers are set)"""
+        # Opt-in: serverless instances (Vercel) freeze between requests and would strand queued records
+        workers = int(os.getenv('WRITE_BEHIND_WORKERS', '0'))
+        if workers <= 0:
+            return None
+        return cls(
+            app, store_batch,
+            workers=workers,
+            maxsize=int(os.getenv('WRITE_BEHIND_MAXSIZE', '10000')),
+            batch_size=int(os.getenv('WRITE_BEHIND_BATCH_SIZE', '500')),
+            flush_interval=float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL', '0.5')),
+            policy=os.getenv('WRITE_BEHIND_POLICY', 'block')
+        )
+
+    def _ensure_started(self):
+        # Threads do not survive a fork, so (re)start lazily in each gunicorn worker
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stopping.clear()
+            self._threads = [
+                threading.Thread(target=self._run, name=f"write-behind-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def put_many(self, records: Iterable[Dict]) -> int:
+        """Enqueue records for persistence, returns how many were accepted"""
+        self._ensure_started()
+        accepted = 0
+        # 'block' waits at most put_timeout for the whole call, not per record
+        deadline = time.monotonic() + self.put_timeout
+        for record in records:
+            item = (time.monotonic(), record)
+            try:
+                remaining = deadline - time.monotonic()
+                if self.policy == 'block' and remaining > 0:
+                    self._queue.put(item, timeout=remaining)
+                else:
+                    self._queue.put_nowait(item)
+            except queue.Full:
+                if self.policy == 'drop_oldest':
+                    try:
+                        self._queue.get_nowait()
+                        self._queue.task_done()
+                        self._count('dropped')
+                        self._queue.put_nowait(item)
+                    except (queue.Empty, queue.Full):
+                        self._count('dropped')
+                        continue
+                else:
+                    self._count('dropped')
+                    continue
+            accepted += 1
+        self._count('enqueued', accepted)
+        return accepted
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def _next_batch(self) -> List:
+        """Block for the first item, then gather more until batch_size or flush_interval"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=max(remaining, 0)) if remaining > 0
+                             else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                if self._stopping.is_set():
+                    return
+                continue
+            try:
+                with self.app.app_context():
+                    self.store_batch([record for _, record in batch])
+                lag = time.monotonic() - min(enqueued_at for enqueued_at, _ in batch)
+                with self._lock:
+                    self._stats['written'] += len(batch)
+                    self._stats['batches'] += 1
+                    self._stats['last_lag_seconds'] = lag
+                    self._stats['max_lag_seconds'] = max(self._stats['max_lag_seconds'], lag)
+            except Exception:
+                logger.exception("Write-behind batch of %d records failed", len(batch))
+                self._count('failed', len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued record has been written (or failed)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def shutdown(self, timeout: float = 10.0):
+        """Drain the queue and stop the workers"""
+        if self._pid != os.getpid():
+            return
+        self.flush(timeout)
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout=self.flush_interval * 2)
+        self._pid = None
+
+    def metrics(self) -> Dict:
+        """Queue depth, lag and throughput counters"""
+        with self._queue.mutex:
+            oldest = self._queue.queue[0][0] if self._queue.queue else None
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            'depth': self._queue.qsize(),
+            'capacity': self._queue.maxsize,
+            'oldest_age_seconds': time.monotonic() - oldest if oldest is not None else 0.0,
+            'workers': len(self._threads) if self._pid == os.getpid() else 0,
+            'policy': self.policy
+        })
+        return stats
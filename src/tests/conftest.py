@@ -0,0 +1,18 @@
+import os
+import sys
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC)
+sys.path.insert(0, os.path.join(SRC, 'benchmarks'))
+
+import pytest
+from fake_aviationstack import FakeAviationStack
+
+
+@pytest.fixture
+def upstream():
+    """Fake Aviation Stack on a free local port"""
+    server = FakeAviationStack(total=250).start(poll_interval=0.01)
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,239 @@
+"""Retry, timeout and circuit breaker behaviour of AviationService against the fake upstream"""
+import socket
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import api.aviation_service
+import api.http_client
+from api.aviation_service import AviationService
+from api.http_client import UpstreamUnavailable
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Backoff sleeps of the service, recorded instead of slept; full jitter pinned to its cap"""
+    recorded = []
+    # Only the service's clock: the fake upstream's latency must keep sleeping
+    monkeypatch.setattr(api.aviation_service, 'time', SimpleNamespace(**{**vars(time), 'sleep': recorded.append}))
+    monkeypatch.setattr(api.http_client.random, 'uniform', lambda low, high: high)
+    return recorded
+
+
+@pytest.fixture
+def service(upstream, monkeypatch):
+    monkeypatch.setenv('AVIATION_API_KEY', 'test')
+    monkeypatch.setenv('AVIATION_BASE_URL', upstream.base_url)
+    monkeypatch.setenv('AVIATION_MAX_RETRIES', '3')
+    monkeypatch.setenv('AVIATION_BACKOFF_BASE', '0.5')
+    monkeypatch.setenv('AVIATION_BACKOFF_MAX', '30')
+    monkeypatch.setenv('AVIATION_BREAKER_THRESHOLD', '5')
+    monkeypatch.setenv('AVIATION_BREAKER_RESET', '0.2')
+    return AviationService(cache=None)
+
+
+@pytest.mark.parametrize('status', [429, 500, 502, 503, 504])
+def test_retries_retryable_statuses(service, upstream, sleeps, status):
+    upstream.script.extend([status, status])
+    page = service._make_request('flights', {'limit': 10})
+    assert len(page['data']) == 10
+    assert upstream.requests == 3
+    assert sleeps == [0.5, 1.0]
+
+
+def test_client_errors_are_not_retried(service, upstream, sleeps):
+    upstream.script.append(404)
+    with pytest.raises(ValueError):
+        service._make_request('flights')
+    assert upstream.requests == 1
+    assert sleeps == []
+
+
+def test_gives_up_after_max_retries(service, upstream, sleeps):
+    upstream.script.extend([503] * 4)
+    with pytest.raises(ValueError, match='503'):
+        service._make_request('flights')
+    assert upstream.requests == 4
+    assert sleeps == [0.5, 1.0, 2.0]
+
+
+def test_backoff_is_capped(service, upstream, sleeps):
+    service.backoff_max = 0.75
+    upstream.script.extend([503] * 3)
+    service._make_request('flights')
+    assert sleeps == [0.5, 0.75, 0.75]
+
+
+def test_retry_after_is_honoured(service, upstream, sleeps):
+    upstream.retry_after = 7
+    upstream.script.append(429)
+    service._make_request('flights')
+    assert upstream.requests == 2
+    assert sleeps == [7.0]
+
+
+def test_retry_after_beyond_backoff_max_is_not_waited_for(service, upstream, sleeps):
+    upstream.retry_after = 120
+    upstream.script.append(429)
+    with pytest.raises(ValueError, match='rate limit'):
+        service._make_request('flights')
+    assert upstream.requests == 1
+    assert sleeps == []
+
+
+def test_rate_limiting_does_not_trip_the_breaker(service, upstream, sleeps):
+    upstream.retry_after = 0
+    upstream.script.extend([429] * 3)
+    service._make_request('flights')
+    assert service.breaker.state == 'closed'
+    assert service.breaker.failures == 0
+
+
+def test_timeouts_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv('AVIATION_CONNECT_TIMEOUT', '1.5')
+    monkeypatch.setenv('AVIATION_READ_TIMEOUT', '4')
+    assert AviationService(cache=None).timeout == (1.5, 4.0)
+
+
+def test_read_timeout(service, upstream, sleeps):
+    upstream.latency = 1.0
+    service.timeout = (1.0, 0.1)
+    service.max_retries = 1
+    start = time.perf_counter()
+    with pytest.raises(ValueError, match='Read timed out'):
+        service._make_request('flights')
+    assert time.perf_counter() - start < 0.9
+    assert upstream.requests == 2
+    assert len(sleeps) == 1
+
+
+def test_connect_timeout(service, sleeps):
+    # A listener whose accept backlog is full: further connection attempts hang in the handshake
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(0)
+    port = listener.getsockname()[1]
+    backlog = []
+    for _ in range(3):
+        client = socket.socket()
+        client.setblocking(False)
+        client.connect_ex(('127.0.0.1', port))
+        backlog.append(client)
+    service.base_url = f"http://127.0.0.1:{port}/v1"
+    service.timeout = (0.1, 5.0)
+    service.max_retries = 1
+    start = time.perf_counter()
+    try:
+        with pytest.raises(ValueError, match='timed out'):
+            service._make_request('flights')
+    finally:
+        for client in backlog:
+            client.close()
+        listener.close()
+    assert time.perf_counter() - start < 2.0
+    assert len(sleeps) == 1
+
+
+def open_breaker(service, upstream):
+    service.max_retries = 0
+    upstream.down = True
+    for _ in range(service.breaker.failure_threshold):
+        with pytest.raises(ValueError):
+            service._make_request('flights')
+    assert service.breaker.state == 'open'
+
+
+def test_breaker_opens_and_fails_fast(service, upstream):
+    open_breaker(service, upstream)
+    calls = upstream.requests
+    with pytest.raises(UpstreamUnavailable):
+        service._make_request('flights')
+    assert upstream.requests == calls
+
+
+def test_breaker_closes_after_a_successful_probe(service, upstream):
+    open_breaker(service, upstream)
+    time.sleep(service.breaker.reset_timeout)
+    assert service.breaker.state == 'half-open'
+    upstream.down = False
+    service._make_request('flights')
+    assert service.breaker.state == 'closed'
+    assert service.breaker.failures == 0
+
+
+def test_breaker_reopens_after_a_failed_probe(service, upstream):
+    open_breaker(service, upstream)
+    time.sleep(service.breaker.reset_timeout)
+    calls = upstream.requests
+    with pytest.raises(ValueError):
+        service._make_request('flights')
+    assert upstream.requests == calls + 1
+    assert service.breaker.state == 'open'
+
+
+def test_breaker_lets_one_probe_through(service, upstream):
+    open_breaker(service, upstream)
+    time.sleep(service.breaker.reset_timeout)
+    service.breaker.before_call()  # a probe in flight elsewhere
+    with pytest.raises(UpstreamUnavailable):
+        service._make_request('flights')
+
+
+@pytest.mark.parametrize('error', [requests.exceptions.InvalidURL('bad url'), KeyboardInterrupt()])
+def test_probe_failing_with_other_errors_is_settled(service, upstream, monkeypatch, error):
+    open_breaker(service, upstream)
+    time.sleep(service.breaker.reset_timeout)
+
+    def fail(*args, **kwargs):
+        raise error
+    monkeypatch.setattr(service.session, 'get', fail)
+    with pytest.raises(type(error) if isinstance(error, KeyboardInterrupt) else ValueError):
+        service._make_request('flights')
+    monkeypatch.undo()
+
+    # The probe was released: once the reset timeout passes again, the next probe goes through
+    assert service.breaker.state == 'open'
+    time.sleep(service.breaker.reset_timeout)
+    upstream.down = False
+    service._make_request('flights')
+    assert service.breaker.state == 'closed'
+
+
+def test_probe_settled_before_a_failing_on_call_hook(service, upstream):
+    open_breaker(service, upstream)
+    time.sleep(service.breaker.reset_timeout)
+    upstream.down = False
+
+    def hook():
+        raise RuntimeError('quota store down')
+    service.on_call = hook
+    with pytest.raises(ValueError):
+        service._make_request('flights')
+    assert service.breaker.state == 'closed'
+
+
+@pytest.mark.parametrize('prefetch', [False, True])
+def test_iter_pages_walks_to_the_end(service, upstream, prefetch):
+    pages = list(service.iter_pages('flights', prefetch=prefetch))
+    assert [len(p['data']) for p in pages] == [100, 100, 50]
+    assert upstream.requests == 3
+
+
+@pytest.mark.parametrize('prefetch', [False, True])
+def test_iter_pages_fetches_no_page_past_max_pages(service, upstream, prefetch):
+    assert len(list(service.iter_pages('flights', max_pages=2, prefetch=prefetch))) == 2
+    assert upstream.requests == 2
+
+
+@pytest.mark.parametrize('prefetch', [False, True])
+def test_iter_pages_stops_when_the_caller_wants_no_more(service, upstream, prefetch):
+    seen = []
+
+    def wants_more(page):
+        seen.append(page['pagination']['offset'])
+        return False
+    assert len(list(service.iter_pages('flights', prefetch=prefetch, wants_more=wants_more))) == 1
+    assert seen == [0]
+    assert upstream.requests == 1
@@ -0,0 +1,39 @@
+"""Columnar analytics snapshot (needs numpy)"""
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from database.columnar import FLIGHT_COLUMNS, UPDATE_COLUMNS, ColumnarSnapshot
+
+
+@pytest.fixture
+def snapshot(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite://')
+    monkeypatch.setenv('WRITE_BEHIND_WORKERS', '0')
+    from app import create_app
+    app = create_app(bootstrap=True)
+    with app.app_context():
+        yield ColumnarSnapshot()
+
+
+def columns(names, **values):
+    return {name: np.array(values.get(name, [0] * len(next(iter(values.values())))),
+                           dtype=bool if name == 'has_delay' else np.int64) for name in names}
+
+
+def test_multi_status_flights_missing_from_snapshot(snapshot):
+    # Flights 3 (between held ids) and 9 (past the last one) have updates but no flight row
+    snapshot.flights = columns(FLIGHT_COLUMNS, flight_id=[1, 2, 4], airline_id=[10, 20, 40])
+    snapshot.updates = columns(UPDATE_COLUMNS, update_id=list(range(1, 7)),
+                               flight_id=[3, 3, 4, 4, 9, 9], status=[0, 1, 0, 1, 0, 1])
+    snapshot.statuses.encode('SCHEDULED')
+    snapshot.statuses.encode('ACTIVE')
+    snapshot.airline_names = {10: 'One', 20: 'Two', 40: 'Four'}
+    airlines = {r['flight_id']: r['airline'] for r in snapshot.multi_status_flights()}
+    assert airlines == {3: None, 4: 'Four', 9: None}
+
+
+def test_multi_status_flights_empty_snapshot(snapshot):
+    snapshot.updates = columns(UPDATE_COLUMNS, update_id=[1, 2], flight_id=[5, 5], status=[0, 0])
+    snapshot.statuses.encode('SCHEDULED')
+    assert [r['airline'] for r in snapshot.multi_status_flights()] == [None]
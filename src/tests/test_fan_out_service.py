@@ -0,0 +1,40 @@
+"""Batch lookups fanned out over the thread pool"""
+import time
+
+import pytest
+
+from api.aviation_service import AviationService
+from api.fan_out_service import FanOutAviationService, RateLimiter
+
+
+@pytest.fixture
+def fan_out(upstream, monkeypatch):
+    monkeypatch.setenv('AVIATION_API_KEY', 'test')
+    monkeypatch.setenv('AVIATION_BASE_URL', upstream.base_url)
+    monkeypatch.setenv('AVIATION_MAX_RETRIES', '0')
+    return FanOutAviationService(AviationService(cache=None), concurrency=4, rate=100)
+
+
+def test_calls_run_in_parallel(fan_out, upstream):
+    upstream.latency = 0.2
+    start = time.perf_counter()
+    result = fan_out.get_airport_schedules_many(['FRA', 'MUC', 'BER', 'HAM'])
+    assert time.perf_counter() - start < 0.6
+    assert list(result) == ['FRA', 'MUC', 'BER', 'HAM']
+    assert upstream.requests == 4
+
+
+def test_duplicate_keys_are_fetched_once(fan_out, upstream):
+    assert list(fan_out.get_airline_routes_many(['LH', 'AF', 'LH'])) == ['LH', 'AF']
+    assert upstream.requests == 2
+
+
+def test_errors_are_reported_per_key(fan_out, upstream):
+    upstream.script.append(503)
+    result = fan_out.get_airport_schedules_many(['FRA'])
+    assert 'error' in result['FRA']
+
+
+def test_rate_limiter_spaces_calls_past_the_burst():
+    limiter = RateLimiter(rate=10, burst=2)
+    assert [round(limiter.reserve(), 2) for _ in range(4)] == [0.0, 0.0, 0.1, 0.2]
@@ -0,0 +1,95 @@
+"""Statement budgets of the read endpoints, to catch N+1 regressions"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+from bench_ingest import make_page
+
+# Statements each request may issue
+BUDGETS = {
+    '/airports': 1,
+    '/flights/delayed': 2,  # data-version ETag + the page
+    '/flights/active': 2,
+    '/flights/1': 1,
+    '/flights/search/{flight_number}': 1,
+    '/airports/FRA/flights?date=2024-01-02': 1,
+    '/api/flights/1/history': 1,
+    '/api/stats/delays': 2,
+    '/api/stats/routes': 1,
+    '/api/stats/routes?percentiles=50,90,99&histogram=1': 2,
+    '/api/stats/airports': 1,
+    '/api/airports/european': 1,
+}
+
+# Statements for a repeat request carrying the ETag of the first (answered 304)
+REVALIDATION_BUDGETS = {
+    '/airports': 0,
+    '/flights/delayed': 1,
+    '/flights/active': 1,
+    '/api/airports/european': 0,
+}
+
+
+@pytest.fixture(scope='module')
+def app():
+    """App on a throwaway SQLite database seeded with synthetic flights"""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv('DATABASE_URL', 'sqlite://')
+        monkeypatch.setenv('WRITE_BEHIND_WORKERS', '0')
+        from app import create_app
+        from database.airline_registry import airline_registry
+        from database.airport_registry import airport_registry
+        from database.ingest import fingerprint_cache, store_flight_batch
+        from database.models import db
+
+        app = create_app(bootstrap=True)
+        with app.app_context():
+            # Process-wide caches must not carry ids over from another test's database
+            airline_registry.invalidate()
+            airport_registry.invalidate()
+            fingerprint_cache.clear()
+            for page in range(5):
+                store_flight_batch(make_page(page, 100, datetime(2024, 1, 1)), {})
+            db.session.execute(db.text(
+                "UPDATE flights SET delay_minutes = 150, status = 'ACTIVE' WHERE flight_id % 4 = 0"))
+            db.session.commit()
+            app.config['TEST_FLIGHT_NUMBER'] = db.session.execute(
+                db.text('SELECT flight_number FROM flights WHERE flight_id = 1')).scalar()
+            app.config['TEST_ENGINE'] = db.engine
+        yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def statements(app):
+    """SQL statements sent to the database while the test runs"""
+    engine = app.config['TEST_ENGINE']
+    recorded = []
+
+    def record(conn, cursor, statement, *args):
+        recorded.append(' '.join(statement.split()))
+
+    event.listen(engine, 'before_cursor_execute', record)
+    yield recorded
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+@pytest.mark.parametrize('url, budget', BUDGETS.items())
+def test_statement_budget(app, client, statements, url, budget):
+    response = client.get(url.format(flight_number=app.config['TEST_FLIGHT_NUMBER']))
+    assert response.status_code < 400
+    assert len(statements) <= budget, '\n'.join(statements)
+
+
+@pytest.mark.parametrize('url, budget', REVALIDATION_BUDGETS.items())
+def test_revalidation_budget(client, statements, url, budget):
+    etag = client.get(url).headers['ETag']
+    statements.clear()
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert len(statements) <= budget, '\n'.join(statements)
@@ -0,0 +1,33 @@
+"""Server-Sent Events stream: per-process subscriber cap"""
+import pytest
+
+from database.change_feed import change_feed
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite://')
+    monkeypatch.setenv('WRITE_BEHIND_WORKERS', '0')
+    monkeypatch.setenv('STREAM_MAX_SECONDS', '0.1')
+    monkeypatch.setattr(change_feed, 'max_subscribers', 1)
+    from app import create_app
+    return create_app(bootstrap=True).test_client()
+
+
+def test_subscribers_beyond_the_cap_get_503(client):
+    stream = client.get('/api/stream')
+    assert stream.status_code == 200
+    assert change_feed.metrics()['subscribers'] == 1
+
+    rejected = client.get('/api/stream')
+    assert rejected.status_code == 503
+    assert rejected.headers['Retry-After'] == '1'
+    assert change_feed.metrics()['rejected_subscribers'] == 1
+
+    # Closing the stream frees its slot, even when its body was never read
+    stream.close()
+    assert change_feed.metrics()['subscribers'] == 0
+    stream = client.get('/api/stream')
+    assert stream.status_code == 200
+    assert b'retry: 3000' in stream.get_data()
+    assert change_feed.metrics()['subscribers'] == 0